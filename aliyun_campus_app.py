@@ -1,9 +1,14 @@
 # aliyun_campus_app.py - 使用阿里云模型的校园引导智能体
 import streamlit as st
 import os
-import dashscope
 from dotenv import load_dotenv
 import json
+import time
+
+from dashscope_client import DashScopeClient
+from keyword_engine import load_keyword_engine
+from model_tier import TIERS, TierStats, choose_tier, estimate_cost, stream_with_fallback, tier_providers
+from token_utils import estimate_tokens
 
 # 加载环境变量
 load_dotenv()
@@ -35,71 +40,115 @@ st.sidebar.header("系统状态")
 aliyun_api_key = os.getenv("ALIYUN_API_KEY")
 if aliyun_api_key and aliyun_api_key != "your_aliyun_api_key_here":
     st.sidebar.success("✅ 阿里云API密钥已设置")
-    dashscope.api_key = aliyun_api_key
 else:
     st.sidebar.error("❌ 请设置阿里云API密钥")
+    aliyun_api_key = None
 
-# 校园知识库
-CAMPUS_KNOWLEDGE = {
-    "library": {
-        "keywords": ["图书馆", "借书", "还书", "阅览室", "自习"],
-        "answer": "图书馆开放时间：周一至周日 8:00-22:00\n位置：校园东区主楼\n服务：借书、还书、电子资源、自习室"
-    },
-    "scholarship": {
-        "keywords": ["奖学金", "助学金", "资助", "学费", "奖金"],
-        "answer": "奖学金申请条件：\n- 成绩平均分85分以上\n- 无违纪记录\n- 每学期初申请\n申请地点：学生事务处"
-    },
-    "dormitory": {
-        "keywords": ["宿舍", "寝室", "住宿", "宿管", "宿舍楼"],
-        "answer": "宿舍信息：\n- 关门时间：23:00（周末24:00）\n- 报修：联系宿管阿姨\n- 水电费：每月初缴纳"
-    },
-    "canteen": {
-        "keywords": ["食堂", "餐厅", "吃饭", "餐饮", "饭菜"],
-        "answer": "食堂信息：\n- 开放时间：6:30-20:00\n- 位置：第一食堂（东区）、第二食堂（西区）\n- 支付方式：校园卡、微信、支付宝"
-    },
-    "course": {
-        "keywords": ["课程", "选课", "上课", "教务", "专业课"],
-        "answer": "课程相关：\n- 选课时间：学期开始前两周\n- 查询系统：教务在线\n- 联系方式：各学院教务办公室"
-    }
-}
-
-def get_aliyun_answer(question):
-    """使用阿里云通义千问模型获取答案"""
-    try:
-        from dashscope import Generation
-        
-        # 构建系统提示词
-        system_prompt = """你是一个专业的校园信息助手。请根据用户的提问提供准确、有用的校园信息。
-        如果问题涉及具体校园设施、政策或服务，请给出详细说明。"""
-        
-        # 调用阿里云模型
-        response = Generation.call(
-            model='qwen-turbo',  # 可以使用 qwen-plus 或 qwen-max 获得更好效果
-            system=system_prompt,
-            prompt=question,
-            top_p=0.8,
-            result_format='message'
+# 设置了 OpenAI 密钥时作为备用提供方：通义千问出错时才使用（手动指定模型时不使用）
+openai_api_key = os.getenv("OPENAI_API_KEY")
+if openai_api_key == "your_openai_api_key_here":
+    openai_api_key = None
+
+LLM_PROVIDERS = tuple(
+    name for name, key in (("dashscope/qwen-turbo", aliyun_api_key), ("openai/gpt-3.5-turbo", openai_api_key)) if key
+)
+
+# 模型选择：默认按问题自动选择档位，也可以手动固定某个模型
+AUTO_TIER = "自动选择"
+st.sidebar.markdown("### 模型设置")
+model_option = st.sidebar.selectbox(
+    "选择模型",
+    [AUTO_TIER, *TIERS],
+    index=0,
+    help="自动选择: 简短且规则命中的问题用 qwen-turbo，较长、多个子问题或没有把握的问题用 qwen-plus / qwen-max\n"
+         "qwen-turbo: 快速响应\nqwen-plus: 平衡性能\nqwen-max: 最佳效果"
+)
+
+# 校园知识库：关键词与答案由 knowledge_source 生成（intents.json 与各文档的段落标题），
+# 构建知识库时编译为关键词自动机（keyword_engine.py）
+@st.cache_resource
+def keyword_engine():
+    return load_keyword_engine()
+
+@st.cache_resource
+def dashscope_client(api_key):
+    """整个进程共用一个客户端（连接池复用连接，带超时与重试）"""
+    return DashScopeClient(api_key)
+
+@st.cache_resource
+def openai_client():
+    """接口地址与 RAGChain 一致读取 OPENAI_API_BASE（可指向 mock_llm_server.py），未设置时使用官方地址"""
+    from openai import OpenAI
+    return OpenAI(base_url=os.getenv("OPENAI_API_BASE") or None, timeout=30, max_retries=2)
+
+@st.cache_resource
+def tier_stats():
+    """各档位的耗时、token 数与费用在整个进程内共享"""
+    return TierStats()
+
+def open_stream(name, messages, info):
+    """按提供方名称（提供方/模型）打开流式输出；产出文本的提供方记入 info["provider"]，token 用量记入 info["usage"][name]"""
+    provider, model = name.split("/", 1)
+    if provider == "dashscope":
+        chunks = dashscope_client(aliyun_api_key).stream(model, messages, usage=info["usage"].setdefault(name, {}), top_p=0.8)
+    else:
+        chunks = (
+            chunk.choices[0].delta.content
+            for chunk in openai_client().chat.completions.create(model=model, messages=messages, stream=True)
+            if chunk.choices and chunk.choices[0].delta.content
         )
-        
-        if response.status_code == 200:
-            return response.output.choices[0].message.content
-        else:
-            return f"模型调用失败: {response.message}"
-            
+    for text in chunks:
+        info["provider"] = name
+        yield text
+
+def report_fallback(name, error):
+    print(f"{name} 调用失败，改用备用提供方：{error}")
+
+def get_aliyun_answer(question, tier, pinned=False, references=(), info=None):
+    """流式获取答案，逐段产出文本（供 st.write_stream 渲染）；先调用该档位的通义千问模型，出错时才换 OpenAI
+    （手动指定模型时不换）。
+
+    结束后按实际回答的模型记录首字/总耗时、token 数与估算费用（写入 info 与 tier_stats）。
+    """
+    # 构建系统提示词
+    system_prompt = """你是一个专业的校园信息助手。请根据用户的提问提供准确、有用的校园信息。
+    如果问题涉及具体校园设施、政策或服务，请给出详细说明。"""
+    if references:
+        system_prompt += "\n\n可参考以下校园资料：\n" + "\n\n".join(references)
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": question},
+    ]
+    info = {} if info is None else info
+    info["usage"] = {}
+    parts = []
+    first_token = None
+    start = time.perf_counter()
+    try:
+        providers = tier_providers(tier, pinned, dashscope=bool(aliyun_api_key), fallback=bool(openai_api_key))
+        for text in stream_with_fallback(providers, lambda name: open_stream(name, messages, info), report_fallback):
+            if first_token is None:
+                first_token = time.perf_counter() - start
+            parts.append(text)
+            yield text
     except Exception as e:
-        return f"阿里云服务异常: {str(e)}"
-
-def rule_based_answer(question):
-    """基于规则的备用回答系统"""
-    question_lower = question.lower()
-    
-    # 匹配关键词
-    for category, info in CAMPUS_KNOWLEDGE.items():
-        for keyword in info["keywords"]:
-            if keyword in question_lower:
-                return info["answer"]
-    
-    return None
+        yield f"\n\n阿里云服务异常: {str(e)}"
+        return
+    total = time.perf_counter() - start
+
+    # DashScope 返回实际 token 用量，OpenAI 流式输出不带用量时按文本估算
+    name = info.get("provider", f"dashscope/{tier}")
+    model = name.split("/", 1)[1]
+    usage = info["usage"].get(name) or {}
+    input_tokens = usage.get("input_tokens") or estimate_tokens(system_prompt + question)
+    output_tokens = usage.get("output_tokens") or estimate_tokens("".join(parts))
+    cost = estimate_cost(model, input_tokens, output_tokens)
+    tier_stats().record(model, first_token, total, input_tokens, output_tokens, cost)
+    info.update(model=model, first_token=first_token, total=total, cost=cost)
+
+def rule_based_answer(matches):
+    """基于规则的备用回答系统：取关键词自动机匹配结果中得分最高的类别"""
+    return keyword_engine().intent(matches[0][0])["answer"] if matches else None
 
 # 主聊天界面
 st.header("💬 校园问答")
@@ -124,28 +173,43 @@ if prompt := st.chat_input("请输入关于校园的问题..."):
     
     # 生成AI回复
     with st.chat_message("assistant"):
-        with st.spinner("思考中..."):
-            try:
-                # 首先尝试规则匹配
-                rule_answer = rule_based_answer(prompt)
-                
-                if rule_answer:
-                    # 如果有规则匹配，直接使用规则答案
-                    response = rule_answer
-                elif aliyun_api_key and aliyun_api_key != "your_aliyun_api_key_here":
-                    # 否则使用阿里云模型
-                    response = get_aliyun_answer(prompt)
+        try:
+            # 首先尝试规则匹配，并按问题长度、子问题个数与规则命中程度选择模型档位
+            matches = keyword_engine().match(prompt)
+            decision = choose_tier(prompt, matches)
+            rule_answer = rule_based_answer(matches)
+            
+            # 自动选择时，简短问题且规则命中明确（或没有可用的大模型）直接使用规则答案；
+            # 手动选择了模型时总是交给该模型，规则答案只作为参考资料
+            use_rule = decision["tier"] is None and model_option == AUTO_TIER
+            if rule_answer and (use_rule or not LLM_PROVIDERS):
+                response = rule_answer
+                st.markdown(response)
+            elif LLM_PROVIDERS:
+                # 否则使用大模型，命中的规则答案作为参考资料；流式输出：首段文本到达即开始显示
+                if model_option == AUTO_TIER:
+                    tier, reason = decision["tier"], decision["reason"]
                 else:
-                    # 如果没有API密钥，使用备用回答
-                    response = "我主要能回答关于图书馆、奖学金、食堂、宿舍、课程等方面的问题。请问您想了解哪方面的具体信息？"
-                
+                    tier, reason = model_option, "手动选择"
+                references = [keyword_engine().intent(name)["answer"] for name, _, _ in matches[:2]]
+                info = {}
+                pinned = model_option != AUTO_TIER
+                response = st.write_stream(get_aliyun_answer(prompt, tier, pinned, references, info))
+                if "model" in info:
+                    cost = "" if info["cost"] is None else f" · 约 ¥{info['cost']:.4f}"
+                    first_token = "-" if info["first_token"] is None else f"{info['first_token'] * 1000:.0f}"
+                    st.caption(f"🤖 {info['model']}（{reason}） · 首字 {first_token} ms · 总耗时 {info['total'] * 1000:.0f} ms{cost}")
+            else:
+                # 如果没有API密钥，使用备用回答
+                response = "我主要能回答关于图书馆、奖学金、食堂、宿舍、课程等方面的问题。请问您想了解哪方面的具体信息？"
                 st.markdown(response)
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                
-            except Exception as e:
-                error_msg = f"❌ 回答生成失败: {str(e)}"
-                st.error(error_msg)
-                st.session_state.messages.append({"role": "assistant", "content": error_msg})
+            
+            st.session_state.messages.append({"role": "assistant", "content": response})
+            
+        except Exception as e:
+            error_msg = f"❌ 回答生成失败: {str(e)}"
+            st.error(error_msg)
+            st.session_state.messages.append({"role": "assistant", "content": error_msg})
 
 # 快速问答按钮
 st.markdown("### 🎯 快速问答")
@@ -153,28 +217,19 @@ cols = st.columns(3)
 with cols[0]:
     if st.button("📚 图书馆时间"):
         st.session_state.messages.append({"role": "user", "content": "图书馆开放时间"})
-        st.session_state.messages.append({"role": "assistant", "content": CAMPUS_KNOWLEDGE["library"]["answer"]})
+        st.session_state.messages.append({"role": "assistant", "content": keyword_engine().intent("library")["answer"]})
         st.rerun()
 with cols[1]:
     if st.button("💰 奖学金申请"):
         st.session_state.messages.append({"role": "user", "content": "奖学金申请"})
-        st.session_state.messages.append({"role": "assistant", "content": CAMPUS_KNOWLEDGE["scholarship"]["answer"]})
+        st.session_state.messages.append({"role": "assistant", "content": keyword_engine().intent("scholarship")["answer"]})
         st.rerun()
 with cols[2]:
     if st.button("🏠 宿舍信息"):
         st.session_state.messages.append({"role": "user", "content": "宿舍信息"})
-        st.session_state.messages.append({"role": "assistant", "content": CAMPUS_KNOWLEDGE["dormitory"]["answer"]})
+        st.session_state.messages.append({"role": "assistant", "content": keyword_engine().intent("dormitory")["answer"]})
         st.rerun()
 
-# 模型选择
-st.sidebar.markdown("### 模型设置")
-model_option = st.sidebar.selectbox(
-    "选择模型",
-    ["qwen-turbo", "qwen-plus", "qwen-max"],
-    index=0,
-    help="qwen-turbo: 快速响应\nqwen-plus: 平衡性能\nqwen-max: 最佳效果"
-)
-
 # 使用说明
 with st.sidebar.expander("💡 使用说明"):
     st.markdown("""
@@ -184,5 +239,17 @@ with st.sidebar.expander("💡 使用说明"):
     4. 支持中英文问答
     """)
 
+# 各档位统计：请求数、首字与总耗时、token 数与估算费用（改用备用提供方时按实际回答的模型统计）
+tiers = tier_stats().snapshot()
+if tiers:
+    with st.sidebar.expander("📊 各档位耗时与费用"):
+        for model, t in tiers.items():
+            cost = f"累计 ¥{t['cost']:.4f}，平均 ¥{t['avg_cost']:.4f}/次" if model in TIERS else "费用未计入"
+            st.markdown(
+                f"**{model}**：{t['requests']} 次，首字 p50/p95 {t['first_token_p50_ms']}/{t['first_token_p95_ms']} ms，"
+                f"总耗时 p50/p95 {t['total_p50_ms']}/{t['total_p95_ms']} ms，"
+                f"token 输入 {t['input_tokens']} / 输出 {t['output_tokens']}，{cost}"
+            )
+
 st.markdown("---")
 st.caption("校园引导智能体 - 基于阿里云通义千问模型")
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+answer_cache.py
+
+RAGChain.ask 前的答案缓存：
+- 精确匹配层：以（归一化后的）问题为键
+- 近似匹配层：比较查询向量的余弦相似度，超过阈值即视为同一问题；
+  缓存中没有带向量的条目时不计算查询向量（不为查缓存而额外调用嵌入）
+- TTL 过期 + LRU 容量上限
+- 知识库重建后自动失效：每次访问比较 version_fn() 的返回值（如清单文件签名），变化即清空
+
+容量、TTL、阈值可通过环境变量 RAG_ANSWER_CACHE_SIZE（0 表示关闭）、RAG_ANSWER_CACHE_TTL（秒）、
+RAG_ANSWER_CACHE_THRESHOLD 配置。
+"""
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        similarity_threshold: Optional[float] = None,
+        version_fn: Optional[Callable[[], Any]] = None,
+    ):
+        self.max_entries = max_entries if max_entries is not None else int(os.environ.get("RAG_ANSWER_CACHE_SIZE", 1024))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.environ.get("RAG_ANSWER_CACHE_TTL", 3600))
+        self.similarity_threshold = (
+            similarity_threshold if similarity_threshold is not None
+            else float(os.environ.get("RAG_ANSWER_CACHE_THRESHOLD", 0.95))
+        )
+        self.version_fn = version_fn
+        self._version = version_fn() if version_fn else None
+
+        self._lock = threading.Lock()
+        # key -> (过期时间, 结果, 归一化后的查询向量或 None)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None  # 近似匹配用的向量矩阵，条目变化时重建
+        self._matrix_keys: list = []
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _check_version(self) -> None:
+        if self.version_fn is None:
+            return
+        version = self.version_fn()
+        if version != self._version:
+            self._version = version
+            self._entries.clear()
+            self._matrix = None
+            self.stats["invalidations"] += 1
+
+    def _expire(self, now: float) -> None:
+        expired = [k for k, (expires, _, _) in self._entries.items() if expires <= now]
+        for k in expired:
+            del self._entries[k]
+        if expired:
+            self._matrix = None
+
+    def _has_vectors(self) -> bool:
+        """是否有可供近似匹配的条目（顺带重建向量矩阵）。"""
+        if self._matrix is None:
+            self._matrix_keys = [k for k, (_, _, v) in self._entries.items() if v is not None]
+            self._matrix = np.stack([self._entries[k][2] for k in self._matrix_keys]) if self._matrix_keys else None
+        return self._matrix is not None
+
+    def _semantic_lookup(self, vector: np.ndarray) -> Optional[str]:
+        if not self._has_vectors():
+            return None
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        return self._matrix_keys[best] if scores[best] >= self.similarity_threshold else None
+
+    @staticmethod
+    def _unit(vector) -> Optional[np.ndarray]:
+        if vector is None:
+            return None
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else None
+
+    def get(self, key: str, vector_fn: Optional[Callable[[], Any]] = None) -> Optional[Dict[str, Any]]:
+        """先查精确匹配，未命中且缓存中有带向量的条目时，再用 vector_fn() 计算查询向量查近似匹配。
+
+        命中时返回结果副本，并带上 cache 字段（"exact" 或 "semantic"）。
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._check_version()
+            self._expire(time.time())
+            exact = key in self._entries
+            semantic = not exact and vector_fn is not None and self.similarity_threshold <= 1.0 and self._has_vectors()
+        tier = "exact"
+        if not exact:
+            # 计算向量可能较慢（嵌入调用），不在锁内进行
+            unit = self._unit(vector_fn()) if semantic else None
+            tier = "semantic"
+        with self._lock:
+            if not exact:
+                key = self._semantic_lookup(unit) if unit is not None else None
+            # 两次加锁之间条目可能已被淘汰
+            if key is None or key not in self._entries:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats[f"{tier}_hits"] += 1
+            result = copy.deepcopy(self._entries[key][1])
+        result["cache"] = tier
+        return result
+
+    def put(self, key: str, result: Dict[str, Any], vector=None) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._check_version()
+            self._entries[key] = (time.time() + self.ttl_seconds, copy.deepcopy(result), self._unit(vector))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
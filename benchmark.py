@@ -0,0 +1,329 @@
+"""
+benchmark.py
+
+后端（main.py 的 FastAPI 应用）压测工具：回放 JSONL 问题集，统计吞吐量与端到端、各阶段的 p50/p95/p99 延迟。
+
+默认在进程内运行，不需要网络与 API Key，结果可复现：
+- 用 knowledge_source 在临时目录构建本地嵌入（EMBEDDING_BACKEND=local）的知识库
+- 查询嵌入为本地嵌入器，可附加模拟的接口延迟（--embed-latency-ms）
+- LLM 为确定性的模拟聊天模型，首 token 延迟与每 token 延迟可配置，抖动由 --seed 固定；
+  --llm-tail-rate 让一部分请求慢若干倍（长尾），--backup-llm-latency-ms 增加第二个模拟提供方，用于观察对冲请求的效果
+- 请求经 httpx 的 ASGI transport 直接进入 FastAPI 应用，走完整的接口与 RAGChain 流程
+指定 --mock-url 时改用真实的 OpenAI 客户端（嵌入与 LLM），指向 mock_llm_server.py 启动的本地替身服务，
+可以压测网络调用、流式与 429 重试；嵌入缓存写入临时目录，不影响正式缓存。
+指定 --url 时改为压测正在运行的服务（只统计端到端延迟，阶段耗时请看其 /metrics）。
+
+问题集每行一个 JSON，含 question 字段（默认 benchmark_questions.jsonl）。
+到达方式：--rate 为 0 时按 --concurrency 个并发持续发送（闭环），大于 0 时按泊松过程以该速率到达（开环），
+同时在途请求数不超过 --concurrency。
+
+运行示例：
+    python benchmark.py --concurrency 16 --requests 500
+    python benchmark.py --rate 20 --endpoint stream --llm-latency-ms 800
+    python benchmark.py --llm-tail-rate 0.1 --backup-llm-latency-ms 400
+    python benchmark.py --url http://localhost:8000 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+from langchain.schema.messages import AIMessageChunk
+from langchain.schema.output import ChatGenerationChunk
+
+ENDPOINTS = {"ask": "/ask", "stream": "/ask/stream", "batch": "/ask/batch"}
+STAGES = ("embed", "lexical", "vector_search", "extract", "context", "llm", "ttft")
+
+
+class StubChatModel(BaseChatModel):
+    """确定性的模拟聊天模型：回答由提示词哈希决定，延迟 = 首 token 延迟（带抖动）+ 每 token 延迟。"""
+
+    first_token_ms: float = 300.0
+    per_token_ms: float = 10.0
+    jitter: float = 0.2
+    tail_rate: float = 0.0
+    tail_factor: float = 5.0
+    answer_tokens: int = 40
+    seed: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def _plan(self, messages):
+        prompt = "".join(m.content for m in messages)
+        h = zlib.crc32(prompt.encode("utf-8")) ^ self.seed
+        rng = random.Random(h)
+        first = self.first_token_ms * (1 + rng.uniform(-self.jitter, self.jitter)) / 1000
+        if rng.random() < self.tail_rate:
+            first *= self.tail_factor
+        answer = f"（模拟回答 {h:08x}）" + "根据资料整理的答复。" * (self.answer_tokens // 10)
+        # 按两个字符一个 token 切分
+        tokens = [answer[i:i + 2] for i in range(0, len(answer), 2)]
+        return first, tokens
+
+    def _result(self, tokens) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        first, tokens = self._plan(messages)
+        time.sleep(first + len(tokens) * self.per_token_ms / 1000)
+        return self._result(tokens)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        first, tokens = self._plan(messages)
+        await asyncio.sleep(first + len(tokens) * self.per_token_ms / 1000)
+        return self._result(tokens)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        first, tokens = self._plan(messages)
+        await asyncio.sleep(first)
+        for token in tokens:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            await asyncio.sleep(self.per_token_ms / 1000)
+
+
+class DelayedEmbeddings:
+    """给嵌入器的每次调用加上固定延迟，模拟远程嵌入接口。"""
+
+    def __init__(self, embeddings, latency_ms: float):
+        self.embeddings = embeddings
+        self.latency_ms = latency_ms
+        self.model_name = getattr(embeddings, "model_name", None)
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency_ms / 1000)
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def load_questions(path: str) -> List[str]:
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                questions.append(json.loads(line)["question"])
+    if not questions:
+        raise ValueError(f"问题集为空：{path}")
+    return questions
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return {"count": len(values), "p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1), "p99_ms": round(float(p99), 1)}
+
+
+def build_stub_app(args) -> tuple:
+    """构建本地知识库与模拟实现，返回 (FastAPI 应用, RAGChain, 临时目录)。"""
+    from answer_cache import AnswerCache
+    from embedding_backends import LocalHashEmbeddings
+    from knowledge_builder import build_knowledge_base
+    from numpy_index import default_index_dir
+    from rag_chain_clean import RAGChain
+    import main
+
+    persist_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    if args.mock_url:
+        # OpenAI 客户端指向本地替身服务
+        os.environ["OPENAI_API_BASE"] = args.mock_url.rstrip("/") + "/v1"
+        os.environ["OPENAI_API_KEY"] = "mock"
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(persist_dir, "embedding_cache.sqlite3")
+    backend = "openai" if args.mock_url else "local"
+    build_knowledge_base(
+        source_dir=args.source_dir,
+        persist_dir=persist_dir,
+        embedding_backend=backend,
+        numpy_index_dir=default_index_dir(persist_dir) if args.vector_store == "numpy" else None,
+    )
+    if args.mock_url:
+        embeddings, llm = None, None  # 由 RAGChain 按环境变量创建
+    else:
+        embeddings = LocalHashEmbeddings.load(persist_dir)
+        if args.embed_latency_ms:
+            embeddings = DelayedEmbeddings(embeddings, args.embed_latency_ms)
+        llm = StubChatModel(first_token_ms=args.llm_latency_ms, per_token_ms=args.token_latency_ms,
+                            tail_rate=args.llm_tail_rate, seed=args.seed)
+    llms = None
+    if llm is not None and args.backup_llm_latency_ms:
+        backup = StubChatModel(first_token_ms=args.backup_llm_latency_ms, per_token_ms=args.token_latency_ms,
+                               tail_rate=args.llm_tail_rate, seed=args.seed + 1)
+        llms = {"stub/primary": llm, "stub/backup": backup}
+    rag = RAGChain(
+        persist_dir=persist_dir,
+        embedding_backend=backend,
+        embeddings=embeddings,
+        llm=llm,
+        llms=llms,
+        vector_store=args.vector_store,
+        max_concurrency=args.max_concurrency,
+        answer_cache=AnswerCache(max_entries=1024 if args.answer_cache else 0),
+    )
+    rag.metrics.keep_samples()
+    # 直接注入，跳过 main.py 的后台加载
+    main.rag = rag
+    return main.app, rag, persist_dir
+
+
+async def send(client: httpx.AsyncClient, endpoint: str, questions: List[str]) -> Optional[str]:
+    """发送一次请求，成功返回 None，失败返回错误描述。"""
+    if endpoint == "batch":
+        resp = await client.post(ENDPOINTS[endpoint], json={"questions": questions})
+        resp.raise_for_status()
+        errors = [r["error"] for r in resp.json()["results"] if "error" in r]
+        return errors[0] if errors else None
+    if endpoint == "stream":
+        async with client.stream("POST", ENDPOINTS[endpoint], json={"question": questions[0]}) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if line.startswith("event: error"):
+                    return "stream error event"
+        return None
+    resp = await client.post(ENDPOINTS[endpoint], json={"question": questions[0]})
+    resp.raise_for_status()
+    return None
+
+
+async def run_load(client: httpx.AsyncClient, args, questions: List[str]) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    total = args.requests or len(questions)
+    per_request = args.batch_size if args.endpoint == "batch" else 1
+    jobs = [[questions[(i * per_request + j) % len(questions)] for j in range(per_request)] for i in range(total)]
+    latencies: List[float] = []
+    errors: List[str] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(job):
+        # 从到达时刻开始计时，排队等待也计入延迟
+        start = time.perf_counter()
+        async with semaphore:
+            try:
+                error = await send(client, args.endpoint, job)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+        latencies.append(time.perf_counter() - start)
+        if error:
+            errors.append(error)
+
+    start = time.perf_counter()
+    if args.rate > 0:
+        # 开环：按泊松过程到达，不等待前一个请求完成
+        tasks = []
+        for job in jobs:
+            tasks.append(asyncio.create_task(one(job)))
+            await asyncio.sleep(rng.expovariate(args.rate))
+        await asyncio.gather(*tasks)
+    else:
+        queue = iter(jobs)
+
+        async def worker():
+            for job in queue:
+                await one(job)
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    wall = time.perf_counter() - start
+
+    return {
+        "requests": total,
+        "questions": total * per_request,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(total / wall, 2) if wall else None,
+        "questions_per_s": round(total * per_request / wall, 2) if wall else None,
+        "end_to_end": percentiles(latencies),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n请求数 {report['requests']}（问题 {report['questions']} 个），失败 {report['errors']}，"
+          f"耗时 {report['wall_s']}s，吞吐 {report['throughput_rps']} req/s（{report['questions_per_s']} 问/s）")
+    for sample in report["error_samples"]:
+        print(f"  错误示例：{sample}")
+    rows = [("end_to_end", report["end_to_end"])] + list(report.get("stages", {}).items())
+    print(f"{'阶段':<16}{'次数':>8}{'p50(ms)':>12}{'p95(ms)':>12}{'p99(ms)':>12}")
+    for name, p in rows:
+        print(f"{name:<16}{p['count']:>8}{str(p['p50_ms']):>12}{str(p['p95_ms']):>12}{str(p['p99_ms']):>12}")
+    modes = report.get("stats", {}).get("answer_mode")
+    if modes:
+        print(f"回答方式：抽取式 {modes['extractive']}，LLM {modes['llm']}，无结果 {modes['no_answer']}，"
+              f"LLM 跳过率 {modes['llm_skip_rate']:.1%}")
+    routing = report.get("stats", {}).get("providers") or {}
+    if len(routing.get("providers", {})) > 1:
+        wins = "，".join(f"{name} 胜出 {p['wins']}" for name, p in routing["providers"].items())
+        print(f"提供方：{wins}；对冲 {routing['hedges']} 次（{routing['hedge_rate']:.1%}），对冲胜出 {routing['hedge_wins']} 次")
+
+
+async def main_async(args) -> Dict[str, Any]:
+    questions = load_questions(args.questions)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            return await run_load(client, args, questions)
+
+    app, rag, persist_dir = build_stub_app(args)
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            report = await run_load(client, args, questions)
+        samples = rag.metrics.samples or {}
+        report["stages"] = {name: percentiles(samples.get(name, [])) for name in STAGES}
+        report["server"] = percentiles(samples.get(f"request:{args.endpoint}", []))
+        report["stats"] = rag.stats()
+        return report
+    finally:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="回放问题集压测 RAG 后端")
+    parser.add_argument("--questions", default="benchmark_questions.jsonl", help="JSONL 问题集，每行含 question 字段")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="ask")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时在途的请求数上限")
+    parser.add_argument("--rate", type=float, default=0.0, help="到达速率（请求/秒），0 表示闭环持续发送")
+    parser.add_argument("--requests", type=int, default=0, help="请求总数，默认等于问题数（不足时循环使用）")
+    parser.add_argument("--batch-size", type=int, default=16, help="endpoint=batch 时每个请求包含的问题数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="把报告另存为 JSON 文件")
+    parser.add_argument("--url", help="压测已运行的服务（如 http://localhost:8000），不再使用进程内模拟")
+    stub = parser.add_argument_group("进程内模拟")
+    stub.add_argument("--source-dir", default="./knowledge_source")
+    stub.add_argument("--vector-store", choices=["chroma", "numpy"], default="chroma")
+    stub.add_argument("--max-concurrency", type=int, default=8, help="后端并发上限（同 RAG_MAX_CONCURRENCY）")
+    stub.add_argument("--embed-latency-ms", type=float, default=0.0, help="每次嵌入调用附加的延迟")
+    stub.add_argument("--llm-latency-ms", type=float, default=300.0, help="LLM 首 token 延迟（±20% 抖动）")
+    stub.add_argument("--token-latency-ms", type=float, default=10.0, help="LLM 每个 token 的延迟")
+    stub.add_argument("--llm-tail-rate", type=float, default=0.0, help="首 token 延迟变为 5 倍的请求比例")
+    stub.add_argument("--backup-llm-latency-ms", type=float, default=0.0,
+                      help="第二个模拟提供方的首 token 延迟（0 表示只有一个提供方，不对冲）")
+    stub.add_argument("--answer-cache", action="store_true", help="启用答案缓存（默认关闭，测量完整流程）")
+    stub.add_argument("--mock-url", help="使用真实 OpenAI 客户端并指向 mock_llm_server.py（如 http://127.0.0.1:8001）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    report = asyncio.run(main_async(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+bm25_index.py
+
+中文字符 n-gram 倒排索引与 BM25 打分：
+- 文本归一化（全角转半角、小写）后按连续的文字/数字片段切出字符二元、三元组作为词项
+- 倒排表记录 (文档号, 词频)，BM25 打分只访问查询词项命中的文档
+- reciprocal_rank_fusion：把 BM25 结果与向量检索结果按排名融合
+- confidence：查询词项（按 IDF 加权）被最佳文档覆盖的比例，用于判断能否跳过查询嵌入
+
+由 knowledge_builder 在构建时生成（<persist_dir>/bm25_index.json，首行为头信息），RAGChain 加载后做混合检索。
+索引只保存文本块 ID、来源与倒排表，不保存文本（文本已在向量库中，按 ID 取回）；
+知识库增量更新时用 remove()/add() 只处理变化的文本块。
+"""
+import bisect
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+BM25_FILENAME = "bm25_index.json"
+
+_RUNS = re.compile(r"\w+")
+
+
+def bm25_index_path(persist_dir: str) -> str:
+    return os.path.join(persist_dir, BM25_FILENAME)
+
+
+def char_ngrams(text: str, ns: Sequence[int] = (2, 3)) -> List[str]:
+    """切出字符 n-gram；不足两个字的片段（如单字、短英文）整体作为一个词项。"""
+    terms = []
+    for run in _RUNS.findall(unicodedata.normalize("NFKC", text).lower()):
+        if len(run) < min(ns):
+            terms.append(run)
+            continue
+        for n in ns:
+            terms.extend(run[i:i + n] for i in range(len(run) - n + 1))
+    return terms
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.sources: List[Any] = []
+        self.chunks: List[Any] = []
+        self.doc_len: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.header: Dict[str, Any] = {}
+        self.avgdl = 1.0
+
+    @classmethod
+    def build(cls, docs: Iterable[Tuple[str, str, Dict[str, Any]]], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """docs 为 (id, text, metadata) 序列。"""
+        index = cls(k1, b)
+        index.add(docs)
+        return index
+
+    def add(self, docs: Iterable[Tuple[str, str, Dict[str, Any]]]) -> int:
+        """追加文本块（文档号递增，倒排表保持有序），返回追加的块数。ID 已存在的块需先 remove()。"""
+        added = 0
+        for doc_id, text, meta in docs:
+            n = len(self.ids)
+            terms = Counter(char_ngrams(text))
+            for term, tf in terms.items():
+                self.postings.setdefault(term, []).append((n, tf))
+            self.ids.append(doc_id)
+            self.sources.append((meta or {}).get("source"))
+            self.chunks.append((meta or {}).get("chunk"))
+            self.doc_len.append(sum(terms.values()))
+            added += 1
+        self._update_avgdl()
+        return added
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """删除文本块并重新编号（保持原有顺序，倒排表仍按文档号有序），返回删除的块数。"""
+        drop = set(ids)
+        keep = [i for i, doc_id in enumerate(self.ids) if doc_id not in drop]
+        removed = len(self.ids) - len(keep)
+        if not removed:
+            return 0
+        renumber = {old: new for new, old in enumerate(keep)}
+        for field in ("ids", "sources", "chunks", "doc_len"):
+            values = getattr(self, field)
+            setattr(self, field, [values[i] for i in keep])
+        postings = {}
+        for term, plist in self.postings.items():
+            plist = [(renumber[doc], tf) for doc, tf in plist if doc in renumber]
+            if plist:
+                postings[term] = plist
+        self.postings = postings
+        self._update_avgdl()
+        return removed
+
+    def _update_avgdl(self) -> None:
+        self.avgdl = (sum(self.doc_len) / len(self.doc_len) if self.doc_len else 0.0) or 1.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def metadata(self, i: int) -> Dict[str, Any]:
+        return {"source": self.sources[i], "chunk": self.chunks[i]}
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        n = len(self.ids)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[int, float]]:
+        """返回 [(文档号, BM25 分数), ...]，按分数降序。"""
+        if not self.ids:
+            return []
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(char_ngrams(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf(term)
+            for doc, tf in plist:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc] / self.avgdl)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda x: -x[1])[:k]
+
+    def confidence(self, query: str, hits: List[Tuple[int, float]]) -> float:
+        """最佳文档覆盖了多少查询词项（按 IDF 加权，语料中没有的词项按最大 IDF 计），取值 0~1。"""
+        terms = set(char_ngrams(query))
+        if not hits or not terms:
+            return 0.0
+        best = hits[0][0]
+        total = matched = 0.0
+        for term in terms:
+            idf = self.idf(term)
+            total += idf
+            # 倒排表按文档号递增，二分查找
+            plist = self.postings.get(term, [])
+            pos = bisect.bisect_left(plist, (best, 0))
+            if pos < len(plist) and plist[pos][0] == best:
+                matched += idf
+        return matched / total if total else 0.0
+
+    def save(self, path: str, header: Optional[Dict[str, Any]] = None) -> None:
+        self.header = header or {}
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "sources": self.sources,
+            "chunks": self.chunks,
+            "doc_len": self.doc_len,
+            "postings": self.postings,
+        }
+        # 首行为头信息，便于只读首行判断索引对应的知识库版本
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.header, ensure_ascii=False) + "\n")
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @staticmethod
+    def read_header(path: str) -> Dict[str, Any]:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.loads(f.readline())
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            data = json.load(f)
+        index = cls(data["k1"], data["b"])
+        index.header = header
+        index.ids = data["ids"]
+        index.sources = data["sources"]
+        index.chunks = data["chunks"]
+        index.doc_len = data["doc_len"]
+        index.postings = {term: [tuple(p) for p in plist] for term, plist in data["postings"].items()}
+        index._update_avgdl()
+        return index
+
+
+def reciprocal_rank_fusion(ranked_lists: Sequence[Sequence[Hashable]], k: int = 60) -> List[Tuple[Hashable, float]]:
+    """RRF：score(d) = Σ 1 / (k + rank)，rank 从 1 开始。"""
+    scores: Dict[Hashable, float] = defaultdict(float)
+    for ranked in ranked_lists:
+        for rank, key in enumerate(ranked, start=1):
+            scores[key] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: -x[1])
@@ -1,12 +1,22 @@
 """
 Minimal Streamlit front-end for campus agent (main entry for Streamlit deployment).
+Backend calls share one pooled HTTP session per process; answers are cached by normalized question
+and knowledge-base version (see web_app.py), so repeated questions never reach the backend.
 """
 import os
-import requests
 import streamlit as st
 
+from rag_client import BackendClient
+
 API_URL = os.environ.get("RAG_API_URL", "http://127.0.0.1:8000/ask")
 
+
+@st.cache_resource
+def backend():
+    """整个进程共用：连接池会话、知识库版本与答案缓存"""
+    return BackendClient(API_URL)
+
+
 st.set_page_config(page_title="校园引导智能体", page_icon="🎓")
 st.title("🎓 校园引导智能体")
 
@@ -20,31 +30,56 @@ with st.sidebar:
 q = st.text_input("请输入问题：", "如何申请奖学金？")
 if st.button("提问") and q.strip():
     st.session_state.history.append({"role": "user", "text": q})
-    try:
-        resp = requests.post(API_URL, json={"question": q}, timeout=20)
-        resp.raise_for_status()
-        data = resp.json()
-        answer = data.get("answer")
-        sources = data.get("source_documents", [])
-    except Exception as e:
-        answer = f"后端调用出错：{e}"
-        sources = []
-
-    st.session_state.history.append({"role": "assistant", "text": answer, "sources": sources})
+    # 重复问题（规范化后相同、知识库版本未变）直接用缓存，不请求后端
+    key, cached = backend().lookup(q)
+    if cached is not None:
+        answer, sources, timing = cached
+        timing = {**timing, "cached": True}
+    else:
+        # 流式调用 /ask/stream，回答边生成边显示
+        placeholder = st.empty()
+        pieces, sources, timing = [], [], {}
+        try:
+            for event, data in backend().stream(q):
+                if event == "sources":
+                    sources = data
+                elif event == "token":
+                    pieces.append(data)
+                    placeholder.markdown(f"**助手：** {''.join(pieces)}▌")
+                elif event == "done":
+                    timing = data
+                elif event == "error":
+                    pieces.append(f"后端调用出错：{data.get('detail')}")
+        except Exception as e:
+            pieces.append(f"后端调用出错：{e}")
+        placeholder.empty()
+        answer = "".join(pieces)
+        backend().store(key, answer, sources, timing)
+
+    st.session_state.history.append({"role": "assistant", "text": answer, "sources": sources, "timing": timing})
 
 for msg in st.session_state.history:
     if msg["role"] == "user":
         st.markdown(f"**用户：** {msg['text']}")
     else:
         st.markdown(f"**助手：** {msg['text']}")
+        if msg.get("timing"):
+            label = "📄 摘自原文 · " if msg["timing"].get("mode") == "extractive" else ""
+            if msg["timing"].get("cached"):
+                st.caption(f"{label}⚡ 来自缓存")
+            else:
+                st.caption(f"{label}首字 {msg['timing'].get('ttft_ms')} ms · 总耗时 {msg['timing'].get('total_ms')} ms")
         if msg.get("sources"):
             st.markdown("**引用来源：**")
             for s in msg.get("sources"):
-                st.markdown(f"- `{s.get('source')}`: {s.get('content')[:200].replace('\n',' ')}...")
+                snippet = (s.get("content") or "")[:200].replace("\n", " ")
+                st.markdown(f"- `{s.get('source')}`: {snippet}...")
 # rule_based_app.py - 基于规则的校园引导系统
 import streamlit as st
 import re
 
+from keyword_engine import load_keyword_engine
+
 # 设置页面
 st.set_page_config(
     page_title="校园引导智能体",
@@ -55,39 +90,17 @@ st.set_page_config(
 st.title("🎓 校园引导智能体 (规则版)")
 st.markdown("基于规则引擎的校园问答系统")
 
-# 校园知识库
-CAMPUS_KNOWLEDGE = {
-    "library": {
-        "keywords": ["图书馆", "借书", "还书", "阅览室"],
-        "answer": "图书馆开放时间：周一至周日 8:00-22:00\n位置：校园东区主楼\n服务：借书、还书、电子资源、自习"
-    },
-    "scholarship": {
-        "keywords": ["奖学金", "助学金", "资助", "学费"],
-        "answer": "奖学金申请条件：\n- 成绩平均分85分以上\n- 无违纪记录\n- 每学期初申请\n申请地点：学生事务处"
-    },
-    "dormitory": {
-        "keywords": ["宿舍", "寝室", "住宿", "宿管"],
-        "answer": "宿舍信息：\n- 关门时间：23:00（周末24:00）\n- 报修：联系宿管阿姨\n- 水电费：每月初缴纳"
-    },
-    "canteen": {
-        "keywords": ["食堂", "餐厅", "吃饭", "餐饮"],
-        "answer": "食堂信息：\n- 开放时间：6:30-20:00\n- 位置：第一食堂（东区）、第二食堂（西区）\n- 支付方式：校园卡、微信、支付宝"
-    },
-    "course": {
-        "keywords": ["课程", "选课", "上课", "教务"],
-        "answer": "课程相关：\n- 选课时间：学期开始前两周\n- 查询系统：教务在线\n- 联系方式：各学院教务办公室"
-    }
-}
+# 校园知识库：关键词与答案由 knowledge_source 生成（intents.json 与各文档的段落标题），
+# 构建知识库时编译为关键词自动机（keyword_engine.py）
+@st.cache_resource
+def keyword_engine():
+    return load_keyword_engine()
 
 def rule_based_answer(question):
-    """基于规则的问答系统"""
-    question_lower = question.lower()
-    
-    # 匹配关键词
-    for category, info in CAMPUS_KNOWLEDGE.items():
-        for keyword in info["keywords"]:
-            if keyword in question_lower:
-                return info["answer"]
+    """基于规则的问答系统：关键词自动机一次扫描，取得分最高的类别"""
+    answer = keyword_engine().answer(question)
+    if answer:
+        return answer
     
     # 如果没有匹配，提供通用回答
     return f"""您好！我主要能帮助您了解以下校园信息：
@@ -126,17 +139,17 @@ cols = st.columns(3)
 with cols[0]:
     if st.button("📚 图书馆时间"):
         st.session_state.messages.append({"role": "user", "content": "图书馆开放时间"})
-        st.session_state.messages.append({"role": "assistant", "content": CAMPUS_KNOWLEDGE["library"]["answer"]})
+        st.session_state.messages.append({"role": "assistant", "content": keyword_engine().intent("library")["answer"]})
         st.rerun()
 with cols[1]:
     if st.button("💰 奖学金申请"):
         st.session_state.messages.append({"role": "user", "content": "奖学金申请"})
-        st.session_state.messages.append({"role": "assistant", "content": CAMPUS_KNOWLEDGE["scholarship"]["answer"]})
+        st.session_state.messages.append({"role": "assistant", "content": keyword_engine().intent("scholarship")["answer"]})
         st.rerun()
 with cols[2]:
     if st.button("🏠 宿舍信息"):
         st.session_state.messages.append({"role": "user", "content": "宿舍信息"})
-        st.session_state.messages.append({"role": "assistant", "content": CAMPUS_KNOWLEDGE["dormitory"]["answer"]})
+        st.session_state.messages.append({"role": "assistant", "content": keyword_engine().intent("dormitory")["answer"]})
         st.rerun()
 
 st.markdown("---")
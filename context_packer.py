@@ -0,0 +1,139 @@
+"""
+context_packer.py
+
+把检索到的文本块打包成 LLM 上下文：
+- 同一来源（source）且块号（chunk）相邻的文本块合并为一段，并去掉切分时重叠（chunk_overlap）的部分
+- 同一来源的多段放在同一个「来源」标题下，来源按其最靠前的检索排名排序
+- 总长度不超过 token 预算：按排名依次放入，放不下的段落在句子边界处截断，其余丢弃
+- 分别返回合并去重节省的 token 数（与逐块原样拼接相比，不含截断）与超出预算被截掉的 token 数
+
+token 数用 token_utils.estimate_tokens 估算。
+"""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from token_utils import estimate_tokens
+
+SEPARATOR = "\n\n---\n\n"
+# 去重叠时认为有效的最短重叠长度，避免把偶然相同的一两个字当作重叠
+MIN_OVERLAP = 8
+
+_SENTENCE_END = re.compile(r"[。！？!?；;\n]")
+
+
+def _format(source: Any, text: str) -> str:
+    return f"来源: {source}\n{text}"
+
+
+def naive_context(docs) -> str:
+    """逐块原样拼接（打包前的做法），用于计算节省的 token 数。"""
+    return SEPARATOR.join(_format(d.metadata.get("source"), d.page_content) for d in docs)
+
+
+def strip_overlap(left: str, right: str, min_overlap: int = MIN_OVERLAP) -> str:
+    """去掉 right 开头与 left 结尾重叠的部分，返回 right 剩余的内容。"""
+    for k in range(min(len(left), len(right)), min_overlap - 1, -1):
+        if left.endswith(right[:k]):
+            return right[k:]
+    return right
+
+
+def _merge_runs(chunks: List[Tuple[int, str]]) -> Tuple[List[str], int]:
+    """chunks 为按块号排序的 (块号, 文本)；相邻块号合并成一段，返回 (段落列表, 合并次数)。"""
+    runs: List[str] = []
+    merged = 0
+    prev_index = None
+    for index, text in chunks:
+        if runs and prev_index is not None and index == prev_index + 1:
+            rest = strip_overlap(runs[-1], text)
+            runs[-1] += rest if rest != text else "\n" + text
+            merged += 1
+        else:
+            runs.append(text)
+        prev_index = index
+    return runs, merged
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """截断到不超过 max_tokens，尽量停在句子结尾。"""
+    if max_tokens <= 0:
+        return ""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    ends = [m.end() for m in _SENTENCE_END.finditer(cut)]
+    # 句子边界离截断点不远时才回退，避免丢掉太多内容
+    if ends and ends[-1] >= len(cut) // 2:
+        cut = cut[:ends[-1]]
+    return cut.rstrip()
+
+
+def pack_context(docs, max_tokens: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    """docs 为按相关度排序的 Document 列表，返回 (上下文, 统计)。
+
+    统计包含 tokens_before（原样拼接）、tokens_after、tokens_saved（合并去重节省的 token 数）、
+    tokens_truncated（超出预算被截断或丢弃的 token 数）、merged（合并的块数）、truncated（是否截断/丢弃）。
+    """
+    # 按来源分组，记录每个来源最靠前的排名；去掉重复的块
+    groups: Dict[Any, Dict[Any, str]] = {}
+    loose: List[Tuple[int, Any, str]] = []  # 没有块号的文本块单独成段
+    for rank, d in enumerate(docs):
+        meta = d.metadata if isinstance(d.metadata, dict) else {}
+        source, index = meta.get("source"), meta.get("chunk")
+        if isinstance(index, int):
+            groups.setdefault(source, {}).setdefault(index, d.page_content)
+        else:
+            loose.append((rank, source, d.page_content))
+
+    first_rank: Dict[Any, int] = {}
+    for rank, d in enumerate(docs):
+        meta = d.metadata if isinstance(d.metadata, dict) else {}
+        if isinstance(meta.get("chunk"), int):
+            first_rank.setdefault(meta.get("source"), rank)
+
+    sections: List[Tuple[int, Any, str]] = []
+    merged = 0
+    for source, chunks in groups.items():
+        runs, n = _merge_runs(sorted(chunks.items()))
+        merged += n
+        sections.append((first_rank[source], source, "\n……\n".join(runs)))
+    sections.extend(loose)
+    sections.sort(key=lambda s: s[0])
+
+    parts: List[str] = []
+    used = 0
+    truncated = False
+    sep_tokens = estimate_tokens(SEPARATOR)
+    for _, source, text in sections:
+        part = _format(source, text)
+        cost = estimate_tokens(part) + (sep_tokens if parts else 0)
+        if max_tokens is None or used + cost <= max_tokens:
+            parts.append(part)
+            used += cost
+            continue
+        truncated = True
+        header = _format(source, "")
+        remaining = max_tokens - used - estimate_tokens(header) - (sep_tokens if parts else 0)
+        text = _truncate(text, remaining)
+        if text:
+            parts.append(header + text)
+        break
+
+    context = SEPARATOR.join(parts)
+    before = estimate_tokens(naive_context(docs))
+    after = estimate_tokens(context)
+    # 不截断时的长度：与 before 之差是合并去重的收益，与 after 之差是预算截掉的部分
+    packed = estimate_tokens(SEPARATOR.join(_format(source, text) for _, source, text in sections)) if truncated else after
+    return context, {
+        "tokens_before": before,
+        "tokens_after": after,
+        "tokens_saved": max(0, before - packed),
+        "tokens_truncated": max(0, packed - after),
+        "merged": merged,
+        "truncated": truncated,
+    }
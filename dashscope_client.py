@@ -0,0 +1,138 @@
+"""
+dashscope_client.py
+
+通义千问（DashScope）HTTP 客户端，aliyun_campus_app.py 用 st.cache_resource 创建一次，所有会话共用：
+- requests.Session 连接池，复用 TCP / TLS 连接
+- 每次请求带连接超时与读取超时（流式时为两段输出之间允许的最长间隔），慢响应不会无限期卡住页面
+- 429、5xx 与网络错误按指数退避加随机抖动重试，次数有上限（429 带 Retry-After 时至少等待该时长）；
+  流式输出开始后不再重试，避免重复内容
+- stream() 使用 DashScope 增量流式输出（X-DashScope-SSE: enable + incremental_output），逐段产出文本，
+  可直接交给 st.write_stream；call() 为非流式调用；传入 usage 字典时写入服务端返回的 token 用量
+
+接口地址默认读取环境变量 DASHSCOPE_HTTP_BASE_URL（与 dashscope SDK 一致），可指向 mock_llm_server.py。
+"""
+import os
+import random
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rag_client import iter_sse
+
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/api/v1"
+GENERATION_PATH = "/services/aigc/text-generation/generation"
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class DashScopeError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None, code: Optional[str] = None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+class DashScopeClient:
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str] = None,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 30.0,
+        max_retries: int = 2,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        pool_size: int = 8,
+    ):
+        base_url = base_url or os.environ.get("DASHSCOPE_HTTP_BASE_URL") or DEFAULT_BASE_URL
+        self.url = base_url.rstrip("/") + GENERATION_PATH
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"})
+        self.stats = {"requests": 0, "retries": 0, "errors": 0}
+
+    @staticmethod
+    def _payload(model: str, messages: List[Dict[str, str]], parameters: Dict[str, Any]) -> Dict[str, Any]:
+        return {"model": model, "input": {"messages": messages}, "parameters": {"result_format": "message", **parameters}}
+
+    @staticmethod
+    def _text(data: Dict[str, Any]) -> str:
+        output = data.get("output") or {}
+        choices = output.get("choices")
+        if choices:
+            return (choices[0].get("message") or {}).get("content") or ""
+        return output.get("text") or ""
+
+    @staticmethod
+    def _error(resp: requests.Response) -> DashScopeError:
+        try:
+            body = resp.json()
+        except ValueError:
+            body = {}
+        message = body.get("message") or resp.text[:200] or resp.reason
+        return DashScopeError(f"HTTP {resp.status_code}: {message}", resp.status_code, body.get("code"))
+
+    def _delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        # 指数退避 + 抖动（0.5~1 倍），多个会话同时失败时错开重试时间
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+        try:
+            return max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            return delay
+
+    def _post(self, payload: Dict[str, Any], stream: bool) -> requests.Response:
+        """发送请求，可重试的失败按退避重试；返回状态码 200 的响应。"""
+        headers = {"X-DashScope-SSE": "enable", "Accept": "text/event-stream"} if stream else {}
+        for attempt in range(self.max_retries + 1):
+            self.stats["requests"] += 1
+            retry_after = None
+            try:
+                resp = self.session.post(self.url, json=payload, headers=headers, stream=stream, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error: Exception = DashScopeError(f"连接阿里云服务失败：{e}")
+            else:
+                if resp.status_code == 200:
+                    return resp
+                error = self._error(resp)
+                retry_after = resp.headers.get("Retry-After")
+                resp.close()
+                if resp.status_code not in RETRY_STATUS:
+                    self.stats["errors"] += 1
+                    raise error
+            if attempt == self.max_retries:
+                self.stats["errors"] += 1
+                raise error
+            self.stats["retries"] += 1
+            time.sleep(self._delay(attempt, retry_after))
+        raise AssertionError("unreachable")
+
+    def call(self, model: str, messages: List[Dict[str, str]], **parameters) -> str:
+        """非流式调用，返回完整回答。"""
+        resp = self._post(self._payload(model, messages, parameters), stream=False)
+        with resp:
+            return self._text(resp.json())
+
+    def stream(
+        self, model: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, Any]] = None, **parameters
+    ) -> Iterator[str]:
+        """流式调用，逐段产出新增文本；usage 不为 None 时写入最新的 token 用量（input_tokens / output_tokens）。"""
+        payload = self._payload(model, messages, {**parameters, "incremental_output": True})
+        resp = self._post(payload, stream=True)
+        with resp:
+            resp.encoding = "utf-8"
+            for event, data in iter_sse(resp):
+                if event == "error" or (isinstance(data, dict) and data.get("code")):
+                    self.stats["errors"] += 1
+                    raise DashScopeError(f"{data.get('code')}: {data.get('message')}", code=data.get("code"))
+                if usage is not None and isinstance(data, dict) and data.get("usage"):
+                    usage.update(data["usage"])
+                text = self._text(data)
+                if text:
+                    yield text
@@ -0,0 +1,141 @@
+"""
+embedding_backends.py
+
+可插拔的嵌入后端，通过参数或环境变量 EMBEDDING_BACKEND 选择：
+- openai（默认）：OpenAIEmbeddings，经本地嵌入缓存（embedding_cache.py）
+- local：纯 NumPy 的本地嵌入器，无需网络与 API Key，适合离线 CI、基准测试和内网环境
+
+本地嵌入器使用字符 n-gram（默认 1~3 元，适合中文）特征哈希到固定维度，
+TF 取对数平滑，乘以构建时从知识库统计出的 IDF，再做 L2 归一化。
+IDF 表保存在持久化目录（local_idf.npy）中，首次构建（或 force 重建）时生成，此后保持不变，
+这样增量构建与查询两侧得到的向量一致；IDF 摘要会写进模型名，用于缓存键和构建清单。
+"""
+import hashlib
+import os
+import re
+import unicodedata
+import zlib
+from typing import Iterable, List, Optional
+
+import numpy as np
+from langchain.embeddings import OpenAIEmbeddings
+
+from embedding_cache import with_embedding_cache
+
+BACKENDS = ("openai", "local")
+IDF_FILENAME = "local_idf.npy"
+DEFAULT_LOCAL_DIM = 1024
+
+_SPACES = re.compile(r"\s+")
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    backend = (backend or os.environ.get("EMBEDDING_BACKEND") or "openai").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的嵌入后端：{backend}，可选：{', '.join(BACKENDS)}")
+    return backend
+
+
+def idf_path(persist_dir: str) -> str:
+    return os.path.join(persist_dir, IDF_FILENAME)
+
+
+def _char_ngrams(text: str, ngram_range=(1, 3)) -> List[str]:
+    # 全角转半角、统一大小写、去掉空白，再按字符取 n-gram
+    text = _SPACES.sub("", unicodedata.normalize("NFKC", text).lower())
+    grams = []
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+def _hash_ngram(gram: str, dim: int):
+    # crc32 在不同进程间稳定（内置 hash() 带随机盐）；高位决定符号，降低哈希冲突带来的偏差
+    h = zlib.crc32(gram.encode("utf-8"))
+    return h % dim, (1.0 if h & 0x80000000 else -1.0)
+
+
+class LocalHashEmbeddings:
+    """纯 NumPy 的本地嵌入器，接口与 langchain 的 Embeddings 一致。"""
+
+    def __init__(self, dim: int = DEFAULT_LOCAL_DIM, idf: Optional[np.ndarray] = None, ngram_range=(1, 3)):
+        self.dim = dim
+        self.ngram_range = tuple(ngram_range)
+        self.idf = idf.astype(np.float32) if idf is not None else None
+        self.model_name = f"local-hash-{dim}"
+        if self.idf is not None:
+            self.model_name += "-" + hashlib.sha256(self.idf.tobytes()).hexdigest()[:8]
+
+    @classmethod
+    def load(cls, persist_dir: str, dim: Optional[int] = None) -> "LocalHashEmbeddings":
+        """从持久化目录加载 IDF（不存在时不做 IDF 加权）。"""
+        path = idf_path(persist_dir)
+        if os.path.exists(path):
+            idf = np.load(path)
+            return cls(dim=len(idf), idf=idf)
+        return cls(dim=dim or int(os.environ.get("LOCAL_EMBEDDING_DIM", DEFAULT_LOCAL_DIM)))
+
+    def _term_matrix(self, texts: List[str]) -> np.ndarray:
+        rows, cols, vals = [], [], []
+        for r, text in enumerate(texts):
+            for gram in _char_ngrams(text, self.ngram_range):
+                col, sign = _hash_ngram(gram, self.dim)
+                rows.append(r)
+                cols.append(col)
+                vals.append(sign)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if rows:
+            np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), np.asarray(vals, dtype=np.float32))
+        return matrix
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        tf = self._term_matrix(texts)
+        # 对数平滑的 TF（保留符号），再乘 IDF
+        matrix = np.sign(tf) * np.log1p(np.abs(tf))
+        if self.idf is not None:
+            matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+        return matrix.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def fit_idf(texts: Iterable[str], dim: int = DEFAULT_LOCAL_DIM, ngram_range=(1, 3)) -> np.ndarray:
+    """按文本块统计每个哈希桶的文档频率，返回平滑 IDF（流式统计，不保存文本）。"""
+    df = np.zeros(dim, dtype=np.int64)
+    n_docs = 0
+    for text in texts:
+        n_docs += 1
+        buckets = {_hash_ngram(g, dim)[0] for g in _char_ngrams(text, ngram_range)}
+        if buckets:
+            df[list(buckets)] += 1
+    return (np.log((1.0 + n_docs) / (1.0 + df)) + 1.0).astype(np.float32)
+
+
+def save_idf(persist_dir: str, idf: np.ndarray) -> None:
+    os.makedirs(persist_dir, exist_ok=True)
+    np.save(idf_path(persist_dir), idf)
+
+
+def get_embeddings(
+    embedding_model: str = "text-embedding-3-small",
+    backend: Optional[str] = None,
+    persist_dir: str = "./chroma_db",
+):
+    """按配置创建查询侧使用的嵌入器。
+
+    openai 后端需要 OPENAI_API_KEY，并经过本地嵌入缓存；local 后端从 persist_dir 读取 IDF。
+    """
+    if resolve_backend(backend) == "local":
+        return LocalHashEmbeddings.load(persist_dir)
+
+    if not os.environ.get("OPENAI_API_KEY"):
+        raise EnvironmentError(
+            "请先设置环境变量 OPENAI_API_KEY，例如：在 PowerShell 中运行：$Env:OPENAI_API_KEY=\"your_key\""
+            "（或设置 EMBEDDING_BACKEND=local 使用本地嵌入）"
+        )
+    return with_embedding_cache(OpenAIEmbeddings(model=embedding_model), embedding_model)
@@ -0,0 +1,167 @@
+"""
+embedding_cache.py
+
+本地持久化的嵌入向量缓存：
+- 使用 SQLite 单文件保存，键为 (模型名, 维度, 文本 sha256)，向量以 float32 存储
+- 超过 max_entries 时按最近使用时间（LRU）淘汰：每写入约 max_entries 的 1% 条才统计一次行数并淘汰，
+  命中时的最近使用时间先记在内存中，下次写入（或累计较多）时在一个事务里批量更新，查询路径不写库
+- CachedEmbeddings 包装任意提供 embed_documents / embed_query 的嵌入器，
+  knowledge_builder 与 RAGChain 共用同一个缓存文件，未变的文本块和热门问题都不再调用嵌入 API
+
+缓存路径与容量可通过环境变量 EMBEDDING_CACHE_PATH、EMBEDDING_CACHE_MAX_ENTRIES 配置。
+"""
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from kb_manifest import sha256_text
+
+DEFAULT_CACHE_PATH = "./embedding_cache.sqlite3"
+DEFAULT_MAX_ENTRIES = 200_000
+TOUCH_FLUSH_SIZE = 1000  # 内存中积攒的最近使用时间超过该条数时写回
+
+
+class EmbeddingCache:
+    """SQLite 向量缓存，线程安全，可被多个进程（构建脚本与后端）同时打开。"""
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = path or os.environ.get("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries or int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        parent = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(parent, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, dims INTEGER NOT NULL, text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, dims, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        # 淘汰检查的间隔（写入条数），容量最多超出这么多；初始即到期，第一次写入时检查一次
+        self.evict_every = max(1, self.max_entries // 100)
+        self._inserted_since_check = self.evict_every
+        self._touched: Dict[Tuple[str, int, str], float] = {}
+
+    def get_many(self, model: str, dims: int, hashes: List[str]) -> Dict[str, List[float]]:
+        """批量查询，返回命中的 {text_hash: vector}，并刷新命中项的最近使用时间。"""
+        found: Dict[str, List[float]] = {}
+        if not hashes:
+            return found
+        with self._lock:
+            # SQLite 单条语句的参数个数有限，分批查询
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model=? AND dims=? AND text_hash IN ({placeholders})",
+                    [model, dims, *part],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[text_hash] = vec.tolist()
+            if found:
+                now = time.time()
+                self._touched.update(((model, dims, h), now) for h in found)
+                if len(self._touched) >= TOUCH_FLUSH_SIZE:
+                    self._write_touched()
+                    self._conn.commit()
+        return found
+
+    def _write_touched(self) -> None:
+        """把内存中的最近使用时间写入当前事务（调用方持有锁并负责提交）。"""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used=? WHERE model=? AND dims=? AND text_hash=?",
+                [(now, model, dims, h) for (model, dims, h), now in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def put_many(self, model: str, dims: int, items: Dict[str, List[float]]) -> None:
+        """批量写入，并在同一事务中写回积攒的最近使用时间；每写入 evict_every 条按 LRU 淘汰一次超出容量的条目。"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._write_touched()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings(model, dims, text_hash, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(model, dims, h, array("f", vec).tobytes(), now) for h, vec in items.items()],
+            )
+            self._inserted_since_check += len(items)
+            if self._inserted_since_check >= self.evict_every:
+                self._inserted_since_check = 0
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        overflow = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN"
+                " (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+
+    def flush(self) -> None:
+        """写回积攒的最近使用时间。"""
+        with self._lock:
+            self._write_touched()
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbeddings:
+    """给嵌入器加一层持久化缓存，对外接口与 langchain 的 Embeddings 一致。"""
+
+    def __init__(
+        self,
+        embeddings,
+        model_name: str,
+        dimensions: Optional[int] = None,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.dimensions = dimensions or 0
+        self.cache = cache or EmbeddingCache()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [sha256_text(t) for t in texts]
+        cached = self.cache.get_many(self.model_name, self.dimensions, list(set(hashes)))
+
+        # 未命中的文本去重后一次性交给底层嵌入器
+        missing: Dict[str, str] = {}
+        for text, h in zip(texts, hashes):
+            if h not in cached and h not in missing:
+                missing[h] = text
+        self.hits += len(texts) - sum(1 for h in hashes if h in missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, self.dimensions, fresh)
+            cached.update(fresh)
+
+        return [cached[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def with_embedding_cache(embeddings, model_name: str, dimensions: Optional[int] = None) -> CachedEmbeddings:
+    """便捷函数：用默认缓存文件包装嵌入器。"""
+    return CachedEmbeddings(embeddings, model_name=model_name, dimensions=dimensions)
@@ -0,0 +1,140 @@
+"""
+embedding_pipeline.py
+
+并发、限流感知的批量嵌入阶段：
+- 按 batch_size 切分文本，最多 max_workers 个批次同时在途（线程池）
+- 遇到 429 / 限流错误时指数退避（带抖动，优先遵循 Retry-After）后重试
+- 可选的每分钟 token 预算（tokens_per_minute），以令牌桶方式平滑发送
+- 统计吞吐量（块/秒、tokens/秒），构建结束时输出
+
+BatchEmbedder 自身也提供 embed_documents / embed_query，可直接放在 CachedEmbeddings 之下，
+这样只有缓存未命中的文本才会进入网络请求和 token 预算。
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from token_utils import estimate_tokens
+
+
+def is_rate_limit_error(exc: Exception) -> bool:
+    """判断异常是否为限流（HTTP 429）。兼容 openai 1.x、requests 以及字符串形式的错误。"""
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    response = getattr(exc, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    return "RateLimit" in type(exc).__name__ or "429" in str(exc)
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBudget:
+    """每分钟 token 预算的令牌桶，acquire 在额度不足时阻塞等待。"""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> None:
+        # 单批超过整分钟预算时按满额处理，避免永远等不到
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return
+                wait = (tokens - self.available) / self.rate
+            time.sleep(wait)
+
+
+class BatchEmbedder:
+    def __init__(
+        self,
+        embeddings,
+        batch_size: int = 64,
+        max_workers: int = 4,
+        tokens_per_minute: Optional[int] = None,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.budget = TokenBudget(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._lock = threading.Lock()
+        self.stats = {"chunks": 0, "tokens": 0, "batches": 0, "retries": 0, "seconds": 0.0}
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        tokens = sum(estimate_tokens(t) for t in texts)
+        if self.budget:
+            self.budget.acquire(tokens)
+
+        attempt = 0
+        while True:
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+                break
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = _retry_after(e) or min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+                attempt += 1
+                with self._lock:
+                    self.stats["retries"] += 1
+                time.sleep(delay)
+
+        with self._lock:
+            self.stats["chunks"] += len(texts)
+            self.stats["tokens"] += tokens
+            self.stats["batches"] += 1
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """并发嵌入，返回顺序与输入一致。"""
+        if not texts:
+            return []
+        started = time.perf_counter()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        try:
+            if len(batches) == 1 or self.max_workers == 1:
+                results = [self._embed_batch(b) for b in batches]
+            else:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                    results = list(pool.map(self._embed_batch, batches))
+        finally:
+            with self._lock:
+                self.stats["seconds"] += time.perf_counter() - started
+        return [vec for batch in results for vec in batch]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def throughput(self) -> Dict[str, Any]:
+        """累计吞吐量统计（只计入真正发往嵌入服务的文本）。"""
+        with self._lock:
+            stats = dict(self.stats)
+        seconds = stats["seconds"] or 1e-9
+        stats["chunks_per_s"] = round(stats["chunks"] / seconds, 2)
+        stats["tokens_per_s"] = round(stats["tokens"] / seconds, 2)
+        stats["seconds"] = round(stats["seconds"], 3)
+        return stats
@@ -0,0 +1,92 @@
+"""
+extractive_answer.py
+
+抽取式回答：检索到的文本块里已经逐字包含答案时（如开放时间、报修响应时限），直接摘出最匹配的句子，不调用 LLM。
+- 文本块按句号、问号、分号、换行等切成句子
+- 句子得分 = 查询词项（bm25_index.char_ngrams，按 IDF 加权）被该句覆盖的比例，取值 0~1
+- 最高分不低于阈值时返回该句（同一文本块内达到阈值的句子最多取 max_sentences 句，按原文顺序）；
+  句子以冒号结尾或几乎只是问题本身（如「宿舍报修流程：」这样的小标题）时，连带同一段落中其后的句子（列表各项）
+"""
+import re
+from typing import Callable, List, Optional, Tuple
+
+from bm25_index import char_ngrams
+
+# 句子除查询词项外至少要有这么多个词项，否则认为只是标题
+MIN_NOVEL_TERMS = 4
+# 标题后最多连带的句子数
+MAX_FOLLOWING = 8
+
+_SENTENCE = re.compile(r"[^。！？!?；;\n]+[。！？!?；;]?")
+_PARAGRAPH = re.compile(r"\n\s*\n")
+
+
+def split_sentences(text: str) -> List[Tuple[int, str]]:
+    """切成句子，返回 [(段落号, 句子), ...]；段落以空行分隔。"""
+    return [
+        (p, s.strip())
+        for p, para in enumerate(_PARAGRAPH.split(text))
+        for s in _SENTENCE.findall(para)
+        if s.strip()
+    ]
+
+
+def sentence_score(terms: set, sentence: str, idf: Callable[[str], float]) -> float:
+    """查询词项被句子覆盖的比例（IDF 加权）。"""
+    covered = set(char_ngrams(sentence))
+    total = sum(idf(t) for t in terms)
+    matched = sum(idf(t) for t in terms if t in covered)
+    return matched / total if total else 0.0
+
+
+def extract_answer(
+    question: str,
+    docs,
+    threshold: float,
+    idf: Optional[Callable[[str], float]] = None,
+    max_sentences: int = 2,
+) -> Optional[Tuple[str, int, float]]:
+    """在检索结果中找最匹配的句子，返回 (答案, 所在文本块下标, 得分)；最高分低于阈值时返回 None。
+
+    idf 为词项权重（通常是 BM25Index.idf），不提供时各词项等权。
+    """
+    terms = set(char_ngrams(question))
+    if not terms or not docs:
+        return None
+    idf = idf or (lambda term: 1.0)
+
+    best: Optional[Tuple[float, int]] = None
+    scored: List[List[Tuple[float, int, str]]] = []
+    for i, d in enumerate(docs):
+        sentences = [(sentence_score(terms, s, idf), p, s) for p, s in split_sentences(d.page_content)]
+        scored.append(sentences)
+        for score, _, _ in sentences:
+            if best is None or score > best[0]:
+                best = (score, i)
+    if best is None or best[0] < threshold:
+        return None
+
+    score, doc_index = best
+    sentences = scored[doc_index]
+    picked: List[int] = []
+    matched = 0
+    for j, (s_score, para, sentence) in enumerate(sentences):
+        if s_score < threshold or j in picked:
+            continue
+        picked.append(j)
+        matched += 1
+        if _is_heading(sentence, terms):
+            # 标题：连带同一段落中其后的句子
+            following = [k for k in range(j + 1, len(sentences)) if sentences[k][1] == para][:MAX_FOLLOWING]
+            picked.extend(following)
+            break
+        if matched >= max_sentences:
+            break
+    answer = "\n".join(sentences[j][2] for j in picked)
+    return answer, doc_index, score
+
+
+def _is_heading(sentence: str, terms: set) -> bool:
+    if sentence.endswith((":", "：")):
+        return True
+    return len(set(char_ngrams(sentence)) - terms) < MIN_NOVEL_TERMS
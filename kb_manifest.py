@@ -0,0 +1,141 @@
+"""
+kb_manifest.py
+
+知识库清单（manifest）读写：
+- 记录每个源文件的内容哈希，以及该文件切分出的每个文本块的 sha256
+- 与 ChromaDB 集合放在同一持久化目录下（<persist_dir>/kb_manifest_<collection>.json）
+- knowledge_builder 依据清单做增量重建；查询侧可通过 version 判断知识库是否已重建
+- 构建过程中的检查点（kb_checkpoint_<collection>.jsonl）：每写完一个文件追加一行，
+  构建中断后再次运行时，已写完的文件直接跳过
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional, TextIO
+
+MANIFEST_FORMAT = 1
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source: str, index: int) -> str:
+    """文本块在集合中的稳定 ID：同一文件同一位置的块总是使用同一个 ID。"""
+    return f"{source}#{index}"
+
+
+def manifest_path(persist_dir: str, collection_name: str = "campus") -> str:
+    return os.path.join(persist_dir, f"kb_manifest_{collection_name}.json")
+
+
+def compute_version(manifest: Dict[str, Any]) -> str:
+    """根据参数和所有块哈希计算知识库版本号，内容不变则版本号不变。"""
+    h = hashlib.sha256()
+    h.update(json.dumps(manifest.get("params", {}), sort_keys=True).encode("utf-8"))
+    for source in sorted(manifest.get("files", {})):
+        h.update(source.encode("utf-8"))
+        for chunk_hash in manifest["files"][source]["chunks"]:
+            h.update(chunk_hash.encode("ascii"))
+    return h.hexdigest()[:16]
+
+
+def load_manifest(persist_dir: str, collection_name: str = "campus") -> Optional[Dict[str, Any]]:
+    """读取清单；不存在或格式不兼容时返回 None。"""
+    path = manifest_path(persist_dir, collection_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != MANIFEST_FORMAT:
+        return None
+    return manifest
+
+
+def save_manifest(persist_dir: str, manifest: Dict[str, Any], collection_name: str = "campus") -> str:
+    """写入清单（先写临时文件再替换，避免中断时留下半个文件），返回新版本号。"""
+    os.makedirs(persist_dir, exist_ok=True)
+    manifest["format"] = MANIFEST_FORMAT
+    manifest["version"] = compute_version(manifest)
+    path = manifest_path(persist_dir, collection_name)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    return manifest["version"]
+
+
+def remove_manifest(persist_dir: str, collection_name: str = "campus") -> None:
+    """删除清单。清空集合前调用：清空后到写完新清单之前，磁盘上不能留着描述旧集合的清单。"""
+    path = manifest_path(persist_dir, collection_name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def kb_version(persist_dir: str = "./chroma_db", collection_name: str = "campus") -> Optional[str]:
+    """返回当前知识库版本号；未通过增量构建生成过清单时返回 None。"""
+    manifest = load_manifest(persist_dir, collection_name)
+    return manifest.get("version") if manifest else None
+
+
+def manifest_signature(persist_dir: str = "./chroma_db", collection_name: str = "campus") -> Optional[tuple]:
+    """清单文件的 (修改时间, 大小)，只做一次 stat，适合在每次查询时判断知识库是否已重建。"""
+    try:
+        st = os.stat(manifest_path(persist_dir, collection_name))
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def checkpoint_path(persist_dir: str, collection_name: str = "campus") -> str:
+    return os.path.join(persist_dir, f"kb_checkpoint_{collection_name}.jsonl")
+
+
+def load_checkpoint(persist_dir: str, params: Dict[str, Any], collection_name: str = "campus") -> Optional[Dict[str, Dict]]:
+    """读取未完成构建的检查点，返回已写完的文件 {source: {"sha256", "chunks"}}。
+
+    没有检查点或检查点来自不同的构建参数时返回 None。
+    """
+    path = checkpoint_path(persist_dir, collection_name)
+    if not os.path.exists(path):
+        return None
+    files: Dict[str, Dict] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        header = f.readline()
+        if not header or json.loads(header).get("params") != params:
+            return None
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 中断时最后一行可能只写了一半
+                break
+            files[record["source"]] = {"sha256": record["sha256"], "chunks": record["chunks"]}
+    return files
+
+
+def open_checkpoint(persist_dir: str, params: Dict[str, Any], collection_name: str = "campus", resume: bool = False) -> TextIO:
+    """打开检查点文件用于追加；resume=False 时重新开始（写入参数头）。"""
+    os.makedirs(persist_dir, exist_ok=True)
+    path = checkpoint_path(persist_dir, collection_name)
+    if resume and os.path.exists(path):
+        # 截掉中断时写了一半的最后一行，再继续追加
+        with open(path, "rb+") as raw:
+            data = raw.read()
+            raw.truncate(data.rfind(b"\n") + 1)
+        return open(path, "a", encoding="utf-8")
+    f = open(path, "w", encoding="utf-8")
+    f.write(json.dumps({"params": params}) + "\n")
+    f.flush()
+    return f
+
+
+def append_checkpoint(f: TextIO, source: str, info: Dict[str, Any]) -> None:
+    f.write(json.dumps({"source": source, **info}, ensure_ascii=False) + "\n")
+    f.flush()
+
+
+def clear_checkpoint(persist_dir: str, collection_name: str = "campus") -> None:
+    path = checkpoint_path(persist_dir, collection_name)
+    if os.path.exists(path):
+        os.remove(path)
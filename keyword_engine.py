@@ -0,0 +1,236 @@
+"""
+keyword_engine.py
+
+规则问答的关键词引擎（Aho-Corasick 多模式匹配）：
+- 意图表由 knowledge_source 生成：intents.json 中人工维护的类别（关键词 + 答案），
+  加上各 .txt 文件中「标题：内容」形式的段落（标题作关键词、整段作答案）
+- 所有关键词编译成一个自动机，问题只扫描一遍（时间与问题长度、命中数成正比，与意图数量无关），
+  对所有命中的类别打分（命中关键词的长度之和，越具体的关键词权重越高），按得分排序
+- 编译结果序列化为 <persist_dir>/keyword_index.json（首行为头信息），由 knowledge_builder 在构建时生成；
+  各前端用 load_keyword_engine 加载，文件不存在或与 knowledge_source 当前内容不一致时重新编译
+
+关键词与问题都经 query_normalizer.normalize_query 规范化（全角/半角、繁简、大小写）。
+"""
+import glob
+import json
+import os
+import re
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from kb_manifest import sha256_text
+from query_normalizer import normalize_query
+
+KEYWORD_INDEX_FILENAME = "keyword_index.json"
+INTENTS_FILENAME = "intents.json"
+
+# 段落标题作为关键词时的最短长度，过短的标题（如「注意」）太泛
+MIN_HEADING_LENGTH = 4
+
+_HEADING = re.compile(r"^\s*([^：:\n]{%d,30})[：:]" % MIN_HEADING_LENGTH)
+_PARAGRAPH = re.compile(r"\n\s*\n")
+
+
+def keyword_index_path(persist_dir: str) -> str:
+    return os.path.join(persist_dir, KEYWORD_INDEX_FILENAME)
+
+
+def intents_from_source(source_dir: str = "./knowledge_source") -> List[Dict[str, Any]]:
+    """读取 knowledge_source，返回意图列表 [{"name", "keywords", "answer", "source"}, ...]。"""
+    intents: List[Dict[str, Any]] = []
+    curated = os.path.join(source_dir, INTENTS_FILENAME)
+    if os.path.exists(curated):
+        with open(curated, "r", encoding="utf-8") as f:
+            for name, info in json.load(f).items():
+                intents.append({
+                    "name": name, "keywords": list(info["keywords"]), "answer": info["answer"], "source": INTENTS_FILENAME,
+                })
+
+    for fp in sorted(glob.glob(os.path.join(source_dir, "**", "*.txt"), recursive=True)):
+        source = os.path.relpath(fp, start=source_dir)
+        with open(fp, "r", encoding="utf-8") as f:
+            text = f.read()
+        for para in _PARAGRAPH.split(text):
+            m = _HEADING.match(para)
+            if m:
+                heading = m.group(1).strip()
+                intents.append({"name": f"{source}#{heading}", "keywords": [heading], "answer": para.strip(), "source": source})
+    return intents
+
+
+class KeywordAutomaton:
+    def __init__(self):
+        self.intents: List[Dict[str, Any]] = []  # {"name", "answer", "source"}
+        self.keywords: List[Tuple[str, int]] = []  # (关键词, 意图下标)
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[int]] = [[]]  # 在该节点结束的关键词下标
+        self.dict_link: List[int] = [0]  # 失败链上最近的、有输出的节点（0 表示没有）
+        self.header: Dict[str, Any] = {}
+        self.by_name: Dict[str, int] = {}  # 意图名 -> 下标（同名时取第一个）
+
+    def _index_names(self) -> None:
+        self.by_name = {}
+        for i, intent in enumerate(self.intents):
+            self.by_name.setdefault(intent["name"], i)
+
+    @classmethod
+    def build(cls, intents: List[Dict[str, Any]]) -> "KeywordAutomaton":
+        ac = cls()
+        seen = set()
+        for i, intent in enumerate(intents):
+            ac.intents.append({k: intent.get(k) for k in ("name", "answer", "source")})
+            for keyword in intent["keywords"]:
+                keyword = normalize_query(keyword)
+                if not keyword or (keyword, i) in seen:
+                    continue
+                seen.add((keyword, i))
+                ac._insert(keyword, len(ac.keywords))
+                ac.keywords.append((keyword, i))
+        ac._link()
+        ac._index_names()
+        return ac
+
+    def _insert(self, keyword: str, kw_id: int) -> None:
+        node = 0
+        for ch in keyword:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+                self.dict_link.append(0)
+            node = nxt
+        self.out[node].append(kw_id)
+
+    def _link(self) -> None:
+        """按层（BFS）计算失败指针与输出链接。"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[child] = target if target != child else 0
+                self.dict_link[child] = self.fail[child] if self.out[self.fail[child]] else self.dict_link[self.fail[child]]
+                queue.append(child)
+
+    def find(self, text: str) -> List[int]:
+        """扫描一遍文本，返回命中的关键词下标（去重）。"""
+        goto, fail, out, dict_link = self.goto, self.fail, self.out, self.dict_link
+        hits = set()
+        node = 0
+        for ch in normalize_query(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            m = node if out[node] else dict_link[node]
+            while m:
+                hits.update(out[m])
+                m = dict_link[m]
+        return sorted(hits)
+
+    def rank(self, text: str) -> List[Tuple[int, float, List[str]]]:
+        """对所有命中的意图打分，返回 [(意图下标, 得分, 命中的关键词), ...]，按得分降序（同分按意图表顺序）。"""
+        scores: Dict[int, float] = {}
+        matched: Dict[int, List[str]] = {}
+        for kw_id in self.find(text):
+            keyword, intent = self.keywords[kw_id]
+            scores[intent] = scores.get(intent, 0.0) + len(keyword)
+            matched.setdefault(intent, []).append(keyword)
+        ranked = sorted(scores, key=lambda i: (-scores[i], i))
+        return [(i, scores[i], matched[i]) for i in ranked]
+
+    def match(self, text: str) -> List[Tuple[str, float, List[str]]]:
+        """同 rank()，但返回意图名：[(意图名, 得分, 命中的关键词), ...]。"""
+        return [(self.intents[i]["name"], score, keywords) for i, score, keywords in self.rank(text)]
+
+    def answer(self, text: str) -> Optional[str]:
+        """得分最高的意图的答案，没有命中时返回 None。"""
+        ranked = self.rank(text)
+        return self.intents[ranked[0][0]]["answer"] if ranked else None
+
+    def intent(self, name: str) -> Dict[str, Any]:
+        return self.intents[self.by_name[name]]
+
+    def save(self, path: str, header: Optional[Dict[str, Any]] = None) -> None:
+        self.header = header or {}
+        data = {
+            "intents": self.intents,
+            "keywords": self.keywords,
+            "goto": self.goto,
+            "fail": self.fail,
+            "out": self.out,
+            "dict_link": self.dict_link,
+        }
+        # 首行为头信息，与 bm25_index.json 格式一致
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.header, ensure_ascii=False) + "\n")
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @staticmethod
+    def read_header(path: str) -> Dict[str, Any]:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.loads(f.readline())
+
+    @classmethod
+    def load(cls, path: str) -> "KeywordAutomaton":
+        with open(path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            data = json.load(f)
+        ac = cls()
+        ac.header = header
+        ac.intents = data["intents"]
+        ac.keywords = [tuple(k) for k in data["keywords"]]
+        ac.goto = data["goto"]
+        ac.fail = data["fail"]
+        ac.out = data["out"]
+        ac.dict_link = data["dict_link"]
+        ac._index_names()
+        return ac
+
+
+def source_signature(intents: List[Dict[str, Any]]) -> str:
+    """意图表的内容哈希，用于判断已保存的自动机是否过期。"""
+    return sha256_text(json.dumps(intents, ensure_ascii=False, sort_keys=True))
+
+
+def export_keyword_index(source_dir: str, path: str) -> Tuple[int, bool]:
+    """从 knowledge_source 编译关键词自动机并保存；意图表未变时跳过。返回 (意图数, 是否重新生成)。"""
+    intents = intents_from_source(source_dir)
+    signature = source_signature(intents)
+    if os.path.exists(path) and KeywordAutomaton.read_header(path).get("signature") == signature:
+        return len(intents), False
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    KeywordAutomaton.build(intents).save(path, header={"signature": signature, "intents": len(intents)})
+    return len(intents), True
+
+
+def load_keyword_engine(
+    persist_dir: Optional[str] = None, source_dir: str = "./knowledge_source"
+) -> KeywordAutomaton:
+    """加载构建时生成的自动机（默认目录为环境变量 RAG_PERSIST_DIR 或 ./chroma_db）。
+
+    source_dir 存在时先比较已保存的签名与其当前内容，不一致（如修改了 intents.json 但未重新构建）时重新编译并保存；
+    文件不存在时直接从 source_dir 编译。
+    """
+    persist_dir = persist_dir or os.environ.get("RAG_PERSIST_DIR", "./chroma_db")
+    path = keyword_index_path(persist_dir)
+    if not os.path.isdir(source_dir):
+        return KeywordAutomaton.load(path) if os.path.exists(path) else KeywordAutomaton.build([])
+    intents = intents_from_source(source_dir)
+    signature = source_signature(intents)
+    if os.path.exists(path):
+        if KeywordAutomaton.read_header(path).get("signature") == signature:
+            return KeywordAutomaton.load(path)
+        print(f"关键词索引 {path} 与 {source_dir} 的内容不一致，重新编译")
+    ac = KeywordAutomaton.build(intents)
+    if os.path.isdir(persist_dir):
+        ac.save(path, header={"signature": signature, "intents": len(intents)})
+    return ac
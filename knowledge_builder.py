@@ -4,111 +4,252 @@ knowledge_builder.py
 构建本地知识库脚本：
 - 读取 ./knowledge_source 目录下的所有 .txt 文件
 - 使用 RecursiveCharacterTextSplitter 分割（chunk_size=500, chunk_overlap=50）
-- 使用 OpenAI 的 embedding 模型（text-embedding-3-small）将文本块编码
+- 使用 OpenAI 的 embedding 模型（text-embedding-3-small）将文本块编码，
+  经本地嵌入缓存（embedding_cache.py）去重，未变的文本块不会重复调用 API；
+  缓存未命中的文本按批并发嵌入（embedding_pipeline.py），支持 429 退避与每分钟 token 预算；
+  也可设置 EMBEDDING_BACKEND=local 使用纯本地嵌入（embedding_backends.py），无需网络
 - 将向量和文本持久化到 ChromaDB（目录 ./chroma_db）
-
-注意：请事先设置环境变量 OPENAI_API_KEY（在 Windows PowerShell 中：$Env:OPENAI_API_KEY="your_key"）
+- 增量构建：在持久化目录中保存清单（每个文件、每个文本块的 sha256），
+  再次运行时只嵌入新增或改动的文本块，并删除已移除文件或已缩短文件多出的文本块
+- 读取与切分可选多进程模式（split_workers > 1），输出与单进程完全一致（来源、块序号与顺序）
+- 流式写入：读取 -> 切分 -> 嵌入 -> 写入按固定大小批次进行，内存占用不随语料增长；
+  每写完一个文件记录检查点，中断后再次运行从断点继续
+- 可选导出 NumPy 内存映射向量索引（numpy_index.py），供 RAGChain 替代 Chroma 加载
+- 生成字符二元/三元组 BM25 倒排索引（bm25_index.py），供 RAGChain 做混合检索；增量构建时只更新变化的文本块
+- 把 intents.json 与各文件的段落标题编译成关键词自动机（keyword_engine.py），供各前端的规则问答使用
+
+注意：使用 OpenAI 嵌入时请事先设置环境变量 OPENAI_API_KEY（在 Windows PowerShell 中：$Env:OPENAI_API_KEY="your_key"）
 """
 import os
 import glob
-from typing import List
+import json
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings import OpenAIEmbeddings
-from langchain.schema import Document
 from langchain.vectorstores import Chroma
 
-
-def build_knowledge_base(
-    source_dir: str = "./knowledge_source",
-    persist_dir: str = "./chroma_db",
-    embedding_model: str = "text-embedding-3-small",
-    collection_name: str = "campus",
-    chunk_size: int = 500,
-    chunk_overlap: int = 50,
-):
-    """构建知识库并持久化到 ChromaDB。包含重复构建检查。
-
-    如果 persist_dir 存在且非空，则默认跳过构建以避免重复。
+from embedding_backends import (
+    DEFAULT_LOCAL_DIM,
+    LocalHashEmbeddings,
+    fit_idf,
+    idf_path,
+    resolve_backend,
+    save_idf,
+)
+from embedding_cache import with_embedding_cache
+from bm25_index import BM25Index, bm25_index_path
+from embedding_pipeline import BatchEmbedder
+from keyword_engine import export_keyword_index, keyword_index_path
+from numpy_index import META_FILENAME, NumpyIndexWriter, default_index_dir
+from kb_manifest import (
+    append_checkpoint,
+    chunk_id,
+    clear_checkpoint,
+    load_checkpoint,
+    kb_version,
+    load_manifest,
+    open_checkpoint,
+    remove_manifest,
+    save_manifest,
+    sha256_text,
+)
+
+# 紧凑的切分结果：(来源相对路径, 文件 sha256, 文本块列表)；文件未变时文本块列表为 None
+SplitRecord = Tuple[str, str, Optional[List[str]]]
+
+_splitters: Dict[Tuple[int, int], RecursiveCharacterTextSplitter] = {}
+
+
+def split_source_file(
+    fp: str,
+    source_dir: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    known_hash: Optional[str] = None,
+) -> SplitRecord:
+    """读取并切分单个文件。单进程与多进程模式共用此函数，保证输出一致。
+
+    known_hash 与文件当前哈希相同时不再切分（返回的文本块列表为 None）。
     """
-
-    # 检查 OPENAI_API_KEY
-    if not os.environ.get("OPENAI_API_KEY"):
-        raise EnvironmentError(
-            "请先设置环境变量 OPENAI_API_KEY，例如：在 PowerShell 中运行：$Env:OPENAI_API_KEY=\"your_key\""
-        )
-
-    # 简单的去重 / 跳过逻辑：如果持久化目录存在且非空，则认为已经构建过
-    if os.path.exists(persist_dir) and any(os.scandir(persist_dir)):
-        print(f"检测到持久化目录 {persist_dir} 非空，已跳过构建（避免重复）。若要强制重建请删除该目录。")
+    source = os.path.relpath(fp, start=source_dir)
+    with open(fp, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    file_hash = sha256_text(text)
+    if known_hash == file_hash:
+        return source, file_hash, None
+
+    key = (chunk_size, chunk_overlap)
+    if key not in _splitters:
+        # 每个进程只创建一次切分器
+        _splitters[key] = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    # 空文件不产生文本块
+    chunks = _splitters[key].split_text(text) if text.strip() else []
+    return source, file_hash, chunks
+
+
+def _split_task(args) -> SplitRecord:
+    return split_source_file(*args)
+
+
+def read_and_split(
+    files: List[str],
+    source_dir: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    known_hashes: Optional[Dict[str, str]] = None,
+    workers: int = 0,
+) -> Iterator[SplitRecord]:
+    """按 files 顺序产出每个文件的切分结果。
+
+    workers <= 1 时在当前进程串行处理；否则把文件列表分片交给进程池，
+    按输入顺序收集结果，因此两种模式的输出完全相同。
+    """
+    known_hashes = known_hashes or {}
+    tasks = [
+        (fp, source_dir, chunk_size, chunk_overlap, known_hashes.get(os.path.relpath(fp, start=source_dir)))
+        for fp in files
+    ]
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _split_task(task)
         return
 
-    # 收集文本文件
-    pattern = os.path.join(source_dir, "**", "*.txt")
-    files = glob.glob(pattern, recursive=True)
-    if not files:
-        raise FileNotFoundError(f"在 {source_dir} 中未找到任何 .txt 文件，请确保存在知识源。")
+    # 按窗口提交，避免一次性把所有文件的切分结果堆在内存里；
+    # 每个分片包含若干文件以减少进程间通信，map 保证结果顺序与输入一致
+    window = workers * 16
+    shard = max(1, window // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(tasks), window):
+            yield from pool.map(_split_task, tasks[start:start + window], chunksize=shard)
 
-    print(f"找到 {len(files)} 个文本文件，开始构建知识片段...")
 
-    # 读取并切分
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size, chunk_overlap=chunk_overlap
-    )
+class _ChunkBatchWriter:
+    """把待写入的文本块攒成固定大小的批次嵌入并写入集合。
+
+    某个文件的全部文本块都写入后，才把该文件记入检查点，中断后可从检查点继续。
+    """
 
-    documents: List[Document] = []
-    for fp in files:
-        with open(fp, "r", encoding="utf-8") as f:
-            text = f.read()
-        # 跳过空文件
-        if not text.strip():
-            continue
-
-        splits = splitter.split_text(text)
-        for i, chunk in enumerate(splits):
-            metadata = {"source": os.path.relpath(fp, start=source_dir), "chunk": i}
-            documents.append(Document(page_content=chunk, metadata=metadata))
-
-    print(f"切分得到 {len(documents)} 个段落，开始生成向量并写入 ChromaDB...")
-
-    # 嵌入器
-    embeddings = OpenAIEmbeddings(model=embedding_model)
-
-    # 将 documents 写入 ChromaDB（持久化）
-    chroma = Chroma.from_documents(
-        documents,
-        embeddings,
-        persist_directory=persist_dir,
-        collection_name=collection_name,
+    def __init__(self, chroma, batch_size: int, checkpoint_file):
+        self.chroma = chroma
+        self.batch_size = max(1, batch_size)
+        self.checkpoint_file = checkpoint_file
+        self.pending: List[Tuple[str, int, str]] = []  # (source, chunk 序号, 文本)
+        self.remaining: Dict[str, int] = {}  # source -> 尚未写入的块数
+        self.infos: Dict[str, Dict] = {}
+        self.written = 0
+        self.written_ids: List[str] = []  # 供 BM25 索引增量更新
+
+    def add_file(self, source: str, info: Dict, chunks: List[Tuple[int, str]], stale_ids: List[str]) -> None:
+        if stale_ids:
+            self.chroma.delete(ids=stale_ids)
+        self.infos[source] = info
+        self.remaining[source] = len(chunks)
+        self.pending.extend((source, i, chunk) for i, chunk in chunks)
+        if not chunks:
+            self._complete(source)
+        while len(self.pending) >= self.batch_size:
+            self._write(self.pending[:self.batch_size])
+            self.pending = self.pending[self.batch_size:]
+
+    def flush(self) -> None:
+        if self.pending:
+            self._write(self.pending)
+            self.pending = []
+
+    def _write(self, batch: List[Tuple[str, int, str]]) -> None:
+        # add_texts 以 upsert 方式写入，相同 ID 的旧块会被覆盖
+        self.chroma.add_texts(
+            [chunk for _, _, chunk in batch],
+            metadatas=[{"source": source, "chunk": i} for source, i, _ in batch],
+            ids=[chunk_id(source, i) for source, i, _ in batch],
+        )
+        self.written += len(batch)
+        self.written_ids.extend(chunk_id(source, i) for source, i, _ in batch)
+        print(f"已写入 {self.written} 个段落...")
+        for source, _, _ in batch:
+            self.remaining[source] -= 1
+            if self.remaining[source] == 0:
+                self._complete(source)
+
+    def _complete(self, source: str) -> None:
+        append_checkpoint(self.checkpoint_file, source, self.infos.pop(source))
+        del self.remaining[source]
+
+
+def _iter_collection_pages(chroma, include: List[str], page_size: int = 1000) -> Iterator[Dict]:
+    """分页读取整个 Chroma 集合，避免一次性载入全部文本和向量。"""
+    offset = 0
+    while True:
+        page = chroma.get(include=include, limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+def export_numpy_index(
+    chroma,
+    out_dir: str,
+    dtype: str = "float16",
+    header: Optional[Dict] = None,
+    page_size: int = 1000,
+) -> int:
+    """把 Chroma 集合分页导出为 NumPy 内存映射索引，返回导出的条数。"""
+    count = chroma._collection.count()
+    writer = None
+    for page in _iter_collection_pages(chroma, ["embeddings", "documents", "metadatas"], page_size):
+        if writer is None:
+            dim = len(page["embeddings"][0])
+            writer = NumpyIndexWriter(out_dir, count, dim, dtype=dtype, header=header)
+        writer.add(page["ids"], page["embeddings"], page["documents"], page["metadatas"])
+    if writer is None:
+        raise ValueError("集合为空，无法导出 NumPy 索引。")
+    writer.close()
+    return count
+
+
+def export_bm25_index(chroma, path: str, header: Optional[Dict] = None, page_size: int = 1000) -> int:
+    """根据集合中的全部文本块构建 BM25 倒排索引（字符二元、三元组）并保存，返回文档数。"""
+    docs = (
+        (doc_id, text, meta)
+        for page in _iter_collection_pages(chroma, ["documents", "metadatas"], page_size)
+        for doc_id, text, meta in zip(page["ids"], page["documents"], page["metadatas"])
     )
-    # 持久化到磁盘
-    chroma.persist()
+    index = BM25Index.build(docs)
+    index.save(path, header=header)
+    return len(index)
 
-    print("知识库构建完成并持久化到:", persist_dir)
 
+def update_bm25_index(
+    chroma, path: str, removed_ids: List[str], written_ids: List[str],
+    header: Optional[Dict] = None, page_size: int = 1000,
+) -> int:
+    """在已有的 BM25 索引上只处理变化的文本块：删除 removed_ids 与 written_ids 的旧版本，
+    再按 ID 分页从集合取回 written_ids 的文本加入索引。返回索引中的文档数。"""
+    index = BM25Index.load(path)
+    index.remove(set(removed_ids) | set(written_ids))
+    for start in range(0, len(written_ids), page_size):
+        page = chroma.get(ids=written_ids[start:start + page_size], include=["documents", "metadatas"])
+        index.add(zip(page["ids"], page["documents"], page["metadatas"]))
+    index.save(path, header=header)
+    return len(index)
 
-if __name__ == "__main__":
-    # 直接运行脚本时构建知识库
-    build_knowledge_base()
-"""
-knowledge_builder.py
 
-构建本地知识库脚本：
-- 读取 ./knowledge_source 目录下的所有 .txt 文件
-- 使用 RecursiveCharacterTextSplitter 分割（chunk_size=500, chunk_overlap=50）
-- 使用 OpenAI 的 embedding 模型（text-embedding-3-small）将文本块编码
-- 将向量和文本持久化到 ChromaDB（目录 ./chroma_db）
+def _numpy_index_version(out_dir: str) -> Optional[str]:
+    path = os.path.join(out_dir, META_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.loads(f.readline()).get("kb_version")
 
-注意：请事先设置环境变量 OPENAI_API_KEY（在 Windows PowerShell 中：$Env:OPENAI_API_KEY="your_key"）
-"""
-import os
-import glob
-from typing import List
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.schema import Document
-from langchain.vectorstores import Chroma
+def _bm25_index_version(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    return BM25Index.read_header(path).get("kb_version")
 
 
 def build_knowledge_base(
@@ -118,67 +259,203 @@ def build_knowledge_base(
     collection_name: str = "campus",
     chunk_size: int = 500,
     chunk_overlap: int = 50,
-):
-    """构建知识库并持久化到 ChromaDB。包含重复构建检查。
-
-    如果 persist_dir 存在且非空，则默认跳过构建以避免重复。
+    force: bool = False,
+    embed_batch_size: int = 64,
+    embed_workers: int = 4,
+    tokens_per_minute: Optional[int] = None,
+    split_workers: int = 0,
+    upsert_batch_size: int = 256,
+    embedding_backend: Optional[str] = None,
+    numpy_index_dir: Optional[str] = None,
+    numpy_dtype: str = "float16",
+) -> Dict[str, int]:
+    """构建知识库并持久化到 ChromaDB，按内容哈希增量更新。
+
+    返回统计：{"added": 新增块数, "updated": 更新块数, "removed": 删除块数, "unchanged": 未变块数}。
+    force=True、没有清单（旧版本构建的目录）或嵌入模型变化时，清空集合后全量重建。
+    embed_batch_size / embed_workers / tokens_per_minute 控制嵌入请求的批大小、并发数与每分钟 token 预算。
+    split_workers > 1 时使用多进程读取与切分（大量或大型源文件时使用）。
+    文本块按 upsert_batch_size 一批批嵌入并写入；构建中断后再次运行会从检查点继续。
+    embedding_backend 为 "local" 时使用本地嵌入器（忽略 embedding_model），默认读取环境变量 EMBEDDING_BACKEND。
+    numpy_index_dir 非空时，构建后把集合导出为 NumPy 向量索引（numpy_dtype 为 float16 或 float32），
+    索引已是当前知识库版本时跳过导出。
     """
 
+    backend = resolve_backend(embedding_backend)
     # 检查 OPENAI_API_KEY
-    if not os.environ.get("OPENAI_API_KEY"):
+    if backend == "openai" and not os.environ.get("OPENAI_API_KEY"):
         raise EnvironmentError(
             "请先设置环境变量 OPENAI_API_KEY，例如：在 PowerShell 中运行：$Env:OPENAI_API_KEY=\"your_key\""
         )
 
-    # 简单的去重 / 跳过逻辑：如果持久化目录存在且非空，则认为已经构建过
-    if os.path.exists(persist_dir) and any(os.scandir(persist_dir)):
-        print(f"检测到持久化目录 {persist_dir} 非空，已跳过构建（避免重复）。若要强制重建请删除该目录。")
-        return
-
-    # 收集文本文件
+    # 收集文本文件（排序保证块顺序与 ID 稳定）
     pattern = os.path.join(source_dir, "**", "*.txt")
-    files = glob.glob(pattern, recursive=True)
+    files = sorted(glob.glob(pattern, recursive=True))
     if not files:
         raise FileNotFoundError(f"在 {source_dir} 中未找到任何 .txt 文件，请确保存在知识源。")
 
-    print(f"找到 {len(files)} 个文本文件，开始构建知识片段...")
+    print(f"找到 {len(files)} 个文本文件，开始比对知识片段...")
+
+    if backend == "local":
+        # 本地嵌入：IDF 首次构建（或强制重建）时统计并固定下来，模型名中带有 IDF 摘要
+        if force or not os.path.exists(idf_path(persist_dir)):
+            print("统计本地嵌入器的 IDF...")
+            texts = (
+                chunk
+                for _, _, chunks in read_and_split(files, source_dir, chunk_size, chunk_overlap, workers=split_workers)
+                for chunk in chunks
+            )
+            save_idf(persist_dir, fit_idf(texts, dim=int(os.environ.get("LOCAL_EMBEDDING_DIM", DEFAULT_LOCAL_DIM))))
+        embedder = None
+        embeddings = LocalHashEmbeddings.load(persist_dir)
+        embedding_model = embeddings.model_name
+    else:
+        # 嵌入器：缓存 -> 并发批量嵌入 -> OpenAI（429 重试由 BatchEmbedder 负责，关闭底层重试）
+        embedder = BatchEmbedder(
+            OpenAIEmbeddings(model=embedding_model, max_retries=0),
+            batch_size=embed_batch_size,
+            max_workers=embed_workers,
+            tokens_per_minute=tokens_per_minute,
+        )
+        embeddings = with_embedding_cache(embedder, embedding_model)
+
+    params = {"embedding_model": embedding_model, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    manifest = None if force else load_manifest(persist_dir, collection_name)
+    checkpoint = None if force else load_checkpoint(persist_dir, params, collection_name)
+
+    chroma = Chroma(persist_directory=persist_dir, embedding_function=embeddings, collection_name=collection_name)
+
+    # known_hashes：切分参数与当前一致、可以按文件哈希直接跳过的文件
+    if manifest is not None and manifest["params"].get("embedding_model") == embedding_model:
+        old_files: Dict[str, Dict] = dict(manifest["files"])
+        known_hashes = {s: info["sha256"] for s, info in old_files.items()} if manifest["params"] == params else {}
+        # 集合只会在这一版本的基础上增量变化，BM25 索引是这一版本时可以增量更新
+        base_version = manifest.get("version") if checkpoint is None else None
+    elif checkpoint is not None:
+        # 上次全量重建中途中断：集合里已有检查点记录的文件，不能清空
+        print("检测到未完成的全量重建，从检查点继续。")
+        old_files, known_hashes = {}, {}
+        base_version = None
+    else:
+        # 旧集合中的块 ID 无法与清单对应（或向量来自其他模型），只能清空后全量重建
+        print("未找到可用的构建清单（或嵌入模型已变化），将全量重建集合。")
+        # 先删除旧清单再清空集合：重建中断后，下次运行只能依据检查点继续，
+        # 不会把旧清单里的文件当作未变而跳过（集合里已经没有这些块）
+        remove_manifest(persist_dir, collection_name)
+        chroma.delete_collection()
+        chroma = Chroma(persist_directory=persist_dir, embedding_function=embeddings, collection_name=collection_name)
+        old_files, known_hashes = {}, {}
+        base_version = None
+
+    # 检查点中的文件已按当前参数写入集合，视同清单中的最新状态
+    if checkpoint:
+        print(f"检查点中已有 {len(checkpoint)} 个文件写入完成，将直接跳过。")
+        old_files.update(checkpoint)
+        known_hashes.update({s: info["sha256"] for s, info in checkpoint.items()})
+
+    stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+    new_files: Dict[str, Dict] = {}
+    removed_ids: List[str] = []
+    ckpt_file = open_checkpoint(persist_dir, params, collection_name, resume=checkpoint is not None)
+    writer = _ChunkBatchWriter(chroma, upsert_batch_size, ckpt_file)
+
+    # 流水线：读取/切分（逐文件产出）-> 与清单比对 -> 固定大小批次嵌入并写入，内存占用与语料规模无关
+    try:
+        for source, file_hash, splits in read_and_split(
+            files, source_dir, chunk_size, chunk_overlap, known_hashes, workers=split_workers
+        ):
+            old = old_files.get(source)
+            # 文件内容与切分参数都未变：整个文件跳过
+            if splits is None:
+                new_files[source] = old
+                stats["unchanged"] += len(old["chunks"])
+                continue
+
+            hashes = [sha256_text(chunk) for chunk in splits]
+            old_hashes = old["chunks"] if old else []
+
+            changed_chunks = []
+            for i, (chunk, h) in enumerate(zip(splits, hashes)):
+                if i < len(old_hashes) and old_hashes[i] == h:
+                    stats["unchanged"] += 1
+                    continue
+                stats["added" if i >= len(old_hashes) else "updated"] += 1
+                changed_chunks.append((i, chunk))
+
+            # 文件变短：多出来的旧块需要删除
+            stale_ids = [chunk_id(source, i) for i in range(len(splits), len(old_hashes))]
+            stats["removed"] += len(stale_ids)
+            removed_ids.extend(stale_ids)
+
+            new_files[source] = {"sha256": file_hash, "chunks": hashes}
+            writer.add_file(source, new_files[source], changed_chunks, stale_ids)
+
+        writer.flush()
+    finally:
+        ckpt_file.close()
+
+    # 已删除的源文件：删除其全部文本块
+    delete_ids = [
+        chunk_id(source, i)
+        for source, old in old_files.items() if source not in new_files
+        for i in range(len(old["chunks"]))
+    ]
+    if delete_ids:
+        chroma.delete(ids=delete_ids)
+    stats["removed"] += len(delete_ids)
+    removed_ids.extend(delete_ids)
+
+    if writer.written and embedder is not None:
+        t = embedder.throughput()
+        print(
+            f"嵌入完成：缓存命中 {embeddings.hits} 块，请求 {t['chunks']} 块 / {t['tokens']} tokens，"
+            f"耗时 {t['seconds']}s（{t['chunks_per_s']} 块/秒，{t['tokens_per_s']} tokens/秒，重试 {t['retries']} 次）"
+        )
 
-    # 读取并切分
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    changed = (
+        writer.written or stats["removed"] or manifest is None
+        or manifest["params"] != params or checkpoint is not None
     )
+    if changed:
+        # 持久化到磁盘，再写清单（写入成功后才记录新状态），最后删除检查点
+        chroma.persist()
+        save_manifest(persist_dir, {"params": params, "files": new_files}, collection_name)
+    clear_checkpoint(persist_dir, collection_name)
+
+    version = kb_version(persist_dir, collection_name)
+    bm25_path = bm25_index_path(persist_dir)
+    bm25_version = _bm25_index_version(bm25_path)
+    if bm25_version != version:
+        if base_version is not None and bm25_version == base_version:
+            n = update_bm25_index(chroma, bm25_path, removed_ids, writer.written_ids, header={"kb_version": version})
+            print(
+                f"已增量更新 BM25 倒排索引（删除 {len(removed_ids)}、写入 {len(writer.written_ids)} 个文本块，"
+                f"共 {n} 个）：{bm25_path}"
+            )
+        else:
+            n = export_bm25_index(chroma, bm25_path, header={"kb_version": version})
+            print(f"已生成 BM25 倒排索引（{n} 个文本块）：{bm25_path}")
+    keyword_path = keyword_index_path(persist_dir)
+    n, rebuilt = export_keyword_index(source_dir, keyword_path)
+    if rebuilt:
+        print(f"已生成关键词自动机（{n} 个意图）：{keyword_path}")
+    if numpy_index_dir and _numpy_index_version(numpy_index_dir) != version:
+        n = export_numpy_index(
+            chroma,
+            numpy_index_dir,
+            dtype=numpy_dtype,
+            header={"kb_version": version, "embedding_model": embedding_model},
+        )
+        print(f"已导出 NumPy 向量索引（{n} 条，{numpy_dtype}）到：{numpy_index_dir}")
 
-    documents: List[Document] = []
-    for fp in files:
-        with open(fp, "r", encoding="utf-8") as f:
-            text = f.read()
-        # 跳过空文件
-        if not text.strip():
-            continue
-
-        splits = splitter.split_text(text)
-        for i, chunk in enumerate(splits):
-            metadata = {"source": os.path.relpath(fp, start=source_dir), "chunk": i}
-            documents.append(Document(page_content=chunk, metadata=metadata))
-
-    print(f"切分得到 {len(documents)} 个段落，开始生成向量并写入 ChromaDB...")
-
-    # 嵌入器
-    embeddings = OpenAIEmbeddings(model=embedding_model)
-
-    # 将 documents 写入 ChromaDB（持久化）
-    chroma = Chroma.from_documents(
-        documents,
-        embeddings,
-        persist_directory=persist_dir,
-        collection_name=collection_name,
+    print(
+        f"知识库构建完成（{persist_dir}）：新增 {stats['added']}，更新 {stats['updated']}，"
+        f"删除 {stats['removed']}，未变 {stats['unchanged']}"
     )
-    # 持久化到磁盘
-    chroma.persist()
-
-    print("知识库构建完成并持久化到:", persist_dir)
+    return stats
 
 
 if __name__ == "__main__":
-    # 直接运行脚本时构建知识库
-    build_knowledge_base()
+    # 直接运行脚本时构建知识库；设置 RAG_VECTOR_STORE=numpy 时同时导出 NumPy 向量索引
+    export_numpy = os.environ.get("RAG_VECTOR_STORE", "").lower() == "numpy"
+    build_knowledge_base(numpy_index_dir=default_index_dir("./chroma_db") if export_numpy else None)
@@ -1,62 +1,218 @@
 """
 main.py
 
-FastAPI 后端，暴露 /ask POST 接口：接收 {"question": "..."}，返回 {"answer": "...", "source_documents": [...]}
-
-使用 rag_chain.RAGChain 来处理请求。
+FastAPI 后端，使用 rag_chain_clean.RAGChain 处理请求（知识库目录可用 RAG_PERSIST_DIR 覆盖）：
+- POST /ask、/ask/stream（SSE）、/ask/batch：问答
+- GET /healthz、/readyz、/version、/stats、/metrics：存活与就绪检查、知识库版本、统计与 Prometheus 指标
 
 运行示例（在项目根目录下）：
     uvicorn main:app --host 0.0.0.0 --port 8000 --reload
 
 注意：请先确保已经通过 knowledge_builder.py 构建好 ./chroma_db，且设置 OPENAI_API_KEY
 """
+import asyncio
+import json
 import os
-from typing import Dict, Any
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
-from rag_chain_clean import get_rag_chain
+from kb_manifest import kb_version
+
+_process_start = time.perf_counter()
 
 
 class AskRequest(BaseModel):
     question: str
 
 
-app = FastAPI(title="校园引导智能体 API")
+class BatchAskRequest(BaseModel):
+    questions: List[str]
 
-# 在启动时加载 RAGChain 实例（全局复用）
-try:
-    rag = get_rag_chain(persist_dir="./chroma_db")
-except Exception as e:
-    # 记录异常但允许服务启动；在调用 /ask 时会返回错误提示
-    rag = None
-    load_error = str(e)
-else:
-    load_error = None
 
+MAX_BATCH_SIZE = int(os.environ.get("RAG_MAX_BATCH_SIZE", 256))
+PERSIST_DIR = os.environ.get("RAG_PERSIST_DIR", "./chroma_db")
+WARMUP_QUESTION = os.environ.get("RAG_WARMUP_QUESTION", "图书馆开放时间")
+INIT_RETRY_DELAY = float(os.environ.get("RAG_INIT_RETRY_DELAY", 2))
+INIT_RETRY_MAX_DELAY = float(os.environ.get("RAG_INIT_RETRY_MAX_DELAY", 60))
+
+# RAGChain 实例（全局复用），预热成功后才赋值
+rag = None
+load_error = None
+init_state = {"attempts": 0, "cold_start_s": None}
+
+
+def _load_rag():
+    """在后台线程中执行：导入 langchain、加载索引并做一次预热检索。"""
+    t0 = time.perf_counter()
+    from rag_chain_clean import get_rag_chain  # langchain 导入较慢，不放在模块导入路径上
+
+    chain = get_rag_chain(persist_dir=PERSIST_DIR)
+    t1 = time.perf_counter()
+    # 预热：走一遍查询嵌入与向量检索（不调用 LLM），确认索引可用
+    if not chain.retrieve(WARMUP_QUESTION):
+        raise RuntimeError(f"知识库为空（{PERSIST_DIR}），请先运行 knowledge_builder.py 构建")
+    t2 = time.perf_counter()
+    return chain, t1 - t0, t2 - t1
 
-@app.post("/ask")
-async def ask(req: AskRequest) -> Dict[str, Any]:
-    """接收用户问题并返回答案与引用源文档。"""
-    if load_error:
-        raise HTTPException(status_code=500, detail=f"RAG 加载失败：{load_error}")
 
+async def _warm_up() -> None:
+    """加载失败后按指数退避重试（RAG_INIT_RETRY_DELAY 起始秒数，最长 RAG_INIT_RETRY_MAX_DELAY 秒），冷启动耗时打印到日志。"""
+    global rag, load_error
+    delay = INIT_RETRY_DELAY
+    while True:
+        init_state["attempts"] += 1
+        try:
+            chain, load_s, warm_s = await asyncio.to_thread(_load_rag)
+        except Exception as e:
+            # 记录异常并稍后重试；期间 /readyz 返回 503
+            load_error = str(e)
+            print(f"RAG 加载失败（第 {init_state['attempts']} 次）：{e}，{delay:g} 秒后重试")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, INIT_RETRY_MAX_DELAY)
+            continue
+        rag, load_error = chain, None
+        init_state["cold_start_s"] = round(time.perf_counter() - _process_start, 3)
+        print(f"RAG 就绪：加载 {load_s:.2f}s，预热 {warm_s:.2f}s，冷启动共 {init_state['cold_start_s']:.2f}s")
+        return
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时不加载 RAG：服务先绑定端口，再在后台加载；就绪前的问答请求返回 503。"""
+    task = asyncio.create_task(_warm_up())
+    yield
+    task.cancel()
+
+
+app = FastAPI(title="校园引导智能体 API", lifespan=lifespan)
+
+
+def _check_loaded() -> None:
     if rag is None:
-        raise HTTPException(status_code=500, detail="RAG 尚未初始化")
+        detail = "RAG 正在加载，请稍后重试"
+        if load_error:
+            detail += f"（上次加载失败：{load_error}）"
+        raise HTTPException(status_code=503, detail=detail)
+
+
+def _checked_question(req: AskRequest) -> str:
+    _check_loaded()
 
     # 基本输入校验
     question = req.question or ""
     if not question.strip():
         raise HTTPException(status_code=400, detail="问题不能为空")
+    return question
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/ask")
+async def ask(req: AskRequest) -> Dict[str, Any]:
+    """接收用户问题并返回答案与引用源文档。
+
+    mode 为回答方式：extractive（直接摘自知识库原文，未调用 LLM）、llm（模型生成）或 no_answer（未检索到内容）。
+    """
+    question = _checked_question(req)
 
     try:
-        res = rag.ask(question)
+        res = await rag.aask(question)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"内部错误：{e}")
 
-    # 返回 answer 与 source_documents
-    return {"answer": res.get("answer"), "source_documents": res.get("source_documents", [])}
+    # 返回 answer、source_documents 与回答方式
+    return {"answer": res.get("answer"), "source_documents": res.get("source_documents", []), "mode": res.get("mode")}
+
+
+@app.post("/ask/stream")
+async def ask_stream(req: AskRequest) -> StreamingResponse:
+    """以 SSE 流式返回：先发 sources 事件，再逐个发 token 事件，
+    最后发 done 事件（ttft_ms 首 token 时间、total_ms 总耗时、mode 回答方式）；出错时发 error 事件。"""
+    question = _checked_question(req)
+
+    async def events():
+        try:
+            async for event, data in rag.astream(question):
+                yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {"detail": f"内部错误：{e}"})
+
+    # 关闭代理缓冲，保证 token 及时到达前端
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/ask/batch")
+async def ask_batch(req: BatchAskRequest) -> Dict[str, Any]:
+    """批量问答，结果与输入顺序一致；单个问题出错时该项带 error 字段，一次最多 RAG_MAX_BATCH_SIZE（默认 256）个问题。"""
+    _check_loaded()
+    if not req.questions:
+        raise HTTPException(status_code=400, detail="问题列表不能为空")
+    if len(req.questions) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"一次最多 {MAX_BATCH_SIZE} 个问题")
+
+    # 空问题单独标记为错误，其余一起处理
+    valid = [i for i, q in enumerate(req.questions) if (q or "").strip()]
+    answered = await rag.aask_batch([req.questions[i] for i in valid]) if valid else []
+    results: List[Dict[str, Any]] = [{"question": q, "error": "问题不能为空"} for q in req.questions]
+    for i, res in zip(valid, answered):
+        if "error" in res:
+            results[i] = {"question": req.questions[i], "error": f"内部错误：{res['error']}"}
+        else:
+            results[i] = {
+                "question": req.questions[i],
+                "answer": res.get("answer"),
+                "source_documents": res.get("source_documents", []),
+                "mode": res.get("mode"),
+            }
+    return {"results": results}
+
+
+@app.get("/healthz")
+def healthz() -> Dict[str, Any]:
+    """存活检查：进程能响应即可。"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """就绪检查：索引已加载且预热检索成功。"""
+    if rag is None:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "loading", "attempts": init_state["attempts"], "error": load_error},
+        )
+    return {"status": "ready", "cold_start_s": init_state["cold_start_s"]}
+
+
+@app.get("/version")
+def version() -> Dict[str, Any]:
+    """知识库版本：只读清单文件，加载完成前也可调用；前端据此让答案缓存随知识库重建失效。"""
+    return {"version": kb_version(PERSIST_DIR)}
+
+
+@app.get("/stats")
+def stats() -> Dict[str, Any]:
+    """缓存命中与检索路径统计。"""
+    _check_loaded()
+    return rag.stats()
+
+
+@app.get("/metrics")
+def metrics() -> PlainTextResponse:
+    """Prometheus 文本格式的指标；加载完成前只导出 rag_ready。"""
+    body = f"# HELP rag_ready RAG 是否就绪\n# TYPE rag_ready gauge\nrag_ready {0 if rag is None else 1}\n"
+    if rag is not None:
+        body += rag.metrics.render(rag.stats())
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 if __name__ == "__main__":
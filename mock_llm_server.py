@@ -0,0 +1,271 @@
+"""
+mock_llm_server.py
+
+本地替身服务：实现项目用到的 OpenAI 与 DashScope（通义千问）HTTP 接口，用于离线测试与压测重试、流式、并发等逻辑：
+- POST /v1/chat/completions：OpenAI 聊天补全，支持 stream=true 逐 token 推送（SSE，以 data: [DONE] 结束）
+- POST /v1/embeddings：OpenAI 嵌入，向量由字符 n-gram 哈希生成（与 LocalHashEmbeddings 相同），
+  相同文本得到相同向量、相近文本向量相近；支持 dimensions 与 encoding_format=base64
+- POST /api/v1/services/aigc/text-generation/generation：DashScope Generation.call，
+  支持 result_format=message/text，请求头 X-DashScope-SSE: enable 时流式返回（incremental_output 控制增量或累计）
+- GET /stats：各接口请求数与注入的错误数
+
+可配置项（命令行参数）：
+- 延迟分布：--chat-latency（首 token）、--embed-latency，格式 fixed:200、uniform:100,300、normal:200,50、
+  lognormal:200,0.5（中位数毫秒, sigma），单位毫秒；--token-ms 为流式每个 token 的间隔
+- 错误注入：--error-rate（返回 500）、--rate-limit-rate（返回 429，带 Retry-After: --retry-after 秒）；
+  单个请求也可用请求头 X-Mock-Status: 429 / 500 强制返回该状态
+- --seed：回答内容只由输入决定；延迟抖动与错误注入按 --seed 与请求序号确定，同样的请求顺序得到同样的结果
+
+让项目的客户端指向替身服务：
+    python mock_llm_server.py --port 8001 --chat-latency lognormal:400,0.4 --rate-limit-rate 0.05
+    OPENAI_API_BASE=http://127.0.0.1:8001/v1  OPENAI_API_KEY=mock             # RAGChain、knowledge_builder
+    DASHSCOPE_HTTP_BASE_URL=http://127.0.0.1:8001/api/v1  ALIYUN_API_KEY=mock  # aliyun_campus_app
+    python benchmark.py --mock-url http://127.0.0.1:8001
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import random
+import time
+import uuid
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from embedding_backends import LocalHashEmbeddings
+from token_utils import estimate_tokens
+
+# OpenAI 嵌入模型的默认维度
+EMBEDDING_DIMS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """把延迟分布描述解析为采样函数，返回秒。"""
+    spec = (spec or "0").strip()
+    kind, _, params = spec.partition(":")
+    if not params:
+        kind, params = "fixed", kind
+    values = [float(v) for v in params.split(",")]
+    if kind == "fixed":
+        return lambda rng: values[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1])) / 1000
+    if kind == "lognormal":
+        # 参数为中位数（毫秒）与 sigma
+        return lambda rng: rng.lognormvariate(np.log(values[0]), values[1]) / 1000
+    raise ValueError(f"未知的延迟分布：{spec}")
+
+
+class MockBehavior:
+    """延迟与错误注入；每个请求按 (seed, 请求序号) 得到独立、可复现的随机数。"""
+
+    def __init__(self, seed: int = 0, chat_latency: str = "300", embed_latency: str = "50", token_ms: float = 20.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 1.0):
+        self.seed = seed
+        self.chat_latency = parse_latency(chat_latency)
+        self.embed_latency = parse_latency(embed_latency)
+        self.token_seconds = token_ms / 1000
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._counter = itertools.count()
+        self.stats: Dict[str, int] = {}
+
+    def rng(self) -> random.Random:
+        return random.Random(self.seed * 1_000_003 + next(self._counter))
+
+    def count(self, name: str) -> None:
+        self.stats[name] = self.stats.get(name, 0) + 1
+
+    def injected_status(self, request: Request, rng: random.Random) -> Optional[int]:
+        forced = request.headers.get("x-mock-status")
+        if forced:
+            return int(forced)
+        roll = rng.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+
+def _answer_tokens(text: str) -> List[str]:
+    """确定性的回答：由输入哈希与问题摘要组成，按两个字符一个 token 切分。"""
+    digest = zlib.crc32(text.encode("utf-8"))
+    answer = f"（模拟回答 {digest:08x}）关于「{text[-40:].strip()}」，请以学校官方通知为准。"
+    return [answer[i:i + 2] for i in range(0, len(answer), 2)]
+
+
+def _embed(texts: List[str], dim: int) -> np.ndarray:
+    return np.asarray(LocalHashEmbeddings(dim=dim).embed_documents(texts), dtype=np.float32)
+
+
+def create_app(behavior: Optional[MockBehavior] = None) -> FastAPI:
+    behavior = behavior or MockBehavior()
+    app = FastAPI(title="OpenAI / DashScope 本地替身")
+    app.state.behavior = behavior
+
+    def openai_error(status: int) -> JSONResponse:
+        behavior.count(f"injected_{status}")
+        kind = "rate_limit_exceeded" if status == 429 else "server_error"
+        headers = {"Retry-After": str(behavior.retry_after)} if status == 429 else {}
+        body = {"error": {"message": f"mock injected {status}", "type": kind, "code": kind}}
+        return JSONResponse(status_code=status, content=body, headers=headers)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        behavior.count("chat")
+        body = await request.json()
+        rng = behavior.rng()
+        status = behavior.injected_status(request, rng)
+        first = behavior.chat_latency(rng)
+        if status:
+            await asyncio.sleep(first)
+            return openai_error(status)
+
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        tokens = _answer_tokens(prompt)
+        model = body.get("model", "gpt-3.5-turbo")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        usage = {"prompt_tokens": estimate_tokens(prompt), "completion_tokens": len(tokens)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if body.get("stream"):
+            async def events():
+                await asyncio.sleep(first)
+                for i, token in enumerate(tokens):
+                    delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                             "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    await asyncio.sleep(behavior.token_seconds)
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(first + len(tokens) * behavior.token_seconds)
+        return {
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        behavior.count("embeddings")
+        body = await request.json()
+        rng = behavior.rng()
+        status = behavior.injected_status(request, rng)
+        await asyncio.sleep(behavior.embed_latency(rng))
+        if status:
+            return openai_error(status)
+
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        # 客户端可能已按 token 切分（整数列表），此时按 token 序列的字符串形式计算
+        texts = [t if isinstance(t, str) else " ".join(map(str, t)) for t in inputs]
+        model = body.get("model", "text-embedding-3-small")
+        dim = int(body.get("dimensions") or EMBEDDING_DIMS.get(model, 1536))
+        vectors = _embed(texts, dim)
+        as_base64 = body.get("encoding_format") == "base64"
+        data = [{
+            "object": "embedding",
+            "index": i,
+            "embedding": base64.b64encode(v.tobytes()).decode() if as_base64 else v.tolist(),
+        } for i, v in enumerate(vectors)]
+        tokens = sum(estimate_tokens(t) for t in texts)
+        return {"object": "list", "data": data, "model": model, "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.post("/api/v1/services/aigc/text-generation/generation")
+    async def dashscope_generation(request: Request):
+        behavior.count("dashscope")
+        body = await request.json()
+        rng = behavior.rng()
+        status = behavior.injected_status(request, rng)
+        first = behavior.chat_latency(rng)
+        request_id = str(uuid.uuid4())
+        if status:
+            behavior.count(f"injected_{status}")
+            await asyncio.sleep(first)
+            code = "Throttling.RateQuota" if status == 429 else "InternalError"
+            headers = {"Retry-After": str(behavior.retry_after)} if status == 429 else {}
+            return JSONResponse(status_code=status, headers=headers,
+                                content={"code": code, "message": f"mock injected {status}", "request_id": request_id})
+
+        inputs = body.get("input", {})
+        params = body.get("parameters", {})
+        prompt = "\n".join(str(m.get("content", "")) for m in inputs.get("messages", [])) or str(inputs.get("prompt", ""))
+        tokens = _answer_tokens(prompt)
+        as_message = params.get("result_format") == "message"
+        input_tokens = estimate_tokens(prompt)
+
+        def payload(text: str, finish: str, output_tokens: int) -> Dict[str, Any]:
+            if as_message:
+                output = {"choices": [{"finish_reason": finish, "message": {"role": "assistant", "content": text}}]}
+            else:
+                output = {"text": text, "finish_reason": finish}
+            usage = {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+            return {"output": output, "usage": usage, "request_id": request_id}
+
+        streaming = request.headers.get("x-dashscope-sse", "").lower() == "enable" or "text/event-stream" in request.headers.get("accept", "")
+        if streaming:
+            incremental = bool(params.get("incremental_output"))
+
+            async def events():
+                await asyncio.sleep(first)
+                for i, token in enumerate(tokens):
+                    last = i == len(tokens) - 1
+                    text = token if incremental else "".join(tokens[:i + 1])
+                    data = json.dumps(payload(text, "stop" if last else "null", i + 1), ensure_ascii=False)
+                    yield f"id:{i + 1}\nevent:result\n:HTTP_STATUS/200\ndata:{data}\n\n"
+                    if not last:
+                        await asyncio.sleep(behavior.token_seconds)
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(first + len(tokens) * behavior.token_seconds)
+        return payload("".join(tokens), "stop", len(tokens))
+
+    @app.get("/stats")
+    async def stats():
+        return behavior.stats
+
+    return app
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="OpenAI / DashScope 本地替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chat-latency", default="lognormal:300,0.3", help="首 token 延迟分布（毫秒）")
+    parser.add_argument("--embed-latency", default="uniform:30,80", help="嵌入接口延迟分布（毫秒）")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="每个 token 的间隔（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 Retry-After（秒）")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    behavior = MockBehavior(
+        seed=args.seed, chat_latency=args.chat_latency, embed_latency=args.embed_latency, token_ms=args.token_ms,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+    )
+    uvicorn.run(create_app(behavior), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+model_tier.py
+
+通义千问模型分档路由（aliyun_campus_app.py 使用）：
+- choose_tier：根据问题长度、子问题个数与规则引擎的命中程度选择模型档位
+  * 规则命中明确的简短问题直接用规则答案（不调用模型，见 rule_confidence 与 STRONG_MATCH）
+  * 简短的单个问题、规则有部分命中 -> qwen-turbo（最快，规则答案作为参考资料一并传入）
+  * 两个子问题、问题较长或没有命中任何规则（把握不大）-> qwen-plus
+  * 很长或三个及以上子问题 -> qwen-max
+- tier_providers / stream_with_fallback：先调用所选档位的通义千问模型，出错时才换备用提供方（OpenAI）；
+  手动指定模型时不使用备用，保证由所选模型回答
+- TierStats：按档位记录请求数、首字与总耗时（p50/p95）、token 数与估算费用，整个进程共享
+
+问题先经 query_normalizer.normalize_query 规范化后再计算长度与命中程度。
+"""
+import re
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from provider_router import quantile
+from query_normalizer import normalize_query
+
+TIERS = ("qwen-turbo", "qwen-plus", "qwen-max")
+FALLBACK_PROVIDER = "openai/gpt-3.5-turbo"
+
+# 参考价（元 / 千 token：输入, 输出），以阿里云百炼官网为准，价格调整时更新
+PRICES = {
+    "qwen-turbo": (0.0003, 0.0006),
+    "qwen-plus": (0.0008, 0.002),
+    "qwen-max": (0.0024, 0.0096),
+}
+
+SHORT_QUESTION = 30  # 字，超过则至少用 qwen-plus
+LONG_QUESTION = 60  # 字，超过则用 qwen-max
+WEAK_MATCH = 0.25  # 规则命中关键词覆盖问题的比例，低于该值视为没有把握
+STRONG_MATCH = 0.5  # 不低于该值的简短问题直接使用规则答案
+
+# 子问题分隔：句末标点、分号与常见的并列连接词
+_PART_SPLIT = re.compile(r"[？?；;。！!\n]|以及|另外|还有|并且|同时")
+
+
+def count_parts(question: str) -> int:
+    """问题中包含的子问题个数（至少为 1）。"""
+    parts = [p for p in _PART_SPLIT.split(question) if len(p.strip()) >= 2]
+    return max(1, len(parts))
+
+
+def rule_confidence(question: str, matches: List[Tuple[str, float, List[str]]]) -> float:
+    """得分最高的规则意图的命中关键词覆盖了问题的多大比例（0~1）。matches 为 KeywordAutomaton.match 的结果。"""
+    question = normalize_query(question)
+    if not matches or not question:
+        return 0.0
+    return min(1.0, matches[0][1] / len(question))
+
+
+def choose_tier(question: str, matches: List[Tuple[str, float, List[str]]]) -> Dict[str, Any]:
+    """返回 {"tier": 档位（None 表示直接使用规则答案）, "reason": 原因, "confidence", "parts", "length"}。"""
+    normalized = normalize_query(question)
+    length = len(normalized)
+    parts = count_parts(normalized)
+    confidence = rule_confidence(normalized, matches)
+    decision = {"confidence": round(confidence, 2), "parts": parts, "length": length}
+
+    if length > LONG_QUESTION or parts >= 3:
+        return {**decision, "tier": "qwen-max", "reason": f"问题较长或包含 {parts} 个子问题"}
+    if parts >= 2:
+        return {**decision, "tier": "qwen-plus", "reason": "包含两个子问题"}
+    if length > SHORT_QUESTION:
+        return {**decision, "tier": "qwen-plus", "reason": "问题较长"}
+    if confidence < WEAK_MATCH:
+        return {**decision, "tier": "qwen-plus", "reason": "规则未命中，把握不大"}
+    if confidence >= STRONG_MATCH:
+        return {**decision, "tier": None, "reason": "规则命中明确"}
+    return {**decision, "tier": "qwen-turbo", "reason": "简短问题，规则部分命中"}
+
+
+def tier_providers(tier: str, pinned: bool, dashscope: bool = True, fallback: bool = False) -> Tuple[str, ...]:
+    """按调用顺序返回提供方（提供方/模型）。
+
+    dashscope / fallback 表示是否设置了阿里云 / OpenAI 密钥。自动选择档位时 OpenAI 只作为出错时的备用；
+    手动指定模型（pinned）时不加备用。没有阿里云密钥时只能使用 OpenAI。
+    """
+    if not dashscope:
+        return (FALLBACK_PROVIDER,) if fallback else ()
+    if fallback and not pinned:
+        return (f"dashscope/{tier}", FALLBACK_PROVIDER)
+    return (f"dashscope/{tier}",)
+
+
+def stream_with_fallback(
+    providers: Iterable[str],
+    open_stream: Callable[[str], Iterable[str]],
+    on_error: Optional[Callable[[str, Exception], None]] = None,
+) -> Iterator[str]:
+    """依次调用提供方，逐段产出文本。某个提供方在产出任何文本之前出错时换下一个；
+    已经输出部分内容后出错则直接抛出，避免前后两段回答拼在一起。"""
+    last_error: Optional[Exception] = None
+    for name in providers:
+        started = False
+        try:
+            for text in open_stream(name):
+                started = True
+                yield text
+            return
+        except Exception as e:
+            if started:
+                raise
+            last_error = e
+            if on_error is not None:
+                on_error(name, e)
+    if last_error is not None:
+        raise last_error
+    raise RuntimeError("没有可用的模型提供方")
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    """按参考价估算费用（元）；不在价目表中的模型返回 None。"""
+    price = PRICES.get(model)
+    if price is None:
+        return None
+    return (input_tokens * price[0] + output_tokens * price[1]) / 1000
+
+
+class TierStats:
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._tiers: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, tier: str, first_token_s: Optional[float], total_s: float,
+               input_tokens: int, output_tokens: int, cost: Optional[float]) -> None:
+        with self._lock:
+            t = self._tiers.get(tier)
+            if t is None:
+                t = self._tiers[tier] = {
+                    "requests": 0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0,
+                    "first_token": deque(maxlen=self.window), "total": deque(maxlen=self.window),
+                }
+            t["requests"] += 1
+            t["input_tokens"] += input_tokens
+            t["output_tokens"] += output_tokens
+            t["cost"] += cost or 0.0
+            if first_token_s is not None:
+                t["first_token"].append(first_token_s)
+            t["total"].append(total_s)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """各档位的请求数、首字与总耗时 p50/p95（毫秒）、token 数、累计与平均费用（元）。"""
+        out = {}
+        with self._lock:
+            items = [(tier, dict(t), list(t["first_token"]), list(t["total"])) for tier, t in self._tiers.items()]
+        for tier, t, first, total in items:
+            row = {k: t[k] for k in ("requests", "input_tokens", "output_tokens")}
+            row["cost"] = round(t["cost"], 6)
+            row["avg_cost"] = round(t["cost"] / t["requests"], 6) if t["requests"] else 0.0
+            for name, values in (("first_token", first), ("total", total)):
+                for q in (0.5, 0.95):
+                    v = quantile(values, q)
+                    row[f"{name}_p{int(q * 100)}_ms"] = None if v is None else round(v * 1000)
+            out[tier] = row
+        return out
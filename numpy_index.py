@@ -0,0 +1,122 @@
+"""
+numpy_index.py
+
+基于 NumPy 内存映射的向量索引，可替代 Chroma 用于校园知识库检索：
+- vectors.npy：L2 归一化后的嵌入矩阵（float16 或 float32），以 mmap 方式打开，多进程共享页缓存
+- meta.jsonl：紧凑的元数据旁路文件，首行为头信息（数量、维度、嵌入模型、知识库版本），
+  其后每行一个 [id, source, chunk, text]
+- 检索为向量化的 top-k：矩阵-向量乘积 + argpartition，支持一次检索一批查询
+
+由 knowledge_builder 导出，RAGChain 设置 vector_store="numpy" 时加载。
+"""
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+VECTORS_FILENAME = "vectors.npy"
+META_FILENAME = "meta.jsonl"
+# 打分时按块把 float16 向量转换为 float32，避免一次复制整个矩阵
+SCORE_BLOCK_ROWS = 65536
+
+
+def default_index_dir(persist_dir: str) -> str:
+    return os.path.join(persist_dir, "numpy_index")
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+class NumpyIndexWriter:
+    """分批写入索引：向量写入预先分配好的 mmap 文件，元数据逐行追加，内存占用与语料规模无关。"""
+
+    def __init__(self, out_dir: str, count: int, dim: int, dtype: str = "float16", header: Optional[Dict[str, Any]] = None):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.count = count
+        self._vectors_tmp = os.path.join(out_dir, VECTORS_FILENAME + ".tmp")
+        self._meta_tmp = os.path.join(out_dir, META_FILENAME + ".tmp")
+        self._vectors = np.lib.format.open_memmap(self._vectors_tmp, mode="w+", dtype=np.dtype(dtype), shape=(count, dim))
+        self._meta = open(self._meta_tmp, "w", encoding="utf-8")
+        self._meta.write(json.dumps({**(header or {}), "count": count, "dim": dim, "dtype": dtype}, ensure_ascii=False) + "\n")
+        self._offset = 0
+
+    def add(self, ids: Sequence[str], embeddings, texts: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        batch = _normalize(np.asarray(embeddings, dtype=np.float32))
+        self._vectors[self._offset:self._offset + len(batch)] = batch
+        self._offset += len(batch)
+        for id_, text, meta in zip(ids, texts, metadatas):
+            meta = meta or {}
+            self._meta.write(json.dumps([id_, meta.get("source"), meta.get("chunk"), text], ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        """写完后再用临时文件替换正式文件；加载时会校验两者条数一致。"""
+        if self._offset != self.count:
+            raise ValueError(f"索引条数不一致：预期 {self.count}，实际写入 {self._offset}")
+        self._vectors.flush()
+        del self._vectors
+        self._meta.close()
+        os.replace(self._vectors_tmp, os.path.join(self.out_dir, VECTORS_FILENAME))
+        os.replace(self._meta_tmp, os.path.join(self.out_dir, META_FILENAME))
+
+
+class NumpyVectorIndex:
+    def __init__(self, vectors: np.ndarray, ids: List[str], sources: List[Any], chunks: List[Any], texts: List[str], header: Dict[str, Any]):
+        self.vectors = vectors
+        self.ids = ids
+        self.sources = sources
+        self.chunks = chunks
+        self.texts = texts
+        self.header = header
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "NumpyVectorIndex":
+        meta_path = os.path.join(index_dir, META_FILENAME)
+        vectors_path = os.path.join(index_dir, VECTORS_FILENAME)
+        if not (os.path.exists(meta_path) and os.path.exists(vectors_path)):
+            raise FileNotFoundError(f"未找到 NumPy 向量索引：{index_dir}，请先用 knowledge_builder 导出。")
+
+        vectors = np.load(vectors_path, mmap_mode="r" if mmap else None)
+        ids, sources, chunks, texts = [], [], [], []
+        with open(meta_path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            for line in f:
+                id_, source, chunk, text = json.loads(line)
+                ids.append(id_)
+                sources.append(source)
+                chunks.append(chunk)
+                texts.append(text)
+        if len(ids) != vectors.shape[0]:
+            raise ValueError(f"索引文件不一致：向量 {vectors.shape[0]} 条，元数据 {len(ids)} 条，请重新导出。")
+        return cls(vectors, ids, sources, chunks, texts, header)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def metadata(self, i: int) -> Dict[str, Any]:
+        return {"source": self.sources[i], "chunk": self.chunks[i]}
+
+    def search_batch(self, queries, k: int = 3) -> List[List[Tuple[int, float]]]:
+        """批量检索：返回每个查询的 [(行号, 余弦相似度), ...]，按相似度降序。"""
+        if len(self.ids) == 0:
+            return [[] for _ in range(len(queries))]
+        q = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        n = self.vectors.shape[0]
+        scores = np.empty((q.shape[0], n), dtype=np.float32)
+        for start in range(0, n, SCORE_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[:, start:start + len(block)] = q @ block.T
+        k = min(k, scores.shape[1])
+        # argpartition 取出 top-k（无序），再只对这 k 个排序
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [list(zip(row.tolist(), row_scores.tolist())) for row, row_scores in zip(top, top_scores)]
+
+    def search(self, query, k: int = 3) -> List[Tuple[int, float]]:
+        return self.search_batch([query], k)[0]
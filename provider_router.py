@@ -0,0 +1,391 @@
+"""
+provider_router.py
+
+多个 LLM 提供方（提供方 + 模型，如 openai/gpt-3.5-turbo、dashscope/qwen-turbo）之间的路由与对冲请求：
+- 每个提供方记录滚动窗口内的耗时与失败率（窗口 window 次）；整次调用与流式首 token 分开统计
+- 每个请求发给当前最快的提供方（按 p50 耗时、再按失败率折算排序；样本不足 min_samples 的提供方排在前面，先积累数据）
+- 首选提供方超过自身 p95 仍未返回时，向次选提供方再发一份（对冲），谁先返回用谁，另一个取消；
+  首选直接失败时立即改发次选
+- 流式调用以首个输出（首 token）判断先后，之后只读取胜出的那一路
+- stats() 返回各提供方的请求数、失败数、胜出次数、p50/p95 与对冲次数、对冲胜出次数
+
+提供了四种调用方式：arun / astream（异步，RAGChain 使用）、run / stream（同步，线程实现，Streamlit 前端使用）。
+只有一个提供方时直接调用，不做对冲。
+"""
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 统计类别：整次调用耗时、流式首 token 时间
+CALL = "call"
+FIRST_TOKEN = "first_token"
+
+
+def quantile(values: List[float], q: float) -> Optional[float]:
+    """滚动窗口样本的分位数（不插值），没有样本时返回 None。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ProviderStats:
+    def __init__(self, window: int):
+        self.latency: Dict[str, Deque[float]] = {CALL: deque(maxlen=window), FIRST_TOKEN: deque(maxlen=window)}
+        self.outcomes: Deque[bool] = deque(maxlen=window)  # True 表示失败
+        self.counts = {"requests": 0, "errors": 0, "wins": 0, "hedges": 0, "hedge_wins": 0}
+
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self.counts)
+        out["error_rate"] = round(self.error_rate(), 4)
+        for kind, values in self.latency.items():
+            values = list(values)
+            for q in (0.5, 0.95):
+                v = quantile(values, q)
+                out[f"{kind}_p{int(q * 100)}_ms"] = None if v is None else round(v * 1000, 1)
+        return out
+
+
+class ProviderRouter:
+    def __init__(
+        self,
+        providers: List[str],
+        window: int = 200,
+        min_samples: int = 5,
+        hedge_quantile: float = 0.95,
+        hedge: bool = True,
+    ):
+        if not providers:
+            raise ValueError("至少需要一个提供方")
+        self.providers = list(providers)
+        self.min_samples = min_samples
+        self.hedge_quantile = hedge_quantile
+        self.hedge = hedge
+        self._stats = {name: ProviderStats(window) for name in self.providers}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    # ---- 统计与排序 ----
+
+    def rank(self, kind: str = CALL) -> List[str]:
+        """按预计耗时排序；样本不足的提供方按配置顺序排在最前。"""
+        with self._lock:
+            def key(item):
+                i, name = item
+                s = self._stats[name]
+                samples = list(s.latency[kind])
+                if len(samples) < self.min_samples:
+                    return (0, 0.0, i)
+                # 失败会带来重试，按成功率折算预计耗时
+                return (1, quantile(samples, 0.5) / max(0.05, 1.0 - s.error_rate()), i)
+
+            return [name for _, name in sorted(enumerate(self.providers), key=key)]
+
+    def hedge_delay(self, name: str, kind: str = CALL) -> Optional[float]:
+        """首选提供方的 p95；样本不足或关闭对冲时返回 None（不对冲）。"""
+        if not self.hedge or len(self.providers) < 2:
+            return None
+        with self._lock:
+            samples = list(self._stats[name].latency[kind])
+        if len(samples) < self.min_samples:
+            return None
+        return quantile(samples, self.hedge_quantile)
+
+    def _started(self, name: str, hedge: bool) -> None:
+        with self._lock:
+            self._stats[name].counts["requests"] += 1
+            if hedge:
+                self._stats[name].counts["hedges"] += 1
+
+    def _succeeded(self, name: str, kind: str, elapsed: float, hedge: bool) -> None:
+        with self._lock:
+            s = self._stats[name]
+            s.latency[kind].append(elapsed)
+            s.outcomes.append(False)
+            s.counts["wins"] += 1
+            if hedge:
+                s.counts["hedge_wins"] += 1
+
+    def _cancelled(self, name: str, kind: str, elapsed: float) -> None:
+        """落败被取消的一路：已等待的时长是其耗时的下限，也计入窗口，否则慢请求总被对冲掉，p95 会越算越低。"""
+        with self._lock:
+            self._stats[name].latency[kind].append(elapsed)
+
+    def _failed(self, name: str) -> None:
+        with self._lock:
+            s = self._stats[name]
+            s.outcomes.append(True)
+            s.counts["errors"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            providers = {name: s.snapshot() for name, s in self._stats.items()}
+        requests = sum(p["requests"] - p["hedges"] for p in providers.values())
+        hedges = sum(p["hedges"] for p in providers.values())
+        hedge_wins = sum(p["hedge_wins"] for p in providers.values())
+        return {
+            "providers": providers,
+            "hedges": hedges,
+            "hedge_wins": hedge_wins,
+            "hedge_rate": round(hedges / requests, 4) if requests else 0.0,
+        }
+
+    # ---- 异步 ----
+
+    async def arun(self, call: Callable[[str], Awaitable[T]]) -> T:
+        """call(提供方) 返回协程；返回最先成功的结果。"""
+        ranked = self.rank(CALL)
+        delay = self.hedge_delay(ranked[0], CALL)
+        tasks: Dict[asyncio.Future, tuple] = {}
+        next_i = 0
+        last_error: Optional[BaseException] = None
+
+        def launch(hedge: bool) -> None:
+            nonlocal next_i
+            name = ranked[next_i]
+            next_i += 1
+            self._started(name, hedge)
+            tasks[asyncio.ensure_future(call(name))] = (name, time.perf_counter(), hedge)
+
+        launch(False)
+        start = time.perf_counter()
+        try:
+            while tasks:
+                timeout = None
+                if delay is not None and next_i == 1 and next_i < len(ranked):
+                    timeout = max(0.0, start + delay - time.perf_counter())
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch(True)
+                    continue
+                for task in done:
+                    name, t0, hedge = tasks.pop(task)
+                    if task.exception() is None:
+                        self._succeeded(name, CALL, time.perf_counter() - t0, hedge)
+                        for other_name, other_t0, _ in tasks.values():
+                            self._cancelled(other_name, CALL, time.perf_counter() - other_t0)
+                        return task.result()
+                    self._failed(name)
+                    last_error = task.exception()
+                # 全部失败且还有候选时改发下一个
+                if not tasks and next_i < len(ranked):
+                    launch(False)
+            raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def astream(self, open_stream: Callable[[str], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """open_stream(提供方) 返回异步迭代器；以首个输出决定胜者，之后只读取胜者。"""
+        ranked = self.rank(FIRST_TOKEN)
+        delay = self.hedge_delay(ranked[0], FIRST_TOKEN)
+        pending: Dict[asyncio.Future, tuple] = {}
+        next_i = 0
+        last_error: Optional[BaseException] = None
+        winner = None
+
+        def launch(hedge: bool) -> None:
+            nonlocal next_i
+            name = ranked[next_i]
+            next_i += 1
+            self._started(name, hedge)
+            it = open_stream(name).__aiter__()
+            pending[asyncio.ensure_future(it.__anext__())] = (name, it, time.perf_counter(), hedge)
+
+        async def discard(task: asyncio.Future, it) -> None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            aclose = getattr(it, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+        launch(False)
+        start = time.perf_counter()
+        try:
+            while pending and winner is None:
+                timeout = None
+                if delay is not None and next_i == 1 and next_i < len(ranked):
+                    timeout = max(0.0, start + delay - time.perf_counter())
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch(True)
+                    continue
+                for task in done:
+                    name, it, t0, hedge = pending.pop(task)
+                    error = task.exception()
+                    if winner is None and (error is None or isinstance(error, StopAsyncIteration)):
+                        self._succeeded(name, FIRST_TOKEN, time.perf_counter() - t0, hedge)
+                        winner = (it, None if error else task.result())
+                        for other_name, _, other_t0, _ in pending.values():
+                            self._cancelled(other_name, FIRST_TOKEN, time.perf_counter() - other_t0)
+                    elif error is not None and not isinstance(error, StopAsyncIteration):
+                        self._failed(name)
+                        last_error = error
+                if winner is None and not pending and next_i < len(ranked):
+                    launch(False)
+        finally:
+            for task, (_, it, _, _) in list(pending.items()):
+                await discard(task, it)
+        if winner is None:
+            raise last_error
+
+        it, first = winner
+        try:
+            if first is None:
+                return
+            yield first
+            async for item in it:
+                yield item
+        finally:
+            # 调用方中途停止读取（如客户端断开）时也关闭胜出的一路，释放其连接
+            aclose = getattr(it, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    # ---- 同步（线程） ----
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="provider-router")
+            return self._executor
+
+    def run(self, call: Callable[[str], T]) -> T:
+        """同步版 arun：在线程中调用；对冲后落败的调用无法中断，其结果被丢弃。"""
+        ranked = self.rank(CALL)
+        if len(ranked) == 1:
+            return self._run_one(ranked[0], call)
+        delay = self.hedge_delay(ranked[0], CALL)
+        futures: Dict[Any, tuple] = {}
+        next_i = 0
+        last_error: Optional[BaseException] = None
+
+        def launch(hedge: bool) -> None:
+            nonlocal next_i
+            name = ranked[next_i]
+            next_i += 1
+            self._started(name, hedge)
+            futures[self._pool().submit(call, name)] = (name, time.perf_counter(), hedge)
+
+        launch(False)
+        start = time.perf_counter()
+        while futures:
+            timeout = None
+            if delay is not None and next_i == 1 and next_i < len(ranked):
+                timeout = max(0.0, start + delay - time.perf_counter())
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                launch(True)
+                continue
+            for fut in done:
+                name, t0, hedge = futures.pop(fut)
+                if fut.exception() is None:
+                    self._succeeded(name, CALL, time.perf_counter() - t0, hedge)
+                    for other, (other_name, other_t0, _) in futures.items():
+                        other.cancel()
+                        self._cancelled(other_name, CALL, time.perf_counter() - other_t0)
+                    return fut.result()
+                self._failed(name)
+                last_error = fut.exception()
+            if not futures and next_i < len(ranked):
+                launch(False)
+        raise last_error
+
+    def _run_one(self, name: str, call: Callable[[str], T]) -> T:
+        self._started(name, False)
+        t0 = time.perf_counter()
+        try:
+            result = call(name)
+        except Exception:
+            self._failed(name)
+            raise
+        self._succeeded(name, CALL, time.perf_counter() - t0, False)
+        return result
+
+    def stream(self, open_stream: Callable[[str], Iterator[T]]) -> Iterator[T]:
+        """同步版 astream：每一路在线程中读取，首个输出决定胜者；落败的一路在下一个输出时停止。"""
+        ranked = self.rank(FIRST_TOKEN)
+        delay = self.hedge_delay(ranked[0], FIRST_TOKEN)
+        events: "queue.Queue[tuple]" = queue.Queue()
+        stopped: Dict[str, threading.Event] = {}
+        next_i = 0
+
+        def pump(name: str, stop: threading.Event) -> None:
+            try:
+                for item in open_stream(name):
+                    if stop.is_set():
+                        return
+                    events.put((name, "item", item))
+                events.put((name, "end", None))
+            except Exception as e:
+                events.put((name, "error", e))
+
+        def launch(hedge: bool) -> None:
+            nonlocal next_i
+            name = ranked[next_i]
+            next_i += 1
+            self._started(name, hedge)
+            stopped[name] = threading.Event()
+            launched[name] = (time.perf_counter(), hedge)
+            threading.Thread(target=pump, args=(name, stopped[name]), daemon=True).start()
+
+        launched: Dict[str, tuple] = {}
+        active = set()
+        launch(False)
+        active.add(ranked[0])
+        start = time.perf_counter()
+        winner = None
+        last_error: Optional[BaseException] = None
+        try:
+            while winner is None:
+                timeout = None
+                if delay is not None and next_i == 1 and next_i < len(ranked):
+                    timeout = max(0.0, start + delay - time.perf_counter())
+                try:
+                    name, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    launch(True)
+                    active.add(ranked[next_i - 1])
+                    continue
+                if kind == "error":
+                    self._failed(name)
+                    last_error = payload
+                    active.discard(name)
+                    if not active:
+                        if next_i >= len(ranked):
+                            raise last_error
+                        launch(False)
+                        active.add(ranked[next_i - 1])
+                    continue
+                t0, hedge = launched[name]
+                self._succeeded(name, FIRST_TOKEN, time.perf_counter() - t0, hedge)
+                winner = name
+                for other in active - {winner}:
+                    stopped[other].set()
+                    self._cancelled(other, FIRST_TOKEN, time.perf_counter() - launched[other][0])
+                if kind == "end":
+                    return
+                yield payload
+
+            while True:
+                name, kind, payload = events.get()
+                if name != winner:
+                    continue
+                if kind == "item":
+                    yield payload
+                elif kind == "error":
+                    raise payload
+                else:
+                    return
+        finally:
+            for stop in stopped.values():
+                stop.set()
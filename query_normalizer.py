@@ -0,0 +1,120 @@
+"""
+query_normalizer.py
+
+查询预处理：
+- normalize_query：把问题规范化，使写法不同但含义相同的问题得到同一个字符串
+  （全角转半角、繁体转简体、统一大小写、去掉多余空白和句末标点）
+- QueryEmbeddingLRU：进程内「规范化问题 -> 查询向量」LRU，重复或近似重复的问题不再调用嵌入 API，
+  并统计命中/未命中次数
+
+繁简转换优先使用 opencc（可选依赖），未安装时使用内置的常用字对照表。
+"""
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+try:
+    import opencc
+except ImportError:  # opencc 为可选依赖
+    opencc = None
+
+# 常用繁体字 -> 简体字（覆盖校园问答中的高频字）
+_T2S_PAIRS = (
+    "圖图書书館馆開开門门時时間间獎奖學学費费資资寢寝報报維维電电話话"
+    "課课選选務务績绩單单請请麼么幾几點点號号樓楼層层區区東东廳厅飯饭錢钱繳缴"
+    "證证歷历備备預预約约還还續续閱阅覽览規规則则發发獲获評评審审員员會会進进"
+    "們们這这個个嗎吗對对應应該该為为從从樣样問问題题與与關关於于後后實实際际現现"
+    "寫写讀读聽听說说認认識识醫医療疗衛卫體体場场運运動动網网絡络連连線线腦脑"
+    "車车輛辆辦办處处長长師师級级畢毕業业論论導导輔辅專专"
+)
+_T2S = str.maketrans({_T2S_PAIRS[i]: _T2S_PAIRS[i + 1] for i in range(0, len(_T2S_PAIRS), 2)})
+
+_converter = opencc.OpenCC("t2s") if opencc is not None else None
+
+_SPACES = re.compile(r"\s+")
+# 中日韩字符之间的空白没有意义，直接去掉
+_CJK_GAP = re.compile(r"(?<=[\u3000-\u9fff])\s+|\s+(?=[\u3000-\u9fff])")
+_TRAILING = re.compile(r"[\s?!.,;:~…。？！，、；：～]+$")
+_LEADING = re.compile(r"^[\s?!.,;:~…。？！，、；：～]+")
+
+
+def to_simplified(text: str) -> str:
+    if _converter is not None:
+        return _converter.convert(text)
+    return text.translate(_T2S)
+
+
+def normalize_query(question: str) -> str:
+    """规范化问题文本，例如「 圖書館幾點開門？？」与「图书馆几点开门」得到相同结果。"""
+    text = unicodedata.normalize("NFKC", question or "")
+    text = to_simplified(text).lower()
+    text = _CJK_GAP.sub("", text)
+    text = _SPACES.sub(" ", text)
+    text = _TRAILING.sub("", text)
+    return _LEADING.sub("", text)
+
+
+class QueryEmbeddingLRU:
+    """进程内查询向量 LRU，包装底层嵌入器，键为规范化后的问题。"""
+
+    def __init__(self, embeddings, max_entries: int = 4096, normalize: Callable[[str], str] = normalize_query):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self.normalize = normalize
+        self._lock = threading.Lock()
+        self._vectors: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vec = self._vectors.get(key)
+            if vec is not None:
+                self._vectors.move_to_end(key)
+                self.hits += 1
+            return vec
+
+    def _put(self, key: str, vec: List[float]) -> None:
+        with self._lock:
+            self._vectors[key] = vec
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+
+    def peek(self, text: str) -> Optional[List[float]]:
+        """已缓存的查询向量，不存在时返回 None；不调用嵌入器，也不计入命中统计。"""
+        with self._lock:
+            return self._vectors.get(self.normalize(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """批量查询向量：命中的直接返回，未命中的（去重后）一次性交给底层嵌入器。"""
+        keys = [self.normalize(t) for t in texts]
+        found = {}
+        for key in keys:
+            if key not in found:
+                vec = self._get(key)
+                if vec is not None:
+                    found[key] = vec
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        if missing:
+            with self._lock:
+                self.misses += len(missing)
+            for key, vec in zip(missing, self.embeddings.embed_documents(missing)):
+                self._put(key, vec)
+                found[key] = vec
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "size": len(self._vectors),
+            }
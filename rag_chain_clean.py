@@ -2,34 +2,157 @@
 rag_chain_clean.py
 
 修正版的 RAGChain 实现，内容与原 rag_chain.py 功能相同，但写入为独立文件以避免原文件冲突。
+检索（向量 + BM25 混合）、答案缓存、上下文打包与 LLM 生成，提供同步、异步、流式与批量接口，供 main.py 使用。
 """
+import asyncio
 import os
-from typing import Dict, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
-from langchain.embeddings import OpenAIEmbeddings
+from langchain.schema import Document
 from langchain.vectorstores import Chroma
 
+from answer_cache import AnswerCache
+from bm25_index import BM25Index, bm25_index_path, reciprocal_rank_fusion
+from context_packer import pack_context
+from embedding_backends import get_embeddings
+from extractive_answer import extract_answer
+from kb_manifest import manifest_signature
+from numpy_index import NumpyVectorIndex, default_index_dir
+from provider_router import ProviderRouter
+from query_normalizer import QueryEmbeddingLRU, normalize_query
+from rag_metrics import RAGMetrics
+from single_flight import SingleFlight
+from token_utils import estimate_tokens
+
+# 混合检索时每一路取 top_k 的若干倍作为候选再融合
+CANDIDATE_FACTOR = 4
+
+NO_ANSWER = "根据现有信息，我无法回答这个问题"
+
+# DashScope 的 OpenAI 兼容接口，qwen 模型可直接用 ChatOpenAI 调用
+DASHSCOPE_COMPATIBLE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+
+def provider_llms(spec: str) -> Dict[str, Any]:
+    """按 "提供方:模型,..." 创建 LLM，返回 {"提供方/模型": llm}；缺少对应 API Key 的提供方跳过。"""
+    llms: Dict[str, Any] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        provider, _, model = item.partition(":")
+        provider = provider.strip().lower()
+        if provider == "openai":
+            if not os.environ.get("OPENAI_API_KEY"):
+                continue
+            llm = ChatOpenAI(model_name=model, temperature=0)
+        elif provider == "dashscope":
+            api_key = os.environ.get("ALIYUN_API_KEY")
+            if not api_key:
+                continue
+            base_url = os.environ.get("DASHSCOPE_COMPATIBLE_BASE_URL", DASHSCOPE_COMPATIBLE_BASE_URL)
+            llm = ChatOpenAI(model_name=model, temperature=0, openai_api_key=api_key, openai_api_base=base_url)
+        else:
+            raise ValueError(f"未知的 LLM 提供方：{provider}（可选 openai、dashscope）")
+        llms[f"{provider}/{model}"] = llm
+    return llms
+
 
 class RAGChain:
+    """可通过构造参数或环境变量配置：
+    - 嵌入后端 EMBEDDING_BACKEND（local 时检索完全在本地完成，无 OPENAI_API_KEY 也能调用 retrieve()）
+    - 向量库 RAG_VECTOR_STORE：chroma（默认）或 numpy（内存映射索引，启动快、支持批量检索）
+    - 检索方式 RAG_RETRIEVAL_MODE：hybrid（默认，有 BM25 索引时与向量检索按 RRF 融合）或 dense
+    - 异步接口的并发上限 RAG_MAX_CONCURRENCY（默认 8）
+    - 上下文 token 预算 RAG_CONTEXT_TOKEN_BUDGET（默认 1500，0 表示不限）
+    - 抽取式回答阈值 RAG_EXTRACTIVE_THRESHOLD（默认 0.9，大于 1 则关闭）
+    - LLM 提供方 RAG_LLM_PROVIDERS（如 "openai:gpt-3.5-turbo,dashscope:qwen-turbo"，由 provider_router 选择与对冲）
+    """
+
     def __init__(
         self,
         persist_dir: str = "./chroma_db",
         embedding_model: str = "text-embedding-3-small",
         llm_model: str = "gpt-3.5-turbo",
         collection_name: str = "campus",
+        embedding_backend: Optional[str] = None,
+        vector_store: Optional[str] = None,
+        numpy_index_dir: Optional[str] = None,
+        top_k: int = 3,
+        retrieval_mode: Optional[str] = None,
+        lexical_confidence: float = 0.9,
+        answer_cache: Optional[AnswerCache] = None,
+        max_concurrency: Optional[int] = None,
+        llms: Optional[Dict[str, Any]] = None,
+        context_token_budget: Optional[int] = None,
+        extractive_threshold: Optional[float] = None,
+        embeddings=None,
+        llm=None,
     ):
-        if not os.environ.get("OPENAI_API_KEY"):
-            raise EnvironmentError(
-                "请先设置环境变量 OPENAI_API_KEY，例如：在 PowerShell 中运行：$Env:OPENAI_API_KEY=\"your_key\""
-            )
+        # 嵌入后端与构建知识库时保持一致（openai 后端需要 OPENAI_API_KEY）；embeddings / llm 可直接传入（如基准测试的模拟实现）
+        self.embeddings = embeddings if embeddings is not None else get_embeddings(embedding_model, embedding_backend, persist_dir)
+        # 查询侧向量统一经过进程内 LRU（键为规范化后的问题）
+        self.query_embeddings = QueryEmbeddingLRU(
+            self.embeddings, max_entries=int(os.environ.get("RAG_QUERY_EMBEDDING_CACHE_SIZE", 4096))
+        )
+        self.top_k = top_k
+        self.metrics = RAGMetrics()
+        # 上下文 token 预算（不含提示词模板与问题）；0 表示不限
+        if context_token_budget is None:
+            context_token_budget = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", 1500))
+        self.context_token_budget = context_token_budget
+        # 计数可能在线程池中更新，统一经 _count() 加锁
+        self._stats_lock = threading.Lock()
+        self.context_stats = {
+            "packed": 0, "chunks_merged": 0, "truncated": 0, "tokens_before": 0, "tokens_saved": 0, "tokens_truncated": 0,
+        }
+        # 抽取式回答阈值（句子对查询词项的覆盖度，0~1）
+        if extractive_threshold is None:
+            extractive_threshold = float(os.environ.get("RAG_EXTRACTIVE_THRESHOLD", 0.9))
+        self.extractive_threshold = extractive_threshold
+        self.answer_modes = {"extractive": 0, "llm": 0, "no_answer": 0}
+
+        self.vector_store = (vector_store or os.environ.get("RAG_VECTOR_STORE") or "chroma").lower()
+        if self.vector_store == "numpy":
+            # 直接加载内存映射索引，不打开 Chroma
+            self.index = NumpyVectorIndex.load(numpy_index_dir or default_index_dir(persist_dir))
+            index_model = self.index.header.get("embedding_model")
+            query_model = getattr(self.embeddings, "model_name", None)
+            if index_model and query_model and index_model != query_model:
+                raise ValueError(f"NumPy 索引使用的嵌入模型为 {index_model}，与查询嵌入模型 {query_model} 不一致，请重新导出。")
+            self.db = None
+            self.retriever = None
+        else:
+            self.index = None
+            self.db = Chroma(persist_directory=persist_dir, embedding_function=self.embeddings, collection_name=collection_name)
+            self.retriever = self.db.as_retriever(search_kwargs={"k": top_k})
 
-        self.embeddings = OpenAIEmbeddings(model=embedding_model)
-        self.db = Chroma(persist_directory=persist_dir, embedding_function=self.embeddings, collection_name=collection_name)
-        self.retriever = self.db.as_retriever(search_kwargs={"k": 3})
-        self.llm = ChatOpenAI(model_name=llm_model, temperature=0)
+        # 混合检索（默认）：存在 BM25 索引时启用；dense 模式只做向量检索
+        self.retrieval_mode = (retrieval_mode or os.environ.get("RAG_RETRIEVAL_MODE") or "hybrid").lower()
+        self.lexical_confidence = lexical_confidence
+        bm25_path = bm25_index_path(persist_dir)
+        self.bm25 = BM25Index.load(bm25_path) if self.retrieval_mode == "hybrid" and os.path.exists(bm25_path) else None
+        self._index_positions: Optional[Dict[str, int]] = None  # NumPy 索引中文本块 ID -> 行号
+        self.counters = {"lexical_fast_path": 0, "hybrid": 0, "dense": 0}
+
+        # 答案缓存：以清单文件签名作为版本，知识库重建后自动清空
+        self.answer_cache = answer_cache or AnswerCache(
+            version_fn=lambda: manifest_signature(persist_dir, collection_name)
+        )
+
+        # LLM 提供方：llm / llms 直接传入，否则按 RAG_LLM_PROVIDERS 创建（默认 openai:<llm_model>，需要 OPENAI_API_KEY）；
+        # 本地嵌入时允许无 Key 启动，此时只能检索
+        if llms is None:
+            llms = {"default": llm} if llm is not None else provider_llms(
+                os.environ.get("RAG_LLM_PROVIDERS") or f"openai:{llm_model}"
+            )
+        self.llms = llms
+        self.llm = next(iter(llms.values()), None)
+        hedge = os.environ.get("RAG_HEDGE", "1").lower() not in ("0", "false", "no")
+        self.router = ProviderRouter(list(llms), hedge=hedge) if llms else None
 
         template = '''你是一个专业的校园信息助手。请严格根据以下提供的上下文信息来回答问题。如果上下文信息中没有答案，请直接说“根据现有信息，我无法回答这个问题”，不要编造答案。
 
@@ -42,27 +165,410 @@ class RAGChain:
 请用中文回答：'''
 
         self.prompt = PromptTemplate(input_variables=["context", "question"], template=template)
-        self.chain = LLMChain(llm=self.llm, prompt=self.prompt)
+        self.chains = {name: LLMChain(llm=llm, prompt=self.prompt) for name, llm in llms.items()}
+        self.chain = next(iter(self.chains.values()), None)
+
+        # 异步路径：同步的检索放到线程池，信号量限制同时处理的问题数
+        self.max_concurrency = max_concurrency or int(os.environ.get("RAG_MAX_CONCURRENCY", 8))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="rag-retrieve")
+        self._semaphore_instance: Optional[asyncio.Semaphore] = None
+        self._inflight = SingleFlight()
+
+    @property
+    def _semaphore(self) -> asyncio.Semaphore:
+        # 在事件循环线程中第一次使用时才创建：构造函数可能在工作线程中执行（main.py 后台加载），
+        # 而 Python 3.9 的 asyncio.Semaphore 构造时需要当前线程的事件循环
+        if self._semaphore_instance is None:
+            self._semaphore_instance = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore_instance
+
+    def _index_documents(self, hits) -> List[Document]:
+        return [Document(page_content=self.index.texts[i], metadata=self.index.metadata(i)) for i, _ in hits]
+
+    def _bm25_documents(self, docs: List[int]) -> List[Document]:
+        """BM25 索引不保存文本：按文本块 ID 从 NumPy 索引或 Chroma 取回（取不到的块跳过）。"""
+        ids = [self.bm25.ids[i] for i in docs]
+        if self.index is not None:
+            if self._index_positions is None:
+                self._index_positions = {doc_id: i for i, doc_id in enumerate(self.index.ids)}
+            texts = {doc_id: self.index.texts[self._index_positions[doc_id]] for doc_id in ids if doc_id in self._index_positions}
+        elif ids:
+            res = self.db._collection.get(ids=ids, include=["documents"])
+            texts = dict(zip(res["ids"], res["documents"]))
+        else:
+            texts = {}
+        return [
+            Document(page_content=texts[doc_id], metadata=self.bm25.metadata(i))
+            for i, doc_id in zip(docs, ids) if doc_id in texts
+        ]
+
+    def _embed_queries(self, questions: List[str]) -> List[List[float]]:
+        with self.metrics.stage("embed"):
+            return self.query_embeddings.embed_documents(questions)
+
+    def _dense_search_batch(self, questions: List[str], k: int) -> List[List[Document]]:
+        vectors = self._embed_queries(questions)
+        with self.metrics.stage("vector_search"):
+            if self.index is not None:
+                # NumPy 索引：一次对全部问题做 top-k
+                return [self._index_documents(hits) for hits in self.index.search_batch(vectors, k)]
+            # Chroma：一次 query 传入全部查询向量
+            res = self.db._collection.query(query_embeddings=vectors, n_results=k, include=["documents", "metadatas"])
+            return [
+                [Document(page_content=text, metadata=meta or {}) for text, meta in zip(texts, metas)]
+                for texts, metas in zip(res["documents"], res["metadatas"])
+            ]
+
+    def _fuse(self, lexical_hits, dense_docs: List[Document]) -> List[Document]:
+        """按 (source, chunk) 对齐两路结果，RRF 融合后取 top_k；只为进入 top_k 且向量检索未返回的块取文本。"""
+        docs: Dict[Any, Document] = {}
+        dense_keys, lexical_keys = [], []
+        for d in dense_docs:
+            key = (d.metadata.get("source"), d.metadata.get("chunk"))
+            docs.setdefault(key, d)
+            dense_keys.append(key)
+        lexical: Dict[Any, int] = {}
+        for i, _ in lexical_hits:
+            key = (self.bm25.sources[i], self.bm25.chunks[i])
+            lexical.setdefault(key, i)
+            lexical_keys.append(key)
+        top = [key for key, _ in reciprocal_rank_fusion([dense_keys, lexical_keys])[:self.top_k]]
+        for d in self._bm25_documents([lexical[key] for key in top if key not in docs]):
+            docs[(d.metadata.get("source"), d.metadata.get("chunk"))] = d
+        return [docs[key] for key in top if key in docs]
+
+    def retrieve_batch(self, questions: List[str]) -> List[List[Document]]:
+        """批量检索，返回每个问题最相关的文本块。"""
+        questions = [normalize_query(q) for q in questions]
+        if self.bm25 is None:
+            self._count(self.counters, dense=len(questions))
+            results = self._dense_search_batch(questions, self.top_k)
+        else:
+            results = self._hybrid_search_batch(questions)
+        self.metrics.empty_retrievals.inc(sum(1 for docs in results if not docs))
+        return results
+
+    def _hybrid_search_batch(self, questions: List[str]) -> List[List[Document]]:
+        """BM25 足够可信（查询词项几乎都被最佳文本块覆盖）时直接返回，跳过查询嵌入；否则与向量检索结果按 RRF 融合。"""
+        results: List[Optional[List[Document]]] = [None] * len(questions)
+        lexical, pending = [], []
+        with self.metrics.stage("lexical"):
+            for i, q in enumerate(questions):
+                hits = self.bm25.search(q, self.top_k * CANDIDATE_FACTOR)
+                lexical.append(hits)
+                if self.bm25.confidence(q, hits) >= self.lexical_confidence:
+                    # 词面匹配足够可信：直接返回，跳过查询嵌入
+                    results[i] = self._bm25_documents([doc for doc, _ in hits[:self.top_k]])
+                    self._count(self.counters, lexical_fast_path=1)
+                else:
+                    pending.append(i)
+
+        if pending:
+            dense = self._dense_search_batch([questions[i] for i in pending], self.top_k * CANDIDATE_FACTOR)
+            for i, docs in zip(pending, dense):
+                results[i] = self._fuse(lexical[i], docs)
+            self._count(self.counters, hybrid=len(pending))
+        return results
+
+    def retrieve(self, question: str) -> List[Document]:
+        """只做检索，返回最相关的文本块。"""
+        return self.retrieve_batch([question])[0]
 
     def ask(self, question: str) -> Dict[str, Any]:
-        docs = self.retriever.get_relevant_documents(question)
-        if not docs:
-            return {"answer": "根据现有信息，我无法回答这个问题", "source_documents": []}
+        """先查答案缓存（精确匹配 + 查询向量近似匹配，知识库重建后失效），未命中再检索、生成。
+
+        结果带 mode 字段：extractive 摘自原文 / llm 模型生成 / no_answer 无检索结果。
+        """
+        with self.metrics.request("ask"):
+            key = normalize_query(question)
+            vector: List[List[float]] = []
+
+            def query_vector():
+                # 只在精确匹配未命中时才计算，算出后写缓存时复用
+                if not vector:
+                    vector.append(self._embed_queries([key])[0])
+                return vector[0]
+
+            cached = self.answer_cache.get(key, query_vector)
+            if cached is not None:
+                return cached
+
+            result = self._answer(question)
+            self._cache_result(key, result, vector[0] if vector else None)
+            return result
+
+    def _cache_result(self, key: str, result: Dict[str, Any], vector=None) -> None:
+        """写入答案缓存。查缓存时没有算查询向量的，用检索时已算出的向量（走词面快速路径的问题没有向量，只能精确匹配）。"""
+        if vector is None:
+            vector = self.query_embeddings.peek(key)
+        self.answer_cache.put(key, result, vector)
+
+    async def aask(self, question: str) -> Dict[str, Any]:
+        """ask() 的异步版本，不阻塞事件循环；相同问题正在处理时直接等待其结果。"""
+        with self.metrics.request("ask"):
+            key = normalize_query(question)
+            return await self._inflight.do(key, lambda: self._aask(key, question))
+
+    async def _aask(self, key: str, question: str) -> Dict[str, Any]:
+        async with self._semaphore:
+            cached, vector = await self._alookup(key)
+            if cached is not None:
+                return cached
+
+            docs = await asyncio.get_running_loop().run_in_executor(self._executor, self.retrieve, question)
+            return await self._agenerate(key, question, docs, vector[0] if vector else None)
+
+    async def _agenerate(self, key: str, question: str, docs: List[Document], vector) -> Dict[str, Any]:
+        """根据检索结果生成答案并写入答案缓存（并发控制由调用方负责）。"""
+        result = self._without_llm(question, docs)
+        if result is None:
+            self._require_chain()
+            inputs = {"context": self._build_context(docs), "question": question}
+            with self.metrics.stage("llm"):
+                res = await self.router.arun(lambda name: self.chains[name].agenerate([inputs]))
+            result = self._result(self._completion(inputs, res), docs)
+            self._count(self.answer_modes, llm=1)
+        self._cache_result(key, result, vector)
+        return result
 
-        parts = []
-        for d in docs:
-            src = d.metadata.get("source") if isinstance(d.metadata, dict) else None
-            parts.append(f"来源: {src}\n{d.page_content}")
-        context = "\n\n---\n\n".join(parts)
+    async def astream(self, question: str) -> AsyncIterator[Tuple[str, Any]]:
+        """流式回答，依次产出 ("sources", 来源列表)、若干 ("token", 文本)、("done", 耗时信息)。
 
-        answer = self.chain.run({"context": context, "question": question})
+        耗时信息包含 ttft_ms（收到问题到第一个 token）、total_ms（总耗时）与 mode（回答方式），缓存命中时带 cache 字段。
+        相同问题正在流式生成时订阅其输出，不再重复检索和调用 LLM。
+        """
+        start = time.perf_counter()
 
+        def elapsed_ms() -> int:
+            return int((time.perf_counter() - start) * 1000)
+
+        with self.metrics.request("stream"):
+            key = normalize_query(question)
+            events = self._inflight.stream(key, lambda: self._astream(key, question))
+            ttft_ms = None
+            try:
+                async for event, data in events:
+                    if event == "token" and ttft_ms is None:
+                        ttft_ms = elapsed_ms()
+                    elif event == "done":
+                        data = {"ttft_ms": ttft_ms, "total_ms": elapsed_ms(), **data}
+                    yield event, data
+            finally:
+                await events.aclose()
+
+    async def _astream(self, key: str, question: str) -> AsyncIterator[Tuple[str, Any]]:
+        """astream() 的共享部分：产出来源、token，最后产出 ("done", {"mode", "cache"})。"""
+        start = time.perf_counter()
+        async with self._semaphore:
+            cached, vector = await self._alookup(key)
+            if cached is not None:
+                yield "sources", cached["source_documents"]
+                yield "token", cached["answer"]
+                yield "done", {"mode": cached.get("mode"), "cache": cached["cache"]}
+                return
+
+            docs = await asyncio.get_running_loop().run_in_executor(self._executor, self.retrieve, question)
+            direct = self._without_llm(question, docs)
+            if direct is not None:
+                yield "sources", direct["source_documents"]
+                yield "token", direct["answer"]
+                self._cache_result(key, direct, vector[0] if vector else None)
+                yield "done", {"mode": direct["mode"], "cache": None}
+                return
+
+            sources = self._result("", docs)["source_documents"]
+            yield "sources", sources
+
+            self._require_chain()
+            prompt = self.prompt.format(context=self._build_context(docs), question=question)
+            pieces = []
+
+            async def tokens(name: str):
+                async for chunk in self.llms[name].astream(prompt):
+                    text = getattr(chunk, "content", chunk)
+                    if text:
+                        yield text
+
+            with self.metrics.stage("llm"):
+                async for text in self.router.astream(tokens):
+                    if not pieces:
+                        self.metrics.observe_ttft(time.perf_counter() - start)
+                    pieces.append(text)
+                    yield "token", text
+            answer = "".join(pieces)
+            # 流式接口不返回用量，按估算计数
+            self.metrics.llm_tokens.inc(estimate_tokens(prompt), kind="prompt")
+            self.metrics.llm_tokens.inc(estimate_tokens(answer), kind="completion")
+            self._count(self.answer_modes, llm=1)
+
+            result = {"answer": answer, "source_documents": sources, "mode": "llm"}
+            self._cache_result(key, result, vector[0] if vector else None)
+            yield "done", {"mode": "llm", "cache": None}
+
+    async def aask_batch(self, questions: List[str]) -> List[Dict[str, Any]]:
+        """批量回答，返回与输入顺序一致的结果；某一项失败时该项为 {"error": ...}，不影响其他项。
+
+        全部问题一次批量嵌入、一起检索，LLM 调用按并发上限同时进行；相同问题只生成一次。
+        """
+        with self.metrics.request("batch"):
+            return await self._aask_batch(questions)
+
+    async def _aask_batch(self, questions: List[str]) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        keys = [normalize_query(q) for q in questions]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+        # 相同（规范化后）的问题只检索、生成一次
+        groups: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(key, []).append(i)
+
+        try:
+            cached, vectors = await loop.run_in_executor(self._executor, self._batch_lookup, list(groups))
+            pending = [key for key in groups if key not in cached]
+            docs_list = await loop.run_in_executor(self._executor, self.retrieve_batch, pending)
+        except Exception as e:
+            return [{"error": str(e)} for _ in questions]
+
+        for key, result in cached.items():
+            for i in groups[key]:
+                results[i] = result
+
+        async def generate_bounded(key: str, docs: List[Document]) -> Dict[str, Any]:
+            async with self._semaphore:
+                return await self._agenerate(key, questions[groups[key][0]], docs, vectors.get(key))
+
+        async def generate(key: str, docs: List[Document]) -> None:
+            try:
+                # 其他请求正在回答同一问题时直接共用其结果
+                result = await self._inflight.do(key, lambda: generate_bounded(key, docs))
+            except Exception as e:
+                result = {"error": str(e)}
+            for i in groups[key]:
+                results[i] = result
+
+        await asyncio.gather(*(generate(key, docs) for key, docs in zip(pending, docs_list)))
+        return results
+
+    def _batch_lookup(self, keys: List[str]):
+        """批量查答案缓存。只有需要近似匹配时才计算查询向量：第一次需要时把其余问题的向量一次批量算出
+        （同时写入查询向量 LRU，后续检索直接复用）。"""
+        vectors: Dict[str, List[float]] = {}
+        cached = {}
+
+        def query_vector(key: str) -> List[float]:
+            if key not in vectors:
+                rest = [k for k in keys if k not in vectors and k not in cached]
+                vectors.update(zip(rest, self._embed_queries(rest)))
+            return vectors[key]
+
+        for key in keys:
+            hit = self.answer_cache.get(key, lambda key=key: query_vector(key))
+            if hit is not None:
+                cached[key] = hit
+        return cached, vectors
+
+    async def _alookup(self, key: str):
+        """在线程池中查答案缓存（近似匹配可能要计算查询向量），返回 (缓存结果或 None, 已算出的向量)。"""
+        vector: List[List[float]] = []
+
+        def query_vector():
+            if not vector:
+                vector.append(self._embed_queries([key])[0])
+            return vector[0]
+
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(self._executor, self.answer_cache.get, key, query_vector)
+        return cached, vector
+
+    def _require_chain(self) -> None:
+        if self.chain is None:
+            raise EnvironmentError("生成答案需要设置环境变量 OPENAI_API_KEY（或在 RAG_LLM_PROVIDERS 中配置其他提供方）")
+
+    def _build_context(self, docs: List[Document]) -> str:
+        """同一文件相邻的文本块合并并去掉重叠部分，总长度不超过 context_token_budget（context_packer.py）。"""
+        with self.metrics.stage("context"):
+            context, info = pack_context(docs, self.context_token_budget or None)
+        self._count(
+            self.context_stats, packed=1, chunks_merged=info["merged"], truncated=int(info["truncated"]),
+            tokens_before=info["tokens_before"], tokens_saved=info["tokens_saved"],
+            tokens_truncated=info["tokens_truncated"],
+        )
+        return context
+
+    def _completion(self, inputs: Dict[str, str], res) -> str:
+        """取出 LLMResult 中的回答，并记录 prompt / completion token 数（接口未返回用量时估算）。"""
+        text = res.generations[0][0].text
+        usage = (res.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens") or estimate_tokens(self.prompt.format(**inputs))
+        self.metrics.llm_tokens.inc(prompt_tokens, kind="prompt")
+        self.metrics.llm_tokens.inc(usage.get("completion_tokens") or estimate_tokens(text), kind="completion")
+        return text
+
+    @staticmethod
+    def _result(answer: str, docs: List[Document], mode: str = "llm") -> Dict[str, Any]:
         source_documents = [{
             "source": d.metadata.get("source") if isinstance(d.metadata, dict) else None,
             "content": d.page_content,
         } for d in docs]
+        return {"answer": answer, "source_documents": source_documents, "mode": mode}
+
+    def _without_llm(self, question: str, docs: List[Document]) -> Optional[Dict[str, Any]]:
+        """不需要 LLM 的情况：没有检索结果，或能直接从检索结果中摘出答案；否则返回 None。"""
+        if not docs:
+            self._count(self.answer_modes, no_answer=1)
+            return {"answer": NO_ANSWER, "source_documents": [], "mode": "no_answer"}
+        if self.extractive_threshold > 1:
+            return None
+        with self.metrics.stage("extract"):
+            idf = self.bm25.idf if self.bm25 is not None else None
+            hit = extract_answer(normalize_query(question), docs, self.extractive_threshold, idf)
+        if hit is None:
+            return None
+        answer, i, _ = hit
+        self._count(self.answer_modes, extractive=1)
+        # 只返回答案所在的文本块作为来源
+        return self._result(answer, [docs[i]], "extractive")
+
+    def _answer(self, question: str) -> Dict[str, Any]:
+        docs = self.retrieve(question)
+        result = self._without_llm(question, docs)
+        if result is not None:
+            return result
+        self._require_chain()
+        inputs = {"context": self._build_context(docs), "question": question}
+        with self.metrics.stage("llm"):
+            res = self.router.run(lambda name: self.chains[name].generate([inputs]))
+        self._count(self.answer_modes, llm=1)
+        return self._result(self._completion(inputs, res), docs)
+
+    def _count(self, counters: Dict[str, int], **increments: int) -> None:
+        with self._stats_lock:
+            for name, n in increments.items():
+                counters[name] += n
+
+    def _snapshot(self, counters: Dict[str, int]) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(counters)
+
+    def stats(self) -> Dict[str, Any]:
+        """检索路径计数、查询向量 LRU 与答案缓存的命中情况、上下文打包节省的 token 数、各回答方式次数与 LLM 跳过率、
+        各 LLM 提供方的耗时与对冲统计。"""
+        return {
+            "retrieval": self._snapshot(self.counters),
+            "query_embedding_cache": self.query_embeddings.stats(),
+            "answer_cache": dict(self.answer_cache.stats),
+            "single_flight": {**self._inflight.stats, "in_flight": len(self._inflight)},
+            "context": self._snapshot(self.context_stats),
+            "answer_mode": self._answer_mode_stats(),
+            "providers": self.router.stats() if self.router is not None else {},
+        }
 
-        return {"answer": answer, "source_documents": source_documents}
+    def _answer_mode_stats(self) -> Dict[str, Any]:
+        modes = self._snapshot(self.answer_modes)
+        # 有检索结果的回答中，抽取式（未调用 LLM）所占比例
+        answered = modes["extractive"] + modes["llm"]
+        modes["llm_skip_rate"] = modes["extractive"] / answered if answered else 0.0
+        return modes
 
 
 def get_rag_chain(persist_dir: str = "./chroma_db") -> RAGChain:
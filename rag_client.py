@@ -0,0 +1,153 @@
+"""
+rag_client.py
+
+Streamlit 前端（web_app.py、campus_app.py）调用后端 /ask/stream 的客户端：
+解析 Server-Sent Events，逐个产出 (事件名, 数据)。
+- new_session：带连接池的 requests.Session，前端用 st.cache_resource 每个进程创建一次，复用 TCP 连接
+- fetch_kb_version：查询后端 /version 返回的知识库版本，前端把它作为答案缓存键的一部分，知识库重建后缓存自动失效
+- AnswerLRU：前端的答案缓存（容量有上限的 LRU，线程安全）
+- BackendClient：把以上三者组合起来（会话、带 TTL 的知识库版本、答案缓存），前端用 st.cache_resource 每个进程创建一个
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from query_normalizer import normalize_query
+
+
+def stream_url(api_url: str) -> str:
+    """由 /ask 地址得到流式接口地址。"""
+    return api_url.rstrip("/") + "/stream"
+
+
+def version_url(api_url: str) -> str:
+    """由 /ask 地址得到知识库版本接口地址。"""
+    base = api_url.rstrip("/")
+    if base.endswith("/ask"):
+        base = base[: -len("/ask")]
+    return base + "/version"
+
+
+def new_session(pool_size: int = 8) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_kb_version(api_url: str, session: Optional[requests.Session] = None, timeout: float = 3) -> Optional[str]:
+    """后端当前的知识库版本；后端不可用或未提供版本时返回 None。"""
+    try:
+        resp = (session or requests).get(version_url(api_url), timeout=timeout)
+        resp.raise_for_status()
+        return resp.json().get("version")
+    except (requests.RequestException, ValueError):
+        return None
+
+
+class AnswerLRU:
+    """键通常为 (规范化问题, 知识库版本)；超过 max_entries 时淘汰最久未使用的条目。"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class BackendClient:
+    """前端共用的后端客户端：连接池会话、知识库版本（缓存 version_ttl 秒）与答案缓存。
+
+    答案按 (规范化问题, 知识库版本) 缓存，值为 (answer, sources, timing)；
+    cache_size / version_ttl 默认读取环境变量 RAG_UI_CACHE_SIZE（默认 256）/ RAG_UI_VERSION_TTL（秒，默认 30）。
+    """
+
+    def __init__(self, api_url: str, cache_size: Optional[int] = None, version_ttl: Optional[float] = None):
+        self.api_url = api_url
+        self.session = new_session()
+        self.answers = AnswerLRU(cache_size if cache_size is not None else int(os.environ.get("RAG_UI_CACHE_SIZE", 256)))
+        self.version_ttl = version_ttl if version_ttl is not None else float(os.environ.get("RAG_UI_VERSION_TTL", 30))
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._version_at: Optional[float] = None
+
+    def kb_version(self) -> Optional[str]:
+        """后端当前的知识库版本，version_ttl 秒内复用上次的结果（取不到时同样缓存，避免后端不可用时每次都等超时）。"""
+        with self._lock:
+            if self._version_at is not None and time.monotonic() - self._version_at < self.version_ttl:
+                return self._version
+        version = fetch_kb_version(self.api_url, self.session)
+        with self._lock:
+            self._version, self._version_at = version, time.monotonic()
+        return version
+
+    def lookup(self, question: str) -> Tuple[Optional[Tuple[str, str]], Optional[Any]]:
+        """返回 (缓存键, 缓存的回答或 None)。取不到知识库版本时缓存键为 None，不使用缓存，
+        避免知识库重建后仍返回旧答案。"""
+        version = self.kb_version()
+        if version is None:
+            return None, None
+        key = (normalize_query(question), version)
+        return key, self.answers.get(key)
+
+    def store(self, key: Optional[Tuple[str, str]], answer: str, sources: Any, timing: Any) -> None:
+        """按 lookup() 返回的键写入回答；只缓存正常结束（收到 done 事件）的回答，后端出错时下次重新请求。"""
+        if key is not None and timing:
+            self.answers.put(key, (answer, sources, timing))
+
+    def stream(self, question: str, timeout: float = 60) -> Iterator[Tuple[str, Any]]:
+        return stream_answer(self.api_url, question, timeout=timeout, session=self.session)
+
+
+def iter_sse(resp: requests.Response) -> Iterator[Tuple[str, Any]]:
+    event, data = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            # 空行表示一个事件结束
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+    if data:
+        yield event, json.loads("\n".join(data))
+
+
+def stream_answer(
+    api_url: str, question: str, timeout: float = 60, session: Optional[requests.Session] = None
+) -> Iterator[Tuple[str, Any]]:
+    """调用 /ask/stream，产出 ("sources", [...])、("token", "...")、("done", {...}) 或 ("error", {...})。
+
+    传入 session 时复用其连接池。
+    """
+    post = (session or requests).post
+    with post(stream_url(api_url), json={"question": question}, stream=True, timeout=timeout) as resp:
+        resp.raise_for_status()
+        resp.encoding = "utf-8"
+        yield from iter_sse(resp)
@@ -0,0 +1,204 @@
+"""
+rag_metrics.py
+
+RAG 流水线的延迟与计数指标，输出 Prometheus 文本格式（main.py 的 GET /metrics），不依赖 prometheus_client：
+- rag_stage_seconds{stage}：各阶段耗时直方图（embed 查询嵌入、lexical BM25、vector_search 向量检索、
+  extract 抽取式回答、context 上下文拼装、llm 生成）
+- rag_request_seconds{endpoint}：端到端耗时直方图（ask / stream / batch），rag_ttft_seconds：流式首 token 时间
+- rag_errors_total{stage}、rag_request_errors_total{endpoint}：各阶段与各接口的失败次数
+- rag_empty_retrievals_total：检索结果为空的问题数
+- rag_llm_tokens_total{kind}：prompt / completion token 数（接口未返回用量时按 token_utils 估算）
+- 缓存命中、请求合并、上下文打包节省的 token 数、各回答方式次数（rag_answers_total{mode}）与
+  LLM 跳过率（rag_llm_skip_ratio）、各 LLM 提供方的请求/失败/胜出/对冲次数（rag_provider_*{provider}）
+  在导出时从 RAGChain.stats() 读取
+
+keep_samples() 后还会保留每次观测的原始耗时（benchmark.py 据此计算精确分位数）。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: Sequence[Tuple[str, Any]]) -> str:
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _num(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_labels(list(zip(self.labelnames, key)))} {_num(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # 标签 -> [各桶计数（非累计）, 总和, 总数]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            i = 0
+            while i < len(self.buckets) and value > self.buckets[i]:
+                i += 1
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._series.items())
+        for key, (counts, total, count) in items:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for le, c in zip([*self.buckets, "+Inf"], counts):
+                cumulative += c
+                le = le if le == "+Inf" else _num(float(le))
+                lines.append(f"{self.name}_bucket{_labels(pairs + [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(pairs)} {_num(total)}")
+            lines.append(f"{self.name}_count{_labels(pairs)} {count}")
+        return lines
+
+
+class RAGMetrics:
+    def __init__(self):
+        self.stage_seconds = Histogram("rag_stage_seconds", "RAG 各阶段耗时（秒）", ["stage"])
+        self.request_seconds = Histogram("rag_request_seconds", "端到端耗时（秒）", ["endpoint"])
+        self.ttft_seconds = Histogram("rag_ttft_seconds", "流式回答首 token 时间（秒）")
+        self.errors = Counter("rag_errors_total", "各阶段失败次数", ["stage"])
+        self.request_errors = Counter("rag_request_errors_total", "各接口失败次数", ["endpoint"])
+        self.empty_retrievals = Counter("rag_empty_retrievals_total", "检索结果为空的问题数")
+        self.llm_tokens = Counter("rag_llm_tokens_total", "LLM token 数", ["kind"])
+        self.samples: Optional[Dict[str, List[float]]] = None
+        self._samples_lock = threading.Lock()
+
+    def keep_samples(self) -> None:
+        """开始保留原始观测值，键为 stage 名、"request:<endpoint>" 或 "ttft"。"""
+        self.samples = {}
+
+    def _sample(self, name: str, value: float) -> None:
+        if self.samples is not None:
+            with self._samples_lock:
+                self.samples.setdefault(name, []).append(value)
+
+    def observe_ttft(self, seconds: float) -> None:
+        self.ttft_seconds.observe(seconds)
+        self._sample("ttft", seconds)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """记录一个阶段的耗时；抛出异常时同时计入 rag_errors_total。"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors.inc(stage=name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stage_seconds.observe(elapsed, stage=name)
+            self._sample(name, elapsed)
+
+    @contextmanager
+    def request(self, endpoint: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.request_errors.inc(endpoint=endpoint)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.request_seconds.observe(elapsed, endpoint=endpoint)
+            self._sample(f"request:{endpoint}", elapsed)
+
+    def render(self, stats: Optional[Dict[str, Any]] = None) -> str:
+        """导出全部指标；stats 为 RAGChain.stats()，其中的累计计数一并导出。"""
+        lines: List[str] = []
+        for metric in (self.stage_seconds, self.request_seconds, self.ttft_seconds,
+                       self.errors, self.request_errors, self.empty_retrievals, self.llm_tokens):
+            lines.extend(metric.render())
+        if stats:
+            lines.extend(_stats_lines(stats))
+        return "\n".join(lines) + "\n"
+
+
+def _counter_lines(name: str, help: str, samples: Sequence[Tuple[Sequence[Tuple[str, Any]], float]]) -> List[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+    lines.extend(f"{name}{_labels(pairs)} {_num(value)}" for pairs, value in samples)
+    return lines
+
+
+def _stats_lines(stats: Dict[str, Any]) -> List[str]:
+    lines: List[str] = []
+    retrieval = stats.get("retrieval", {})
+    lines += _counter_lines("rag_retrieval_path_total", "各检索路径处理的问题数",
+                            [([("path", path)], n) for path, n in sorted(retrieval.items())])
+    answer = stats.get("answer_cache", {})
+    lines += _counter_lines("rag_answer_cache_hits_total", "答案缓存命中次数",
+                            [([("tier", "exact")], answer.get("exact_hits", 0)),
+                             ([("tier", "semantic")], answer.get("semantic_hits", 0))])
+    lines += _counter_lines("rag_answer_cache_misses_total", "答案缓存未命中次数", [([], answer.get("misses", 0))])
+    query = stats.get("query_embedding_cache", {})
+    lines += _counter_lines("rag_query_embedding_cache_hits_total", "查询向量缓存命中次数", [([], query.get("hits", 0))])
+    lines += _counter_lines("rag_query_embedding_cache_misses_total", "查询向量缓存未命中次数", [([], query.get("misses", 0))])
+    flight = stats.get("single_flight", {})
+    lines += _counter_lines("rag_coalesced_requests_total", "合并到进行中请求的次数", [([], flight.get("coalesced", 0))])
+    context = stats.get("context", {})
+    lines += _counter_lines("rag_context_tokens_saved_total", "上下文合并相邻块、去掉重叠节省的 prompt token 数", [([], context.get("tokens_saved", 0))])
+    lines += _counter_lines("rag_context_tokens_truncated_total", "上下文超出 token 预算被截掉的 token 数", [([], context.get("tokens_truncated", 0))])
+    lines += _counter_lines("rag_context_chunks_merged_total", "上下文打包时合并的相邻文本块数", [([], context.get("chunks_merged", 0))])
+    lines += _counter_lines("rag_context_truncated_total", "上下文超出 token 预算被截断的次数", [([], context.get("truncated", 0))])
+    modes = stats.get("answer_mode", {})
+    lines += _counter_lines("rag_answers_total", "各回答方式的次数（不含缓存命中）",
+                            [([("mode", mode)], modes.get(mode, 0)) for mode in ("extractive", "llm", "no_answer")])
+    lines += [
+        "# HELP rag_llm_skip_ratio 有检索结果的回答中直接摘自原文、未调用 LLM 的比例",
+        "# TYPE rag_llm_skip_ratio gauge",
+        f"rag_llm_skip_ratio {_num(float(modes.get('llm_skip_rate', 0.0)))}",
+    ]
+    providers = sorted(stats.get("providers", {}).get("providers", {}).items())
+    for key, help in (("requests", "各 LLM 提供方的请求数（含对冲请求）"), ("errors", "各 LLM 提供方的失败次数"),
+                      ("wins", "各 LLM 提供方给出最终结果的次数"), ("hedges", "发给该提供方的对冲请求数"),
+                      ("hedge_wins", "对冲请求先于首选返回的次数")):
+        lines += _counter_lines(f"rag_provider_{key}_total", help,
+                                [([("provider", name)], p.get(key, 0)) for name, p in providers])
+    return lines
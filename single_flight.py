@@ -0,0 +1,100 @@
+"""
+single_flight.py
+
+请求合并（single-flight）：同一个键（规范化后的问题）同时只执行一次，
+执行期间到达的相同请求直接等待这一次的结果，不再各自检索、各自调用 LLM。
+
+共享的执行以独立任务运行，某个等待方断开（被取消）不会取消其他等待方正在等的结果。
+stream() 是流式版本：领头方的输出逐项转发给每个订阅方各自的队列，中途加入的订阅方先重放已产出的部分。
+"""
+import asyncio
+import copy
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple
+
+
+class _Broadcast:
+    """一次共享的流式执行：已产出的项目留作重放，并推送到每个订阅方的队列。"""
+
+    def __init__(self):
+        self.items: List[Tuple[str, Any]] = []
+        self.queues: List[asyncio.Queue] = []
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in self.items:
+            queue.put_nowait(item)
+        self.queues.append(queue)
+        return queue
+
+    def publish(self, kind: str, value: Any = None) -> None:
+        item = (kind, value)
+        self.items.append(item)
+        for queue in self.queues:
+            queue.put_nowait(item)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    def _done(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # 避免所有等待方都已离开时出现未取回异常的警告
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 fn()，或等待同键正在执行的那一次；异常同样传给所有等待方。"""
+        task = self._inflight.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._done(key, t))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        result = await asyncio.shield(task)
+        # 合并进来的请求拿副本，避免调用方互相修改同一个结果
+        return result if leader else copy.deepcopy(result)
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """逐项产出 fn() 的输出，或订阅同键正在进行的那一次；异常同样传给所有订阅方。"""
+        broadcast = self._streams.get(key)
+        leader = broadcast is None
+        if leader:
+            broadcast = self._streams[key] = _Broadcast()
+            asyncio.ensure_future(self._pump(key, broadcast, fn))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        queue = broadcast.subscribe()
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == "end":
+                    return
+                if kind == "error":
+                    raise value
+                yield value if leader else copy.deepcopy(value)
+        finally:
+            broadcast.queues.remove(queue)
+
+    async def _pump(self, key: str, broadcast: _Broadcast, fn: Callable[[], AsyncIterator[Any]]) -> None:
+        # 独立任务：订阅方全部断开也执行到底（结果会写入答案缓存）
+        try:
+            async for item in fn():
+                broadcast.publish("item", item)
+            broadcast.publish("end")
+        except BaseException as e:
+            broadcast.publish("error", e)
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+
+    def __len__(self) -> int:
+        return len(self._inflight) + len(self._streams)
@@ -0,0 +1,74 @@
+"""answer_cache：精确/近似命中、阈值、TTL、容量淘汰与版本失效。"""
+import answer_cache
+from answer_cache import AnswerCache
+
+RESULT = {"answer": "图书馆 8:00-22:00 开放", "source_documents": [], "mode": "llm"}
+
+
+def never_called():
+    raise AssertionError("不应计算查询向量")
+
+
+def test_exact_hit_returns_copy_without_embedding():
+    cache = AnswerCache(max_entries=10, similarity_threshold=0.9)
+    cache.put("图书馆几点开门", RESULT, [1.0, 0.0])
+    hit = cache.get("图书馆几点开门", never_called)
+    assert hit["answer"] == RESULT["answer"] and hit["cache"] == "exact"
+    hit["answer"] = "被调用方修改"
+    assert cache.get("图书馆几点开门")["answer"] == RESULT["answer"]
+    assert cache.stats["exact_hits"] == 2
+
+
+def test_semantic_hit_above_threshold_and_miss_below():
+    cache = AnswerCache(max_entries=10, similarity_threshold=0.9)
+    cache.put("图书馆几点开门", RESULT, [1.0, 0.0])
+    # 余弦相似度约 0.995
+    hit = cache.get("图书馆什么时候开门", lambda: [1.0, 0.1])
+    assert hit is not None and hit["cache"] == "semantic"
+    # 余弦相似度约 0.707，低于阈值
+    assert cache.get("食堂几点开门", lambda: [1.0, 1.0]) is None
+    assert cache.stats["semantic_hits"] == 1 and cache.stats["misses"] == 1
+
+
+def test_no_embedding_when_no_entry_has_vector():
+    cache = AnswerCache(max_entries=10, similarity_threshold=0.9)
+    cache.put("图书馆几点开门", RESULT)
+    assert cache.get("食堂几点开门", never_called) is None
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = AnswerCache(max_entries=10, ttl_seconds=60)
+    cache.put("图书馆几点开门", RESULT)
+    now[0] += 59
+    assert cache.get("图书馆几点开门") is not None
+    now[0] += 2
+    assert cache.get("图书馆几点开门") is None
+
+
+def test_capacity_evicts_least_recently_used():
+    cache = AnswerCache(max_entries=2)
+    cache.put("a", RESULT)
+    cache.put("b", RESULT)
+    assert cache.get("a") is not None  # a 变为最近使用
+    cache.put("c", RESULT)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_version_change_flushes_cache():
+    version = ["v1"]
+    cache = AnswerCache(max_entries=10, version_fn=lambda: version[0])
+    cache.put("图书馆几点开门", RESULT, [1.0, 0.0])
+    assert cache.get("图书馆几点开门") is not None
+    version[0] = "v2"
+    assert cache.get("图书馆几点开门") is None
+    assert cache.get("图书馆什么时候开门", never_called) is None
+    assert cache.stats["invalidations"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = AnswerCache(max_entries=0)
+    cache.put("图书馆几点开门", RESULT)
+    assert cache.get("图书馆几点开门") is None
@@ -0,0 +1,47 @@
+"""bm25_index：增量 remove()/add() 与全量构建结果一致，保存的文件不含文本。"""
+import json
+
+from bm25_index import BM25Index
+
+DOCS = [
+    (f"doc{i}", text, {"source": "a.txt", "chunk": i})
+    for i, text in enumerate([
+        "图书馆开放时间为每天 8:00 至 22:00",
+        "国家奖学金每年九月开始申请",
+        "宿舍每晚 23:00 熄灯",
+        "食堂提供早餐、午餐和晚餐",
+    ])
+]
+QUERIES = ["图书馆几点开门", "奖学金申请", "宿舍熄灯时间", "食堂晚餐"]
+
+
+def ranking(index, query):
+    return [(index.ids[doc], round(score, 6)) for doc, score in index.search(query, k=10)]
+
+
+def test_incremental_update_matches_full_build():
+    changed = ("doc1", "国家励志奖学金每年十月申请", {"source": "a.txt", "chunk": 1})
+    added = ("doc4", "校医院周末照常开放", {"source": "b.txt", "chunk": 0})
+    index = BM25Index.build(DOCS)
+    assert index.remove(["doc1", "doc2"]) == 2
+    assert index.add([changed, added]) == 2
+
+    expected = BM25Index.build([DOCS[0], DOCS[3], changed, added])
+    assert sorted(index.ids) == sorted(expected.ids)
+    for query in QUERIES + ["励志奖学金", "校医院"]:
+        assert sorted(ranking(index, query)) == sorted(ranking(expected, query))
+    # 倒排表仍按文档号有序（confidence 依赖二分查找）
+    assert all(plist == sorted(plist) for plist in index.postings.values())
+    assert index.confidence("校医院", index.search("校医院")) == 1.0
+
+
+def test_saved_index_has_no_texts(tmp_path):
+    path = str(tmp_path / "bm25_index.json")
+    BM25Index.build(DOCS).save(path, header={"kb_version": "v1"})
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        data = json.load(f)
+    assert header == {"kb_version": "v1"} and "texts" not in data
+    loaded = BM25Index.load(path)
+    assert ranking(loaded, "图书馆") == ranking(BM25Index.build(DOCS), "图书馆")
+    assert loaded.metadata(0) == {"source": "a.txt", "chunk": 0}
@@ -0,0 +1,38 @@
+"""embedding_cache：命中不写库、最近使用时间批量写回、按间隔做 LRU 淘汰。"""
+from embedding_cache import EmbeddingCache
+
+
+def vectors(*names):
+    return {name: [float(i), 1.0] for i, name in enumerate(names)}
+
+
+def test_hits_do_not_write_until_next_put(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=100)
+    cache.put_many("m", 2, vectors("a", "b"))
+    changes = cache._conn.total_changes
+    assert set(cache.get_many("m", 2, ["a", "b", "c"])) == {"a", "b"}
+    assert cache._conn.total_changes == changes
+    cache.flush()
+    assert cache._conn.total_changes == changes + 2
+
+
+def test_lru_eviction_keeps_recently_hit_entries(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=3)
+    assert cache.evict_every == 1
+    cache.put_many("m", 2, vectors("a", "b", "c"))
+    cache.get_many("m", 2, ["a"])  # a 最近使用，只记在内存中
+    cache.put_many("m", 2, vectors("d"))
+    assert len(cache) == 3
+    assert set(cache.get_many("m", 2, ["a", "b", "c", "d"])) == {"a", "c", "d"}
+
+
+def test_eviction_runs_every_n_inserts(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=1000)
+    assert cache.evict_every == 10
+    cache.max_entries = 5
+    cache.put_many("m", 2, vectors(*"abcdef"))  # 第一次写入即检查
+    assert len(cache) == 5
+    cache.put_many("m", 2, {"g": [0.0, 1.0]})
+    assert len(cache) == 6  # 未到检查间隔，暂时超出容量
+    cache.put_many("m", 2, {f"x{i}": [0.0, 1.0] for i in range(9)})
+    assert len(cache) == 5
@@ -0,0 +1,59 @@
+"""keyword_engine：重叠关键词的打分排序、按名称查找与过期索引的重新编译。"""
+import json
+import os
+
+from keyword_engine import KeywordAutomaton, keyword_index_path, load_keyword_engine
+
+INTENTS = [
+    {"name": "library", "keywords": ["图书馆"], "answer": "图书馆 8:00-22:00 开放"},
+    {"name": "library_borrow", "keywords": ["图书馆借书", "借书"], "answer": "每人最多借 10 本"},
+    {"name": "scholarship", "keywords": ["奖学金", "国家奖学金"], "answer": "国家奖学金每年 9 月申请"},
+]
+
+
+def test_overlapping_keywords_rank_more_specific_intent_first():
+    ac = KeywordAutomaton.build(INTENTS)
+    matches = ac.match("图书馆借书要带什么")
+    # 「图书馆借书」与「借书」都命中 library_borrow（5 + 2），「图书馆」命中 library（3）
+    assert [(name, score) for name, score, _ in matches] == [("library_borrow", 7.0), ("library", 3.0)]
+    assert sorted(matches[0][2]) == ["借书", "图书馆借书"]
+    assert ac.answer("图书馆借书要带什么") == "每人最多借 10 本"
+    assert ac.match("国家奖学金")[0][:2] == ("scholarship", 8.0)
+
+
+def test_ties_keep_intent_order_and_no_match_returns_none():
+    ac = KeywordAutomaton.build([
+        {"name": "a", "keywords": ["食堂"], "answer": "A"},
+        {"name": "b", "keywords": ["宿舍"], "answer": "B"},
+    ])
+    assert [name for name, _, _ in ac.match("宿舍和食堂")] == ["a", "b"]
+    assert ac.answer("操场") is None
+
+
+def test_intent_lookup_by_name_survives_save_and_load(tmp_path):
+    path = str(tmp_path / "keyword_index.json")
+    KeywordAutomaton.build(INTENTS).save(path, header={"signature": "x"})
+    ac = KeywordAutomaton.load(path)
+    assert ac.intent("scholarship")["answer"] == "国家奖学金每年 9 月申请"
+    assert ac.answer("图书馆") == "图书馆 8:00-22:00 开放"
+
+
+def test_load_rebuilds_when_source_changed(tmp_path):
+    source_dir, persist_dir = tmp_path / "source", tmp_path / "db"
+    source_dir.mkdir()
+    persist_dir.mkdir()
+    intents_file = source_dir / "intents.json"
+
+    def write_intents(answer):
+        intents_file.write_text(
+            json.dumps({"library": {"keywords": ["图书馆"], "answer": answer}}, ensure_ascii=False), encoding="utf-8"
+        )
+
+    write_intents("旧答案")
+    assert load_keyword_engine(str(persist_dir), str(source_dir)).answer("图书馆") == "旧答案"
+    assert os.path.exists(keyword_index_path(str(persist_dir)))
+
+    write_intents("新答案")
+    assert load_keyword_engine(str(persist_dir), str(source_dir)).answer("图书馆") == "新答案"
+    # 重新编译的结果已写回，下次直接加载
+    assert KeywordAutomaton.load(keyword_index_path(str(persist_dir))).answer("图书馆") == "新答案"
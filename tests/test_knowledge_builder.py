@@ -0,0 +1,104 @@
+"""knowledge_builder 增量构建的回归测试（本地嵌入，无需网络）。"""
+import os
+
+import pytest
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import knowledge_builder
+from embedding_backends import LocalHashEmbeddings
+from kb_manifest import load_manifest
+from langchain.vectorstores import Chroma
+
+
+def _write_sources(source_dir):
+    os.makedirs(source_dir)
+    for name in ("a", "b", "c"):
+        paragraphs = [f"{name} 文件第 {i} 段：图书馆、宿舍与奖学金的相关说明，内容编号 {name}{i}。" for i in range(6)]
+        with open(os.path.join(source_dir, f"{name}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(paragraphs))
+
+
+def _build(source_dir, persist_dir, **kwargs):
+    return knowledge_builder.build_knowledge_base(
+        source_dir=source_dir,
+        persist_dir=persist_dir,
+        chunk_size=60,
+        chunk_overlap=0,
+        upsert_batch_size=4,
+        embedding_backend="local",
+        **kwargs,
+    )
+
+
+def _collection_count(persist_dir):
+    chroma = Chroma(
+        persist_directory=persist_dir,
+        embedding_function=LocalHashEmbeddings.load(persist_dir),
+        collection_name="campus",
+    )
+    return chroma._collection.count()
+
+
+def test_interrupted_force_rebuild_then_normal_rerun(tmp_path, monkeypatch):
+    source_dir, persist_dir = str(tmp_path / "source"), str(tmp_path / "db")
+    _write_sources(source_dir)
+    _build(source_dir, persist_dir)
+    total = sum(len(f["chunks"]) for f in load_manifest(persist_dir)["files"].values())
+    assert _collection_count(persist_dir) == total
+
+    # 强制重建写入第一批后中断
+    original_write = knowledge_builder._ChunkBatchWriter._write
+    calls = []
+
+    def interrupted_write(self, batch):
+        if calls:
+            raise KeyboardInterrupt
+        calls.append(len(batch))
+        original_write(self, batch)
+
+    monkeypatch.setattr(knowledge_builder._ChunkBatchWriter, "_write", interrupted_write)
+    with pytest.raises(KeyboardInterrupt):
+        _build(source_dir, persist_dir, force=True)
+    monkeypatch.setattr(knowledge_builder._ChunkBatchWriter, "_write", original_write)
+
+    # 再次普通运行：必须补齐中断时未写入的文本块，而不是按旧清单全部视为未变
+    stats = _build(source_dir, persist_dir)
+    assert stats["unchanged"] < total
+    assert _collection_count(persist_dir) == total
+    assert sum(len(f["chunks"]) for f in load_manifest(persist_dir)["files"].values()) == total
+
+
+def test_incremental_build_updates_bm25_index_in_place(tmp_path, monkeypatch, capsys):
+    from bm25_index import BM25Index, bm25_index_path
+    from rag_chain_clean import RAGChain
+
+    source_dir, persist_dir = str(tmp_path / "source"), str(tmp_path / "db")
+    _write_sources(source_dir)
+    _build(source_dir, persist_dir)
+    with open(os.path.join(source_dir, "b.txt"), "w", encoding="utf-8") as f:
+        f.write("b 文件改写后只剩一段：校医院周末照常开放，急诊全天。")
+    os.remove(os.path.join(source_dir, "c.txt"))
+
+    def no_full_export(*args, **kwargs):
+        raise AssertionError("增量构建不应全量导出 BM25 索引")
+
+    capsys.readouterr()
+    monkeypatch.setattr(knowledge_builder, "export_bm25_index", no_full_export)
+    _build(source_dir, persist_dir)
+    assert "已增量更新 BM25 倒排索引" in capsys.readouterr().out
+
+    path = bm25_index_path(persist_dir)
+    index = BM25Index.load(path)
+    chroma = Chroma(
+        persist_directory=persist_dir,
+        embedding_function=LocalHashEmbeddings.load(persist_dir),
+        collection_name="campus",
+    )
+    assert sorted(index.ids) == sorted(chroma.get()["ids"])
+    assert BM25Index.read_header(path)["kb_version"] == load_manifest(persist_dir)["version"]
+
+    # 检索结果的文本从向量库按 ID 取回
+    rag = RAGChain(persist_dir=persist_dir, embedding_backend="local")
+    docs = rag.retrieve("校医院周末开放吗")
+    assert docs and "校医院" in docs[0].page_content
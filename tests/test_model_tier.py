@@ -0,0 +1,68 @@
+"""model_tier 的档位选择与提供方顺序。"""
+import pytest
+
+from model_tier import FALLBACK_PROVIDER, choose_tier, stream_with_fallback, tier_providers
+
+
+class FakeProviders:
+    """OpenAI 总是更快（且从不出错）的模拟提供方，记录每次实际调用的提供方。"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+
+    def open_stream(self, name):
+        self.calls.append(name)
+        if name in self.failing:
+            raise ConnectionError(f"{name} 不可用")
+        yield f"[{name}]"
+
+
+def test_pinned_model_is_always_served_by_that_model():
+    fake = FakeProviders()
+    providers = tier_providers("qwen-max", pinned=True, dashscope=True, fallback=True)
+    assert providers == ("dashscope/qwen-max",)
+    answers = {"".join(stream_with_fallback(providers, fake.open_stream)) for _ in range(50)}
+    assert answers == {"[dashscope/qwen-max]"}
+    assert set(fake.calls) == {"dashscope/qwen-max"}
+
+
+def test_pinned_model_error_is_not_answered_by_fallback():
+    fake = FakeProviders(failing={"dashscope/qwen-max"})
+    providers = tier_providers("qwen-max", pinned=True, dashscope=True, fallback=True)
+    with pytest.raises(ConnectionError):
+        "".join(stream_with_fallback(providers, fake.open_stream))
+    assert FALLBACK_PROVIDER not in fake.calls
+
+
+def test_auto_tier_uses_fallback_only_on_error():
+    providers = tier_providers("qwen-plus", pinned=False, dashscope=True, fallback=True)
+    fake = FakeProviders()
+    for _ in range(20):
+        assert "".join(stream_with_fallback(providers, fake.open_stream)) == "[dashscope/qwen-plus]"
+    assert FALLBACK_PROVIDER not in fake.calls
+
+    errors = []
+    fake = FakeProviders(failing={"dashscope/qwen-plus"})
+    answer = "".join(stream_with_fallback(providers, fake.open_stream, lambda name, e: errors.append(name)))
+    assert answer == f"[{FALLBACK_PROVIDER}]"
+    assert errors == ["dashscope/qwen-plus"]
+
+
+def test_error_after_partial_output_is_not_retried():
+    calls = []
+
+    def open_stream(name):
+        calls.append(name)
+        yield "部分"
+        raise ConnectionError("中断")
+
+    with pytest.raises(ConnectionError):
+        list(stream_with_fallback(("dashscope/qwen-turbo", FALLBACK_PROVIDER), open_stream))
+    assert calls == ["dashscope/qwen-turbo"]
+
+
+def test_choose_tier_escalates_long_and_multi_part_questions():
+    assert choose_tier("宿舍", [("dormitory", 2.0, ["宿舍"])])["tier"] is None
+    assert choose_tier("校医院电话是多少", [])["tier"] == "qwen-plus"
+    assert choose_tier("食堂几点开门？以及宿舍怎么报修？还有奖学金怎么评？", [])["tier"] == "qwen-max"
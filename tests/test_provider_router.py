@@ -0,0 +1,174 @@
+"""provider_router 的排序、对冲、失败切换与统计。"""
+import asyncio
+import time
+
+import pytest
+
+from provider_router import ProviderRouter
+
+
+def warm_up(router, latencies, n=5):
+    """先让各提供方积累 n 个样本（rank 对样本不足的提供方按配置顺序排在前面）。"""
+    for name, seconds in latencies.items():
+        for _ in range(n):
+            router._started(name, False)
+            router._succeeded(name, "call", seconds, False)
+            router._started(name, False)
+            router._succeeded(name, "first_token", seconds, False)
+
+
+def test_rank_prefers_fastest_provider():
+    router = ProviderRouter(["slow", "fast"])
+    warm_up(router, {"slow": 0.2, "fast": 0.01})
+    assert router.rank() == ["fast", "slow"]
+
+
+def test_run_hedges_when_primary_exceeds_p95():
+    router = ProviderRouter(["a", "b"])
+    warm_up(router, {"a": 0.01, "b": 0.02})
+    called = []
+
+    def call(name):
+        called.append(name)
+        time.sleep(0.5 if name == "a" else 0.01)
+        return name
+
+    assert router.run(call) == "b"
+    assert called == ["a", "b"]
+    stats = router.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+    assert stats["providers"]["b"]["hedges"] == 1 and stats["providers"]["b"]["hedge_wins"] == 1
+
+
+def test_run_fails_over_when_primary_raises():
+    router = ProviderRouter(["a", "b"])
+
+    def call(name):
+        if name == "a":
+            raise ConnectionError("a down")
+        return name
+
+    assert router.run(call) == "b"
+    stats = router.stats()["providers"]
+    assert stats["a"]["errors"] == 1 and stats["a"]["wins"] == 0
+    assert stats["b"]["wins"] == 1 and stats["b"]["hedges"] == 0
+
+
+def test_run_raises_when_all_providers_fail():
+    router = ProviderRouter(["a", "b"])
+
+    def call(name):
+        raise ConnectionError(name)
+
+    with pytest.raises(ConnectionError):
+        router.run(call)
+    assert router.stats()["providers"]["b"]["errors"] == 1
+
+
+def test_wins_and_request_accounting_without_hedge():
+    router = ProviderRouter(["a", "b"], hedge=False)
+    warm_up(router, {"a": 0.01, "b": 0.02})
+    before = router.stats()["providers"]
+    for _ in range(10):
+        assert router.run(lambda name: name) == "a"
+    stats = router.stats()
+    assert stats["providers"]["a"]["requests"] - before["a"]["requests"] == 10
+    assert stats["providers"]["a"]["wins"] - before["a"]["wins"] == 10
+    assert stats["providers"]["b"]["requests"] == before["b"]["requests"]
+    assert stats["hedges"] == 0 and stats["hedge_rate"] == 0.0
+
+
+def test_arun_hedges_and_fails_over():
+    router = ProviderRouter(["a", "b"])
+    warm_up(router, {"a": 0.01, "b": 0.02})
+
+    async def slow_primary(name):
+        await asyncio.sleep(0.5 if name == "a" else 0.01)
+        return name
+
+    assert asyncio.run(router.arun(slow_primary)) == "b"
+    assert router.stats()["hedge_wins"] == 1
+
+    async def failing_primary(name):
+        if name == "a":
+            raise ConnectionError("a down")
+        return name
+
+    assert asyncio.run(router.arun(failing_primary)) == "b"
+    assert router.stats()["providers"]["a"]["errors"] == 1
+
+
+class TrackedStream:
+    """记录是否被关闭的异步迭代器。"""
+
+    def __init__(self, name, delay, items=3, fail=False):
+        self.name, self.delay, self.items, self.fail = name, delay, items, fail
+        self.i = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.i == 0:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise ConnectionError(self.name)
+        if self.i >= self.items:
+            raise StopAsyncIteration
+        self.i += 1
+        return f"{self.name}{self.i}"
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_astream_picks_first_stream_to_yield_and_closes_loser():
+    router = ProviderRouter(["a", "b"])
+    warm_up(router, {"a": 0.01, "b": 0.02})
+    streams = {"a": TrackedStream("a", 0.5), "b": TrackedStream("b", 0.01)}
+
+    async def consume():
+        return [item async for item in router.astream(lambda name: streams[name])]
+
+    assert asyncio.run(consume()) == ["b1", "b2", "b3"]
+    assert streams["a"].closed
+    assert router.stats()["providers"]["b"]["hedge_wins"] == 1
+
+
+def test_astream_fails_over_when_primary_raises():
+    router = ProviderRouter(["a", "b"])
+    streams = {"a": TrackedStream("a", 0.0, fail=True), "b": TrackedStream("b", 0.0)}
+
+    async def consume():
+        return [item async for item in router.astream(lambda name: streams[name])]
+
+    assert asyncio.run(consume()) == ["b1", "b2", "b3"]
+    assert router.stats()["providers"]["a"]["errors"] == 1
+
+
+def test_astream_closes_winner_when_consumer_stops_early():
+    router = ProviderRouter(["a"])
+    stream = TrackedStream("a", 0.0, items=10)
+
+    async def consume():
+        agen = router.astream(lambda name: stream)
+        first = await agen.__anext__()
+        await agen.aclose()
+        return first
+
+    assert asyncio.run(consume()) == "a1"
+    assert stream.closed
+
+
+def test_stream_picks_first_stream_to_yield():
+    router = ProviderRouter(["a", "b"])
+    warm_up(router, {"a": 0.01, "b": 0.02})
+
+    def open_stream(name):
+        time.sleep(0.5 if name == "a" else 0.01)
+        for i in range(3):
+            yield f"{name}{i}"
+
+    assert list(router.stream(open_stream)) == ["b0", "b1", "b2"]
+    assert router.stats()["providers"]["b"]["hedge_wins"] == 1
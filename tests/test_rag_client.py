@@ -0,0 +1,58 @@
+"""rag_client：答案 LRU 与 BackendClient 的版本缓存、按版本查找与写入。"""
+import rag_client
+from rag_client import AnswerLRU, BackendClient
+
+
+def test_answer_lru_evicts_least_recently_used():
+    lru = AnswerLRU(2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1
+    lru.put("c", 3)
+    assert lru.get("b") is None and lru.get("a") == 1 and lru.get("c") == 3
+
+
+def test_backend_client_caches_by_normalized_question_and_version(monkeypatch):
+    versions = ["v1"]
+    fetches = []
+
+    def fake_fetch(api_url, session=None, timeout=3):
+        fetches.append(api_url)
+        return versions[0]
+
+    monkeypatch.setattr(rag_client, "fetch_kb_version", fake_fetch)
+    client = BackendClient("http://backend/ask", cache_size=8, version_ttl=0)
+
+    key, cached = client.lookup("图书馆几点开门？")
+    assert cached is None
+    client.store(key, "8:00 开门", [], {"total_ms": 10})
+    assert client.lookup("图书馆几点开门")[1] == ("8:00 开门", [], {"total_ms": 10})
+
+    # 知识库重建后版本变化，旧答案不再命中
+    versions[0] = "v2"
+    assert client.lookup("图书馆几点开门")[1] is None
+    assert len(fetches) == 3
+
+
+def test_backend_client_reuses_version_within_ttl_and_skips_cache_without_version(monkeypatch):
+    fetches = []
+
+    def fake_fetch(api_url, session=None, timeout=3):
+        fetches.append(api_url)
+        return None
+
+    monkeypatch.setattr(rag_client, "fetch_kb_version", fake_fetch)
+    client = BackendClient("http://backend/ask", cache_size=8, version_ttl=60)
+    key, cached = client.lookup("图书馆几点开门")
+    assert key is None and cached is None
+    client.store(key, "8:00 开门", [], {"total_ms": 10})
+    assert client.lookup("图书馆几点开门") == (None, None)
+    assert len(fetches) == 1
+
+
+def test_backend_client_does_not_cache_failed_answers(monkeypatch):
+    monkeypatch.setattr(rag_client, "fetch_kb_version", lambda api_url, session=None, timeout=3: "v1")
+    client = BackendClient("http://backend/ask", cache_size=8, version_ttl=60)
+    key, _ = client.lookup("图书馆几点开门")
+    client.store(key, "调用后端出错", [], {})
+    assert client.lookup("图书馆几点开门")[1] is None
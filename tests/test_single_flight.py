@@ -0,0 +1,136 @@
+"""single_flight 请求合并：aask 与 astream 同时到达的相同问题只调用一次 LLM（本地嵌入，无需网络）。"""
+import asyncio
+import os
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import pytest
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+import knowledge_builder
+from answer_cache import AnswerCache
+from rag_chain_clean import RAGChain
+from single_flight import SingleFlight
+
+ANSWER = "图书馆周一至周日 8:00-22:00 开放。"
+llm_calls = []
+
+
+class SlowLLM(LLM):
+    """逐字输出、每次调用都记录下来的模拟 LLM。"""
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        llm_calls.append("call")
+        return ANSWER
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        llm_calls.append("call")
+        await asyncio.sleep(0.05)
+        return ANSWER
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        llm_calls.append("stream")
+        for ch in ANSWER:
+            await asyncio.sleep(0.005)
+            yield GenerationChunk(text=ch)
+
+
+@pytest.fixture(scope="module")
+def rag(tmp_path_factory):
+    root = tmp_path_factory.mktemp("kb")
+    source_dir, persist_dir = str(root / "source"), str(root / "db")
+    os.makedirs(source_dir)
+    with open(os.path.join(source_dir, "library.txt"), "w", encoding="utf-8") as f:
+        f.write("图书馆开放时间：周一至周日 8:00-22:00。\n\n借书需携带校园卡，每人最多借 10 本。")
+    knowledge_builder.build_knowledge_base(
+        source_dir=source_dir, persist_dir=persist_dir, chunk_size=60, chunk_overlap=0, embedding_backend="local",
+    )
+    return RAGChain(
+        persist_dir=persist_dir, embedding_backend="local", llm=SlowLLM(), extractive_threshold=2.0,
+        answer_cache=AnswerCache(max_entries=0),
+    )
+
+
+def test_concurrent_identical_asks_call_llm_once(rag):
+    llm_calls.clear()
+
+    async def run():
+        return await asyncio.gather(*(rag.aask("图书馆几点开门？") for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert llm_calls == ["call"]
+    assert all(r["answer"] == ANSWER for r in results)
+
+
+def test_concurrent_identical_streams_call_llm_once(rag):
+    llm_calls.clear()
+
+    async def consume():
+        events = [e async for e in rag.astream("图书馆几点开门？")]
+        return "".join(data for event, data in events if event == "token"), events
+
+    async def run():
+        return await asyncio.gather(*(consume() for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert llm_calls == ["stream"]
+    for answer, events in results:
+        assert answer == ANSWER
+        assert events[0][0] == "sources" and events[-1][0] == "done"
+        assert events[-1][1]["mode"] == "llm" and events[-1][1]["ttft_ms"] is not None
+
+
+def test_late_subscriber_replays_earlier_items_and_errors_propagate():
+    flight = SingleFlight()
+
+    async def produce():
+        for i in range(3):
+            yield i
+            await asyncio.sleep(0.01)
+
+    async def fail():
+        yield "a"
+        await asyncio.sleep(0.01)
+        raise ConnectionError("down")
+
+    async def collect(key, fn, delay=0.0):
+        await asyncio.sleep(delay)
+        return [item async for item in flight.stream(key, fn)]
+
+    async def run():
+        ok = await asyncio.gather(collect("k", produce), collect("k", produce, delay=0.015))
+        errors = await asyncio.gather(collect("e", fail), collect("e", fail), return_exceptions=True)
+        return ok, errors
+
+    ok, errors = asyncio.run(run())
+    assert ok == [[0, 1, 2], [0, 1, 2]]
+    assert all(isinstance(e, ConnectionError) for e in errors)
+    assert flight.stats == {"leaders": 2, "coalesced": 2}
+    assert len(flight) == 0
+
+
+def test_subscriber_disconnect_does_not_stop_others():
+    flight = SingleFlight()
+
+    async def produce():
+        for i in range(5):
+            await asyncio.sleep(0.005)
+            yield i
+
+    async def run():
+        early = flight.stream("k", produce)
+        first = await early.__anext__()
+        rest = asyncio.ensure_future(collect())
+        await early.aclose()
+        return first, await rest
+
+    async def collect():
+        return [item async for item in flight.stream("k", produce)]
+
+    first, rest = asyncio.run(run())
+    assert first == 0 and rest == [0, 1, 2, 3, 4]
@@ -0,0 +1,40 @@
+"""
+token_utils.py
+
+token 数估算：安装了 tiktoken 且编码文件可用时使用 cl100k_base 精确计数，
+否则按经验估算（中日韩字符约 1 token/字，其他字符约 4 字符/token）。
+tiktoken 首次使用需要下载编码文件，离线环境下加载失败会自动退回估算。
+"""
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 为可选依赖
+    tiktoken = None
+
+_encoding: Optional[object] = None
+_encoding_failed = False
+
+
+def _is_cjk(ch: str) -> bool:
+    return "\u3000" <= ch <= "\u9fff" or "\uf900" <= ch <= "\uffef"
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and tiktoken is not None and not _encoding_failed:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding_failed = True
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    return cjk + (len(text) - cjk + 3) // 4
@@ -4,7 +4,11 @@ web_app.py
 Streamlit 前端聊天界面：
 - 侧边栏显示标题与说明
 - 主界面展示对话历史，底部输入问题
-- 提交后调用后端 http://localhost:8000/ask 并展示回答与来源
+- 提交后调用后端 http://localhost:8000/ask/stream，先展示来源，再随生成逐字展示回答，
+  并分别显示首字时间与总耗时
+- 后端连接与答案缓存：每个进程一个 rag_client.BackendClient（st.cache_resource），复用 TCP 连接；
+  按「规范化问题 + 知识库版本」缓存完整回答（最多 RAG_UI_CACHE_SIZE 条，默认 256），
+  重复问题直接展示、不请求后端；知识库版本来自后端 /version（缓存 RAG_UI_VERSION_TTL 秒，默认 30），重建后自动失效
 
 运行：
     streamlit run web_app.py
@@ -12,27 +16,86 @@ Streamlit 前端聊天界面：
 注意：请先启动 FastAPI 后端（例如：uvicorn main:app --reload）并确保 OPENAI_API_KEY 已设置。
 """
 import os
-import requests
 import streamlit as st
 
+from rag_client import BackendClient
+
 
 API_URL = os.environ.get("RAG_API_URL", "http://localhost:8000/ask")
 
 
+@st.cache_resource
+def backend():
+    """整个进程共用：连接池会话、知识库版本与答案缓存"""
+    return BackendClient(API_URL)
+
+
 def init_state():
     if "history" not in st.session_state:
         st.session_state.history = []  # list of (role, text, optional sources)
 
 
-def post_question(question: str):
-    payload = {"question": question}
+def stream_question(question: str):
+    """流式调用后端，边收边渲染，返回 (answer, sources, timing)。"""
+    sources_box = st.container()
+    answer_box = st.empty()
+    pieces, sources, timing = [], [], {}
     try:
-        resp = requests.post(API_URL, json=payload, timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
-        return data
+        for event, data in backend().stream(question):
+            if event == "sources":
+                sources = data
+                with sources_box:
+                    render_sources(sources)
+            elif event == "token":
+                pieces.append(data)
+                answer_box.markdown("".join(pieces) + "▌")
+            elif event == "done":
+                timing = data
+            elif event == "error":
+                pieces.append(f"\n\n调用后端出错：{data.get('detail')}")
     except Exception as e:
-        return {"answer": f"调用后端出错：{e}", "source_documents": []}
+        pieces.append(f"调用后端出错：{e}")
+    answer = "".join(pieces)
+    answer_box.markdown(answer)
+    return answer, sources, timing
+
+
+def answer_question(question: str):
+    """重复问题直接展示缓存的回答，否则流式调用后端；返回 (answer, sources, timing)。"""
+    key, cached = backend().lookup(question)
+    if cached is not None:
+        answer, sources, timing = cached
+        render_sources(sources)
+        st.write(answer)
+        return answer, sources, {**timing, "cached": True}
+
+    answer, sources, timing = stream_question(question)
+    backend().store(key, answer, sources, timing)
+    return answer, sources, timing
+
+
+def format_timing(timing) -> str:
+    if not timing:
+        return ""
+    if timing.get("cached"):
+        text = "⚡ 来自缓存"
+    else:
+        text = f"首字 {timing.get('ttft_ms')} ms · 总耗时 {timing.get('total_ms')} ms"
+    # 抽取式回答直接摘自知识库原文，没有经过模型改写
+    if timing.get("mode") == "extractive":
+        text = "📄 摘自原文 · " + text
+    return text
+
+
+def render_sources(sources):
+    if not sources:
+        return
+    st.markdown("**引用来源：**")
+    for s in sources:
+        src = s.get("source")
+        # 仅展示前200字符的片段作为引用
+        snippet = (s.get("content") or "")[:200].replace("\n", " ")
+        st.markdown(f"- `{src}`: {snippet}...")
 
 
 def render_chat():
@@ -44,14 +107,10 @@ def render_chat():
             st.chat_message("user").write(text)
         else:
             with st.chat_message("assistant"):
+                render_sources(sources)
                 st.write(text)
-                if sources:
-                    st.markdown("**引用来源：**")
-                    for s in sources:
-                        src = s.get("source")
-                        snippet = s.get("content")
-                        # 仅展示前200字符的片段作为引用
-                        st.markdown(f"- `{src}`: {snippet[:200].replace('\n', ' ')}...")
+                if entry.get("timing"):
+                    st.caption(format_timing(entry["timing"]))
 
 
 def main():
@@ -76,14 +135,12 @@ def main():
     if question:
         # 添加用户消息
         st.session_state.history.append({"role": "user", "text": question})
-        # 调用后端
-        with st.spinner("正在查询知识库并生成答案..."):
-            result = post_question(question)
-
-        answer = result.get("answer")
-        sources = result.get("source_documents", [])
+        st.chat_message("user").write(question)
+        # 重复问题直接用缓存；否则流式调用后端：来源先到，回答逐字显示
+        with st.chat_message("assistant"):
+            answer, sources, timing = answer_question(question)
 
-        st.session_state.history.append({"role": "assistant", "text": answer, "sources": sources})
+        st.session_state.history.append({"role": "assistant", "text": answer, "sources": sources, "timing": timing})
 
         # 重新渲染（Streamlit 会自动更新页面）
         st.experimental_rerun()